@@ -14,7 +14,7 @@ from homeassistant.util import slugify
 from homeassistant.const import CONF_NAME, CONF_MAC, CONF_PORT, Platform
 from .const import CONF_DEVICE_TYPE, CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT, CONF_ESCAPE_PAYLOAD, DOMAIN, PLATFORMS  # pylint:disable=unused-import
 from .migration import async_rescan
-from .services import async_refresh_service_descriptions, async_setup_services
+from .services import async_refresh_service_descriptions, async_setup_services, async_stop_ticker
 
 _LOGGER = logging.getLogger(__package__)
 
@@ -81,7 +81,8 @@ async def async_unload_entry(hass: HomeAssistant, config: ConfigEntry) -> bool:
 
     loadedServices = domainConfig.get('loaded')
     if mac in loadedServices:
-        loadedServices[mac].disconnect()
+        async_stop_ticker(hass, loadedServices[mac])
+        await loadedServices[mac].async_disconnect(hass)
         del loadedServices[mac]
 
     hass.services.async_remove(SERVICE_NOTIFY, slugify(name))
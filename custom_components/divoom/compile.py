@@ -0,0 +1,147 @@
+"""Precompile the images of a media directory for every Divoom device type.
+
+show_image picks the frames up from the .divoom directory next to each image
+instead of decoding the image again, as long as the image did not change since.
+With --fonts, the pixel fonts are rasterized into glyph atlases instead, which
+show_text composes text from without FreeType.
+
+Usage: python -m custom_components.divoom.compile [MEDIA_DIRECTORY] [--device pixoo] [--jobs N] [--force]
+       python -m custom_components.divoom.compile --fonts [--font-size 8] [--device pixoo] [--force]
+"""
+import argparse
+import importlib
+import inspect
+import os
+import pkgutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import ImageFont
+
+from . import devices
+from .const import CONF_MEDIA_DIR_DEFAULT
+from .devices.assets import ASSET_DIRECTORY, ASSET_EXTENSIONS, asset_path, is_current, write_asset
+from .devices.divoom import Divoom
+from .devices.glyphs import ATLAS_FONTS, atlas_path, build_atlas, read_atlas, write_atlas
+
+FONT_DIRECTORY = os.path.join(os.path.dirname(__file__), "fonts")
+
+def device_classes():
+    """Every device class in devices/, by its device_type."""
+    classes = {}
+    for module_info in pkgutil.iter_modules(devices.__path__):
+        module = importlib.import_module(f"{devices.__name__}.{module_info.name}")
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, Divoom) and cls is not Divoom and cls.__module__ == module.__name__:
+                classes[module_info.name] = cls
+    return dict(sorted(classes.items()))
+
+def media_files(media_directory):
+    """Every image below the media directory, skipping the precompiled output itself."""
+    for root, directories, files in os.walk(media_directory):
+        directories[:] = sorted(name for name in directories if name != ASSET_DIRECTORY)
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in ASSET_EXTENSIONS:
+                yield os.path.join(root, name)
+
+def compile_file(source, device_class, force=False):
+    """Encode one image for one device class. Returns the written path, or None if it was still current."""
+    device = device_class(mac="00:00:00:00:00:00")
+    stat = os.stat(source)
+    target = asset_path(source, device.type)
+    if not force and is_current(target, stat):
+        return None
+
+    frames, framesCount = device.process_image(source)
+    write_asset(target, stat, frames, framesCount)
+    return target
+
+def compile_directory(media_directory, device_types=None, jobs=None, force=False):
+    """Encode every image of the media directory for the device types, spread over a process pool.
+    Returns the counts of compiled, unchanged and failed files."""
+    classes = device_classes()
+    if device_types is None: device_types = list(classes)
+    tasks = [(source, device_type) for source in media_files(media_directory) for device_type in device_types]
+
+    compiled = unchanged = failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [((source, device_type), executor.submit(compile_file, source, classes[device_type], force)) for source, device_type in tasks]
+        for (source, device_type), future in futures:
+            try:
+                target = future.result()
+            except Exception as error:
+                print(f"failed {source} for {device_type}: {error}", file=sys.stderr)
+                failed += 1
+                continue
+
+            if target is None:
+                unchanged += 1
+            else:
+                print(f"wrote {target}")
+                compiled += 1
+
+    return compiled, unchanged, failed
+
+def font_sizes(font, device_types=None, sizes=None):
+    """The sizes show_text loads the font in on the device types, for the default text size and the given ones"""
+    classes = device_classes()
+    if device_types is None: device_types = list(classes)
+    result = set()
+    for device_type in device_types:
+        device = classes[device_type](mac="00:00:00:00:00:00")
+        for size in [None] + list(sizes or []):
+            result.add(device.font_size(font, size)[0])
+    return sorted(result)
+
+def compile_fonts(font_directory=FONT_DIRECTORY, device_types=None, sizes=None, force=False):
+    """Rasterize the pixel fonts into a glyph atlas for every size show_text needs them in.
+    Returns the counts of compiled, unchanged and failed atlases."""
+    compiled = unchanged = failed = 0
+    for name in ATLAS_FONTS:
+        font = os.path.join(font_directory, name)
+        if not os.path.isfile(font): continue
+
+        for fontSize in font_sizes(font, device_types, sizes):
+            target = atlas_path(font, fontSize)
+            try:
+                stat = os.stat(font)
+                if not force and read_atlas(target, stat) is not None:
+                    unchanged += 1
+                    continue
+                write_atlas(target, stat, fontSize, build_atlas(ImageFont.truetype(font, fontSize)))
+            except OSError as error:
+                print(f"failed {font} in size {fontSize}: {error}", file=sys.stderr)
+                failed += 1
+                continue
+
+            print(f"wrote {target}")
+            compiled += 1
+
+    return compiled, unchanged, failed
+
+def main(argv=None):
+    types = device_classes()
+
+    parser = argparse.ArgumentParser(prog="python -m custom_components.divoom.compile", description=__doc__.splitlines()[0])
+    parser.add_argument("media_directory", nargs="?", default=CONF_MEDIA_DIR_DEFAULT, help="directory with the images, default: %(default)s")
+    parser.add_argument("--device", action="append", choices=list(types), help="only compile for this device type, can be repeated")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes, default: one per core")
+    parser.add_argument("--force", action="store_true", help="also rebuild images that did not change")
+    parser.add_argument("--fonts", action="store_true", help="compile the glyph atlases of the pixel fonts instead of the images")
+    parser.add_argument("--font-size", type=int, action="append", help="also compile the fonts for this text size, can be repeated")
+    args = parser.parse_args(argv)
+
+    if args.fonts:
+        compiled, unchanged, failed = compile_fonts(FONT_DIRECTORY, args.device, args.font_size, args.force)
+        print(f"{compiled} compiled, {unchanged} unchanged, {failed} failed")
+        return 1 if failed else 0
+
+    if not os.path.isdir(args.media_directory):
+        parser.error(f"media directory {args.media_directory} does not exist")
+
+    compiled, unchanged, failed = compile_directory(args.media_directory, args.device, args.jobs, args.force)
+    print(f"{compiled} compiled, {unchanged} unchanged, {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
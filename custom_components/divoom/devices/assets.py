@@ -0,0 +1,68 @@
+"""Provides reading and writing of precompiled frames, stored next to the images they were encoded from."""
+
+import os, struct
+
+ASSET_DIRECTORY = ".divoom"
+ASSET_EXTENSIONS = (".gif", ".png")
+ASSET_MAGIC = b"DIVF"
+ASSET_VERSION = 3 # bumped whenever the frames show_image encodes change, so older precompiled frames are rebuilt
+
+# magic, version, source mtime in ns, source size, frames count, number of frame entries
+HEADER = struct.Struct("<4sBQQHH")
+# the length make_frame reported and the number of bytes that follow
+ENTRY = struct.Struct("<II")
+
+def asset_path(file, deviceType):
+    """Where the precompiled frames of the file are stored for the device type"""
+    return os.path.join(os.path.dirname(file), ASSET_DIRECTORY, deviceType, os.path.basename(file) + ".bin")
+
+def write_asset(path, stat, frames, framesCount):
+    """Store the make_frame output for the source file described by stat"""
+    data = bytearray(HEADER.pack(ASSET_MAGIC, ASSET_VERSION, stat.st_mtime_ns, stat.st_size, framesCount, len(frames)))
+    for frame, length in frames:
+        data += ENTRY.pack(length, len(frame))
+        data += bytes(frame)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, path) # a running show_image never sees a half written file
+
+def read_asset(path, stat):
+    """Load the make_frame output stored for the source file described by stat.
+    Returns None if there is none or it was compiled from another version of the source."""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    if len(data) < HEADER.size: return None
+    magic, version, mtime, size, framesCount, entries = HEADER.unpack_from(data, 0)
+    if magic != ASSET_MAGIC or version != ASSET_VERSION: return None
+    if mtime != stat.st_mtime_ns or size != stat.st_size: return None
+
+    frames = []
+    position = HEADER.size
+    for _ in range(entries):
+        if position + ENTRY.size > len(data): return None
+        length, frameSize = ENTRY.unpack_from(data, position)
+        position += ENTRY.size
+        frames.append([data[position:position + frameSize], length])
+        position += frameSize
+    if position != len(data): return None
+
+    return [frames, framesCount]
+
+def is_current(path, stat):
+    """Whether the stored frames were compiled from exactly this version of the source"""
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return False
+
+    if len(header) < HEADER.size: return False
+    magic, version, mtime, size, _, _ = HEADER.unpack(header)
+    return magic == ASSET_MAGIC and version == ASSET_VERSION and mtime == stat.st_mtime_ns and size == stat.st_size
@@ -8,6 +8,7 @@ class Aurabox(Divoom):
         self.type = "Aurabox"
         self.screensize = 10
         self.chunksize = 182
+        self.maxframetime = 255 * 100 # the delay of a frame is a single byte in steps of 100ms
         self.colorpalette = [
             [  0,   0,   0],
             [255,   0,   0],
@@ -44,6 +45,10 @@ class Aurabox(Divoom):
             header += index.to_bytes(1, byteorder='little') # Pixoo-Max expects more
         return header + framePart
 
+    def measure_frame(self, colorCount, pixelCount, framesCount, needsFlags):
+        """The length make_frame reports for a frame that process_frame encodes from that many pixels"""
+        return (1 if framesCount > 1 else 0) + int((pixelCount + 1) / 2)
+
     def process_frame(self, pixels, colors, colorCount, framesCount, time, needsFlags):
         result = []
         if framesCount > 1:
@@ -109,9 +114,9 @@ class Aurabox(Divoom):
     def show_equalizer(self, number, audioMode=False, backgroundMode=False, streamMode=False):
         self.unsupported("the music equalizer mode")
 
-    def show_image(self, file, time=None):
+    def show_image(self, file, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
         """Show image or animation on the Divoom device"""
-        frames, framesCount = self.process_image(file, time=time)
+        frames, framesCount, _ = self.load_image(file, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
         
         result = None
         if framesCount > 1:
@@ -124,7 +129,7 @@ class Aurabox(Divoom):
         
         elif framesCount == 1:
             """Sending as Image"""
-            pair = frames[-1]
+            pair = list(frames)[-1]
             frame = self.make_framepart(pair[1], -1, pair[0])
             result = self.send_command("set image", frame, skipRead=True)
         return result
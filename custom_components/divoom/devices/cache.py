@@ -0,0 +1,121 @@
+"""Provides class LRUCache that keeps encoded data around between calls."""
+
+import collections, threading
+
+class LRUCache:
+    """Class LRUCache keeps the most recently used entries within a size budget."""
+
+    def __init__(self, maxsize, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof if sizeof is not None else lambda value: 1
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the entry for the key and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_create(self, key, create):
+        """Return the entry for the key, or create and store it if there is none.
+        Threads asking for a key that is being created wait for it, instead of creating it as well."""
+        with self._lock:
+            entry = self._hit(key)
+            if entry is not None: return entry[0]
+            pending = self._pending.setdefault(key, [threading.Lock(), 0])
+            pending[1] += 1
+
+        try:
+            with pending[0]:
+                with self._lock:
+                    entry = self._hit(key)
+                    if entry is not None: return entry[0]
+                    self.misses += 1
+
+                value = create()
+                self.put(key, value)
+                return value
+        finally:
+            with self._lock:
+                pending[1] -= 1
+                if pending[1] == 0: del self._pending[key]
+
+    def put(self, key, value):
+        """Store the entry, evicting the least recently used ones until it fits"""
+        size = self.sizeof(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.maxsize: return False # would evict everything and still not fit
+
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+            return True
+
+    def discard(self, key):
+        """Remove the entry for the key, if there is one"""
+        with self._lock:
+            self._remove(key)
+
+    def resize(self, maxsize):
+        """Change the size budget, evicting entries that no longer fit"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return the usage counters as a dict"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self.size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _hit(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def _evict(self):
+        while self.size > self.maxsize and len(self._entries) > 0:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry[1]
+            self.evictions += 1
@@ -0,0 +1,240 @@
+"""Provides class DivoomCommandQueue, the commands waiting for a Divoom device, sent one after another by a single writer."""
+
+import asyncio, collections, functools, logging
+
+QUEUE_DEPTH = 32 # commands that may wait for a device, before new ones are refused
+INTERACTIVE, STATE, BULK = 0, 1, 2 # the lanes of the queue, the commands of a lane go before those of the lanes after it
+LANES = 3
+
+class DivoomQueueFullError(Exception):
+    """Raised when a device has too many commands waiting already."""
+
+    def __init__(self, device, depth):
+        self.device = device
+        self.depth = depth
+        Exception.__init__(self, "{0}: {1} commands are waiting already".format(device, depth))
+
+class DivoomSupersededError(Exception):
+    """Raised in a command that a newer one superseded, to stop sending it."""
+
+class DivoomCommand:
+    """A command waiting in the queue, with the future of its result, and those of the commands it replaced"""
+
+    def __init__(self, mode, data, future, queued, key=None, priority=STATE):
+        self.mode = mode
+        self.data = data
+        self.future = future
+        self.queued = queued
+        self.key = key
+        self.priority = priority
+        self.replaced = []
+        self.injected = False # whether it runs in between the messages of another command
+        self.preempt = None # while it runs, the coroutine function that runs the interactive commands in between, see async_preempt
+        self.superseded = False # whether a newer command took over while it runs, so it stops at the next preempt
+
+    def futures(self):
+        if self.superseded: return [] # the newer command has them now
+        return [self.future] + self.replaced
+
+    def abandoned(self):
+        """Whether every caller gave up waiting for the command"""
+        return all(future.done() for future in self.futures())
+
+    def resolve(self, result=None, error=None):
+        for future in self.futures():
+            if future.done(): continue
+            if error is not None: future.set_exception(error)
+            else: future.set_result(result)
+
+    def cancel(self):
+        for future in self.futures(): future.cancel()
+
+class DivoomCommandQueue:
+    """Class DivoomCommandQueue keeps the commands for a device in order, and a single writer task executes them one after another.
+    So one command is sent completely before the next one starts, and waiting for the device holds no thread.
+    Commands go into the lane of their priority, and the earlier lanes go first. A command of a later lane may let the interactive
+    commands run in between its messages, see async_preempt, so a keypress does not wait for a whole animation.
+    The writer runs as long as there are commands and is started again by the next one."""
+
+    def __init__(self, execute, depth=QUEUE_DEPTH, logger=None, name="Divoom"):
+        self.execute = execute # the coroutine function that sends a command, called with the DivoomCommand
+        self.depth = depth
+        self.name = name
+        self.logger = logger if logger is not None else logging.getLogger(name)
+
+        self.lanes = [collections.deque() for _ in range(LANES)]
+        self.running = [] # the commands being executed, those run in between another one after it
+        self.arrived = asyncio.Event() # set by every command queued, for the pauses of async_preempt
+        self.writer = None
+        self.peak = 0
+        self.executed = 0
+        self.injected = 0
+        self.rejected = 0
+        self.collapsed = 0
+        self.superseded = 0
+        self.wait_last = 0.0
+        self.wait_max = 0.0
+        self.wait_total = 0.0
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def put(self, mode, data, key=None, priority=STATE, supersede=False):
+        """Queue the command and start the writer, if it is not running already. Returns the command, whose future has the result.
+        Commands with a key replace the one with the same key still waiting, which then gets the result of the newer one.
+        Only commands that set a state the newer one sets again may have a key, never those that trigger something on the device.
+        With supersede, the command with the same key being sent stops at its next preempt as well, and its callers get the result of the newer one."""
+        loop = asyncio.get_running_loop()
+        command = DivoomCommand(mode, data, loop.create_future(), loop.time(), key, priority)
+
+        replaced = self.replace(command) if key is not None else None
+        if replaced is None and len(self) >= self.depth:
+            self.rejected += 1
+            self.logger.warning("{0}: {1} commands are waiting already, dropping {2}".format(self.name, len(self), mode))
+            raise DivoomQueueFullError(self.name, len(self))
+
+        if supersede and key is not None: self.supersede(command) # only once it is accepted, a refused one leaves the running one alone
+        self.lanes[priority].append(command)
+        self.peak = max(self.peak, len(self))
+        self.arrived.set()
+
+        if self.writer is None or self.writer.done():
+            self.writer = loop.create_task(self.run(), name="{0} writer".format(self.name))
+        return command
+
+    def replace(self, command):
+        """Take the waiting command with the same key as the command out of the queue, with its callers waiting for the command instead.
+        The command goes to the end of its lane, so it is still sent after everything queued there before it. Returns the replaced one, if any."""
+        for lane in self.lanes:
+            for index, other in enumerate(lane):
+                if other.key != command.key: continue
+
+                del lane[index]
+                command.replaced = command.replaced + other.futures()
+                command.queued = other.queued # it waits as long as the first of them
+                self.collapsed += 1
+                self.logger.debug("{0}: {1} replaced by a newer one, {2} collapsed so far".format(self.name, other.mode, self.collapsed))
+                return other
+        return None
+
+    def supersede(self, command):
+        """Stop the command with the same key as the command being sent, with its callers waiting for the command instead"""
+        for other in self.running:
+            if other.key != command.key or other.superseded: continue
+
+            command.replaced = command.replaced + other.futures()
+            other.superseded = True
+            self.superseded += 1
+            self.logger.debug("{0}: {1} being sent is superseded by a newer one".format(self.name, other.mode))
+
+    async def async_call(self, mode, data, wait=True, key=None, priority=STATE, supersede=False):
+        """Queue the command and return its result once it was sent, or right away with None without wait.
+        Errors of commands nobody waits for are logged instead."""
+        command = self.put(mode, data, key=key, priority=priority, supersede=supersede)
+        if not wait:
+            command.future.add_done_callback(self.log_failure)
+            return None
+        return await command.future
+
+    def log_failure(self, future):
+        if future.cancelled() or future.exception() is None: return
+        self.logger.warning("{0}: a queued command failed: {1}".format(self.name, future.exception()))
+
+    def next(self, before=LANES):
+        """Take the next command out of the first lane that has one, looking only at the lanes before the given one"""
+        for lane in self.lanes[:before]:
+            while len(lane) > 0:
+                command = lane.popleft()
+                if not command.abandoned(): return command # otherwise the callers gave up waiting before it was its turn
+        return None
+
+    async def run(self):
+        """Execute the waiting commands in order, until there are none left"""
+        command = self.next()
+        while command is not None:
+            await self.run_command(command)
+            command = self.next()
+
+    async def run_command(self, command, injected=False):
+        waited = asyncio.get_running_loop().time() - command.queued
+        self.wait_last = waited
+        self.wait_max = max(self.wait_max, waited)
+        self.wait_total += waited
+        self.executed += 1
+        if injected: self.injected += 1
+        if waited > 1: self.logger.debug("{0}: {1} waited {2:.1f}s in the queue".format(self.name, command.mode, waited))
+
+        command.injected = injected
+        if command.priority > INTERACTIVE: command.preempt = functools.partial(self.async_preempt, command)
+        self.running.append(command)
+        try:
+            command.resolve(await self.execute(command))
+        except DivoomSupersededError:
+            self.logger.debug("{0}: stopped sending {1} for the newer one".format(self.name, command.mode))
+        except asyncio.CancelledError:
+            command.cancel()
+            raise
+        except Exception as error: # pylint: disable=broad-except
+            command.resolve(error=error)
+        finally:
+            self.running.remove(command)
+
+    async def async_preempt(self, running, until=None):
+        """Run the interactive commands that are waiting in between the messages of the running command.
+        Only they go in between, a state command would be overwritten by the rest of the running one, so it waits for its end.
+        With until, a number of seconds or a future, the commands arriving until then are run as well, as soon as they arrive.
+        Raises DivoomSupersededError once a newer command superseded the running one, which should then stop sending."""
+        timer = None
+        if isinstance(until, (int, float)):
+            timer = until = asyncio.ensure_future(asyncio.sleep(until))
+
+        try:
+            while True:
+                if running.superseded: raise DivoomSupersededError(running.mode)
+                command = self.next(before=INTERACTIVE + 1)
+                while command is not None:
+                    await self.run_command(command, injected=True)
+                    command = self.next(before=INTERACTIVE + 1)
+                if running.superseded: raise DivoomSupersededError(running.mode)
+                if until is None or until.done(): return
+
+                self.arrived.clear()
+                arrived = asyncio.ensure_future(self.arrived.wait())
+                try:
+                    await asyncio.wait([arrived, until], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    arrived.cancel()
+        finally:
+            if timer is not None: timer.cancel()
+
+    async def async_stop(self):
+        """Drop the waiting commands and stop the writer"""
+        for lane in self.lanes:
+            while len(lane) > 0:
+                lane.popleft().cancel()
+
+        writer = self.writer
+        self.writer = None
+        if writer is not None and not writer.done():
+            writer.cancel()
+            try:
+                await writer
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self):
+        """Return the queue depth and how long commands waited, in seconds, as a dict"""
+        return {
+            "depth": len(self),
+            "lanes": [len(lane) for lane in self.lanes],
+            "maxdepth": self.depth,
+            "peak": self.peak,
+            "executed": self.executed,
+            "injected": self.injected,
+            "rejected": self.rejected,
+            "collapsed": self.collapsed,
+            "superseded": self.superseded,
+            "wait_last": self.wait_last,
+            "wait_max": self.wait_max,
+            "wait_mean": self.wait_total / self.executed if self.executed > 0 else 0.0,
+        }
@@ -1,8 +1,37 @@
 """Provides class Divoom that encapsulates the Divoom Bluetooth communication."""
 
-import datetime, errno, itertools, logging, math, os, re, select, socket, time
+import asyncio, collections, datetime, errno, itertools, logging, math, os, re, select, socket, threading, time
 from PIL import Image, ImageDraw, ImageFont
-
+from .assets import asset_path, read_asset
+from .cache import LRUCache
+from .glyphs import ATLAS_DIRECTORY, atlas_path, changed_columns, compose_text, covers_text, read_atlas, text_width
+from .quantize import median_cut, merge_closest
+from .transport import DivoomOutbox
+from .widgets import BACKGROUND, FOREGROUND, TRACK, WIDGET_KINDS, canvas_pixels, render_widget, widget_value
+
+try:
+    import numpy as np
+except ImportError: # the pixel loops do the same work without it, only slower
+    np = None
+
+FRAME_CACHE_SIZE = 4 * 1024 * 1024 # bytes of encoded frames kept for show_image
+FONT_CACHE_SIZE = 16 # fonts kept loaded for show_text, one per file and size, shared by all devices
+TEXT_WIDTH_CACHE_SIZE = 256 # measured widths kept for show_text, one per font, size and text
+TEXT_STRIP_CACHE_SIZE = 1024 * 1024 # pixels of rendered text strips kept for show_text
+RASTER_CACHE_SIZE = 1024 * 1024 # pixels of decoded frames kept for show_image, shared by all devices of a screen size
+WIDGET_CACHE_SIZE = 256 # encoded frames kept for show_widget, one per device type, widget, value and colors
+MAX_FRAME_TIME = 0xFFFF # the longest duration in ms the two byte time code of a frame can hold
+FRAMES_LIMIT = 60 # the most frames the devices keep of an animation
+TRIM_PALETTE_SLACK = 0.125 # how far above a power of two a palette may be to get merged down to it
+TRIM_PALETTE_MIN = 16 # smaller palettes are left alone, a single merged color is plainly visible in them
+RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
 TEMPERATURE_PATTERN = re.compile(r"^\s*(-?\d+(?:[.,]\d+)?)?\s*°?\s*([CF])?\s*$", re.IGNORECASE)
 
 class DivoomUnsupportedError(Exception):
@@ -46,7 +75,15 @@ class Divoom:
         "set design": 0xbd,
     }
 
+    frameCache = LRUCache(FRAME_CACHE_SIZE, sizeof=lambda entry: sum(len(pair[0]) for pair in entry[0]))
+    fontCache = LRUCache(FONT_CACHE_SIZE)
+    textWidthCache = LRUCache(TEXT_WIDTH_CACHE_SIZE)
+    textStripCache = LRUCache(TEXT_STRIP_CACHE_SIZE, sizeof=lambda entry: entry[2] * len(entry[0]))
+    rasterCache = LRUCache(RASTER_CACHE_SIZE, sizeof=lambda entry: sum(len(pair[0]) for pair in entry[0]))
+    widgetCache = LRUCache(WIDGET_CACHE_SIZE)
+
     escapePayload = False
+    maxframetime = MAX_FRAME_TIME # the longest duration in ms merged frames may add up to, devices with a shorter time code lower it
     host = None
     mac = None
     port = 1
@@ -55,16 +92,23 @@ class Divoom:
         self.socket = None
         self.socket_errno = 0
         self.message_buf = []
+        self.transport = None # a DivoomTransport, for the async_* calls from the event loop
+        self.recording = threading.local() # the payloads a thread records instead of sending them, see record
 
         self.host = host if host else None
         self.mac = mac
         self.port = port
         self.escapePayload = escapePayload
+        self.tickerState = None
 
         if logger is None:
             logger = logging.getLogger(self.type)
         self.logger = logger
 
+    @property
+    def outbox(self):
+        return getattr(self.recording, "outbox", None)
+
     def unsupported(self, feature):
         """Refuse a feature this device does not have"""
         self.logger.warning("{0}: this device does not support {1}.".format(self.type, feature))
@@ -233,21 +277,28 @@ class Divoom:
 
     def send_command(self, command, args=None, skipRead=None):
         """Send command with optional arguments"""
-        if (self.socket == None): return
+        if (self.socket == None and self.outbox == None): return
+        return self.send_payload(self.make_command(command, args), skipRead=skipRead)
 
+    def make_command(self, command, args=None):
+        """The payload of the command with optional arguments"""
         if args is None:
             args = []
         if isinstance(command, str):
             command = self.COMMANDS[command]
+        if command != self.COMMANDS["get view"]: self.tickerState = None # anything else may change what the screen shows
         length = len(args)+3
         payload = []
         payload += length.to_bytes(2, byteorder='little')
         payload += [command]
         payload += args
-        return self.send_payload(payload, skipRead=skipRead)
+        return payload
 
     def send_payload(self, payload, skipRead=None):
         """Send raw payload to the Divoom device. (Will be escaped, checksumed and messaged between 0x01 and 0x02."""
+        if (self.outbox != None):
+            self.outbox.append([payload, skipRead])
+            return 0
         if (self.socket == None): return
 
         result = 0
@@ -279,6 +330,159 @@ class Divoom:
     
         return result
 
+    def record(self, function, *args, **kwargs):
+        """Call the function with everything it would send recorded instead, for async_send_recorded to send it from the event loop.
+        Returns the result of the function and the recorded payloads and pauses."""
+        outbox = []
+        result = self.record_to(outbox, function, *args, **kwargs)
+        return [result, outbox]
+
+    def record_to(self, outbox, function, *args, **kwargs):
+        """Call the function with everything it would send appended to the outbox instead, a list or a DivoomOutbox.
+        Returns the result of the function."""
+        self.recording.outbox = outbox
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.recording.outbox = None
+            if isinstance(outbox, DivoomOutbox): outbox.finish()
+
+    def pause(self, seconds, since=None):
+        """Wait until the seconds passed since the monotonic time given, or just the seconds without it.
+        While recording, the pause is recorded instead, with a time given it counts from the first payload sent after the previous pause."""
+        if (self.outbox != None):
+            self.outbox.append([None, [seconds, since is not None]])
+            return
+
+        wait = seconds if since is None else since + seconds - time.monotonic()
+        if wait > 0: time.sleep(wait)
+
+    async def async_connect(self):
+        """Open a connection to the Divoom device through the transport."""
+        await self.transport.async_connect()
+
+    async def async_disconnect(self):
+        """Close the connection to the Divoom device through the transport."""
+        await self.transport.async_disconnect()
+
+    async def async_reconnect(self, skipPing=None):
+        """Reconnects the connection to the Divoom device through the transport, if needed. The same as reconnect, just without a thread."""
+        transport = self.transport
+
+        try:
+            if (transport.socket == None):
+                await transport.async_connect()
+                await asyncio.sleep(0.5)
+
+            if skipPing != True:
+                ping = await self.async_send_ping()
+                if (self.host != None and isinstance(ping, bytes) and list(ping)[-1] == 0x69):
+                    await asyncio.sleep(0.5)
+                    ping = await self.async_send_ping()
+                if (self.host != None and isinstance(ping, bytes) and list(ping)[-1] == 0x69):
+                    await asyncio.sleep(1)
+                    ping = await self.async_send_ping()
+                if (self.host != None and isinstance(ping, bytes) and list(ping)[-1] == 0x96):
+                    transport.socket_errno = 696
+        except OSError as error:
+            transport.socket_errno = error.errno or errno.ETIMEDOUT
+
+        retries = 1
+        while transport.socket_errno != None and transport.socket_errno > 0 and retries <= 5:
+            self.logger.warning("{0}: connection lost (errno = {1}). Trying to reconnect for the {2} time.".format(self.type, transport.socket_errno, retries))
+            if retries > 1:
+                await asyncio.sleep(1 * retries)
+
+            await transport.async_disconnect()
+            await transport.async_connect()
+            retries += 1
+
+        if transport.socket_errno != None and transport.socket_errno > 0:
+            self.logger.error("{0}: giving up after {2} attempts (errno = {1}).".format(self.type, transport.socket_errno, retries - 1))
+
+    async def async_send_command(self, command, args=None, skipRead=None):
+        """Send command with optional arguments through the transport"""
+        if (self.transport == None or self.transport.socket == None): return
+        return await self.async_send_payload(self.make_command(command, args), skipRead=skipRead)
+
+    async def async_send_payload(self, payload, skipRead=None):
+        """Send raw payload to the Divoom device through the transport, like send_payload"""
+        transport = self.transport
+        if (transport == None or transport.socket == None): return
+
+        request = self.make_message(payload)
+        self.logger.debug("{0} PAYLOAD OUT: {1}".format(self.type, ' '.join([hex(b) for b in request])))
+        result = await transport.async_send(bytes(request))
+
+        if skipRead == False or (skipRead == None and self.logger.isEnabledFor(logging.DEBUG)):
+            response = await transport.async_receive(1024, 0.2)
+            if response:
+                self.logger.debug("{0} PAYLOAD IN: {1}".format(self.type, ' '.join([hex(b) for b in response])))
+                return response
+
+        return result
+
+    async def async_send_recorded(self, outbox, preempt=None):
+        """Send the payloads recorded by record through the transport, waiting out the pauses in between without a thread.
+        The outbox is a list, or a DivoomOutbox still being recorded into, whose payloads are sent as soon as they arrive.
+        The coroutine function preempt is awaited after every payload, with the seconds to wait instead of the pauses,
+        and while waiting for the next payload of a DivoomOutbox, so other messages can go out in between,
+        like the interactive commands of the DivoomCommandQueue."""
+        result = None
+        started = None
+        items = iter(outbox) if isinstance(outbox, list) else None
+        while True:
+            item = next(items, None) if items is not None else await outbox.async_get(preempt)
+            if item is None: break
+
+            payload, option = item
+            if payload is None:
+                seconds, counted = option
+                wait = started + seconds - time.monotonic() if counted and started is not None else seconds
+                if wait > 0:
+                    if preempt is None: await asyncio.sleep(wait)
+                    else: await preempt(wait)
+                started = None
+                continue
+
+            if started is None: started = time.monotonic()
+            result = await self.async_send_payload(payload, skipRead=option)
+            if preempt is not None: await preempt()
+        return result
+
+    async def async_send_ping(self):
+        """Send a ping through the transport, like send_ping"""
+        return await self.async_send_command("get view", [], skipRead=False)
+
+    async def async_record(self, function, *args, **kwargs):
+        """Record the function like record, in the default executor of the event loop, as encoding may take a while"""
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.record(function, *args, **kwargs))
+
+    async def async_stream(self, function, *args, preempt=None, **kwargs):
+        """Record the function in the default executor of the event loop, and send what it records through the transport
+        while it still encodes the rest, like the function itself would. See async_send_recorded for preempt.
+        If sending fails or stops, the recording stops as well, and the ticker state it may have set is dropped,
+        as the screen may show anything now. Returns the result of the function and that of the last payload sent."""
+        loop = asyncio.get_running_loop()
+        outbox = DivoomOutbox(loop)
+        recording = loop.run_in_executor(None, lambda: self.record_to(outbox, function, *args, **kwargs))
+        try:
+            sent = await self.async_send_recorded(outbox, preempt=preempt)
+        except BaseException:
+            outbox.close()
+            try:
+                await recording # it stops at the next payload it records, so it never runs next to the recording of the next command
+            except Exception: # pylint: disable=broad-except
+                pass
+            self.tickerState = None
+            raise
+        return [await recording, sent]
+
+    async def async_show_image(self, file, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
+        """Show image or animation on the Divoom device. Only the encoding takes a thread, the sending happens on the event loop."""
+        streamed = await self.async_stream(self.show_image, file, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
+        return streamed[1]
+
     def drop_message_buffer(self):
         """Drop all dat currently in the message buffer,"""
         self.message_buf = []
@@ -295,6 +499,20 @@ class Divoom:
         for i in range(0, len(lst), n):
             yield lst[i:i + n]
 
+    def chunk_frames(self, frames, n):
+        """Yield successive n-sized chunks of the concatenated frames, taking the next frame only when it is needed."""
+        buffer = []
+        for pair in frames:
+            buffer += pair[0]
+            if len(buffer) < n: continue
+
+            end = len(buffer) - len(buffer) % n
+            for i in range(0, end, n):
+                yield buffer[i:i + n]
+            buffer = buffer[end:]
+        if len(buffer) > 0:
+            yield buffer
+
     def convert_color(self, color):
         result = []
         result += color[0].to_bytes(1, byteorder='big')
@@ -338,163 +556,636 @@ class Divoom:
             header += [0x00, 0x0A, 0x0A, 0x04] # Fixed header on single frames
         return header + framePart
 
-    def process_image(self, image, time=None):
-        frames = []
-        with Image.open(image) as img:
-            
-            picture_frames = []
-            needsFlags = False
-            needsResize = False
-            frameSize = (self.screensize, self.screensize)
-            if self.screensize == 32:
-                if img.size[0] <= 16 and img.size[1] <= 16: # Pixoo-Max can handle 16x16 itself
-                    frameSize = (16, 16)
-                else: needsFlags = True
-            if img.size[0] != frameSize[0] or img.size[1] != frameSize[1]:
-                needsResize = True
-            
-            try:
-                while True:
-                    new_frame = Image.new('RGBA', img.size)
-                    new_frame.paste(img, (0, 0), img.convert('RGBA'))
-
-                    if needsResize:
-                        new_frame = new_frame.resize(frameSize, Image.Resampling.NEAREST)
-                    
-                    duration = img.info['duration'] if 'duration' in img.info else None
-                    picture_frames.append([new_frame, duration])
-                    img.seek(img.tell() + 1)
-            except EOFError:
-                pass
-            
-            framesCount = len(picture_frames)
+    def process_image(self, image, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
+        frames, framesCount, _ = self.stream_image(image, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
+        return [list(frames), framesCount]
+
+    def stream_image(self, image, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
+        """Decode an image or animation and measure its frames, but encode each frame only when it is taken from the returned generator.
+        Animations are cut off at FRAMES_LIMIT, unless sampleFrames picks that many frames spread over the whole animation.
+        resample names the filter the frames are downscaled with, see RESAMPLE_FILTERS.
+        With maxColors, all frames share a palette of at most that many colors, which needs fewer bits per pixel.
+        With trimPalette, frames with just a few colors more than a power of two lose them, to need a bit per pixel less.
+        Returns the generator, the frames count and the length of all frames together, as needed by make_framepart."""
+        raster, frameSize, needsFlags = self.raster_image(image, time=time, maxColors=maxColors, sampleFrames=sampleFrames, resample=resample)
+        picture_frames = [[keys, duration] for keys, duration in raster]
+
+        if trimPalette == True:
+            picture_frames = [[self.trim_keys(pair[0], frameSize, len(picture_frames), needsFlags), pair[1]] for pair in picture_frames]
+        picture_frames = self.merge_frames(picture_frames)
+
+        framesCount = len(picture_frames)
+        colorCounts = [self.count_colors(pair[0]) for pair in picture_frames]
+        framesSize = self.measure_frames(colorCounts, frameSize, framesCount, needsFlags)
+
+        def encode():
+            if needsFlags:
+                yield from self.flag_frames()
+
             for pair in picture_frames:
-                picture_frame = pair[0]
-                picture_time = pair[1]
-                
-                colors = []
-                palette_index = {}
-                pixels = [None] * frameSize[0] * frameSize[1]
-                pix = picture_frame.load()
-
-                for pos in itertools.product(range(frameSize[1]), range(frameSize[0])):
-                    y, x = pos
-                    r, g, b, a = pix[x, y]
-                    color = [r, g, b] if a > 32 else [0, 0, 0]
-                    color_t = (r, g, b) if a > 32 else (0, 0, 0)
-                    color_index = palette_index.get(color_t)
-                    if color_index is None:
-                        color_index = len(colors)
-                        palette_index[color_t] = color_index
-                        colors.append(color)
-                    pixels[x + frameSize[1] * y] = color_index
-                
-                if picture_time is None: picture_time = 0
+                pixels, colors = self.process_keys(pair[0])
                 
                 colorCount = len(colors)
                 if colorCount >= (frameSize[0] * frameSize[1]): colorCount = 0
                 
-                frame = self.process_frame(pixels, colors, colorCount, framesCount, picture_time if time is None else time, needsFlags)
-                frames.append(frame)
+                frame = self.process_frame(pixels, colors, colorCount, framesCount, pair[1], needsFlags)
+                yield self.make_frame(frame)
         
-        result = []
+        return [encode(), framesCount, framesSize]
+    
+    def raster_image(self, image, time=None, maxColors=None, sampleFrames=None, resample=None):
+        """Decode an image or animation into the color_keys of its frames and their durations, reduced to maxColors.
+        Nothing of that depends on the device beyond its screen size, so all devices with the same screen size share
+        the frames of a file through the raster cache, and only the first of them to show it decodes it.
+        Returns the frames, which must not be changed, the frame size and whether the frames need flag_frames."""
+        try:
+            stat = os.stat(image)
+            key = (os.path.realpath(image), stat.st_mtime_ns, stat.st_size, self.screensize, time, maxColors, sampleFrames == True, resample, np is None)
+        except (OSError, TypeError):
+            key = None # not a file on disk, or a missing one Image.open reports
 
-        if needsFlags: # Pixoo-Max expects two empty frames with flags 0x05 and 0x06 at the start
-            result.append(self.make_frame([0x00, 0x00, 0x05, 0x00, 0x00]))
-            result.append(self.make_frame([0x00, 0x00, 0x06, 0x00, 0x00, 0x00]))
+        def decode():
+            picture_frames = []
+            with Image.open(image) as img:
+                
+                needsFlags = False
+                frameSize = (self.screensize, self.screensize)
+                if self.screensize == 32:
+                    if img.size[0] <= 16 and img.size[1] <= 16: # Pixoo-Max can handle 16x16 itself
+                        frameSize = (16, 16)
+                    else: needsFlags = True
+                
+                for new_frame, duration in self.decode_frames(img, frameSize, sampleFrames, resample):
+                    if duration is None: duration = 0
+                    if time is not None: duration = time
 
-        for frame in frames:
-            result.append(self.make_frame(frame))
-        
-        return [result, framesCount]
+                    picture_frames.append([self.color_keys(self.load_pixels(new_frame), frameSize), duration])
+            
+            if maxColors is not None:
+                framesKeys = self.quantize_keys([pair[0] for pair in picture_frames], maxColors)
+                picture_frames = [[keys, pair[1]] for keys, pair in zip(framesKeys, picture_frames)]
+            if np is not None:
+                for pair in picture_frames: pair[0].setflags(write=False) # shared with other devices from here on
+            return [picture_frames, frameSize, needsFlags]
+
+        if key is None: return decode()
+        return self.rasterCache.get_or_create(key, decode)
+
+    def decode_frames(self, img, frameSize, sampleFrames=None, resample=None):
+        """Walk the frames of an opened image one by one and yield each of them downscaled to frameSize as RGBA, with its duration.
+        Only the frame the decoder is on exists in full resolution, and decoding stops at FRAMES_LIMIT.
+        With sampleFrames, evenly spaced frames are picked instead, which also take over the durations of the frames in between.
+        resample names the filter for the downscale, nearest by default, which keeps pixel art sharp."""
+        resample = RESAMPLE_FILTERS.get(resample, Image.Resampling.NEAREST)
+        if not getattr(img, 'is_animated', False):
+            img = self.reduce_image(img, frameSize)
+
+        wanted = None
+        if sampleFrames == True:
+            framesTotal = getattr(img, 'n_frames', 1)
+            if framesTotal > FRAMES_LIMIT:
+                wanted = set(int(position * framesTotal / FRAMES_LIMIT) for position in range(FRAMES_LIMIT))
+
+        index = 0
+        pending = None
+        try:
+            while True:
+                duration = img.info['duration'] if 'duration' in img.info else None
+                if wanted is None or index in wanted:
+                    if pending is not None: yield pending
+                    pending = None
+                    if wanted is None and index >= FRAMES_LIMIT:
+                        self.logger.warning("{0}: the animation has more than {1} frames and is cut off.".format(self.type, FRAMES_LIMIT))
+                        break
+
+                    frame = img
+                    if resample != Image.Resampling.NEAREST and frame.mode not in ('RGB', 'RGBA'):
+                        frame = frame.convert('RGBA') # the other filters mix colors, a palette cannot
+                    # picking pixels first and compositing afterwards gives the same frame, without a full size copy
+                    if frame.size != frameSize: frame = frame.resize(frameSize, resample)
+                    frame = frame.convert('RGBA')
+                    pending = [Image.new('RGBA', frameSize), duration]
+                    pending[0].paste(frame, (0, 0), frame)
+                elif duration is not None:
+                    pending[1] = min((pending[1] or 0) + duration, self.maxframetime)
+
+                img.seek(img.tell() + 1)
+                index += 1
+        except EOFError:
+            pass
+
+        if pending is not None: yield pending
+    
+    def reduce_image(self, img, frameSize):
+        """Shrink a large still image cheaply to about twice the frame size, before the actual downscale.
+        JPEG is decoded at a fraction of its size right away, everything else is reduced by a whole factor."""
+        factor = min(int(img.size[0] / (frameSize[0] * 2)), int(img.size[1] / (frameSize[1] * 2)))
+        if factor < 2: return img
+
+        if img.format == 'JPEG':
+            img.draft(img.mode, (frameSize[0] * 2, frameSize[1] * 2))
+            return img
+
+        if img.mode not in ('L', 'LA', 'RGB', 'RGBA', 'I', 'F'):
+            img = img.convert('RGBA') # reduce cannot average palette indexes
+        return img.reduce(factor)
     
-    def process_text(self, text, font, size=None, time=None, color1=None, color2=None):
+    def load_image(self, file, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
+        """Encode an image or animation, or take it from the frame cache if that file was encoded before.
+        Precompiled frames (see compile.py) are used instead of encoding, as long as they match the file.
+        Returns the frames, which are encoded while they are iterated, the frames count and the length of all frames together."""
+        try:
+            stat = os.stat(file)
+            key = (os.path.realpath(file), stat.st_mtime_ns, stat.st_size, self.type, self.screensize, time, maxColors, trimPalette == True, sampleFrames == True, resample, bool(self.escapePayload))
+        except (OSError, TypeError):
+            stat = None
+            key = None # not a file on disk, or a missing one stream_image reports
+
+        if key is not None:
+            entry = self.frameCache.get(key)
+            if entry is not None:
+                self.logger.debug("{0}: frame cache hit for {1} ({2})".format(self.type, file, self.frameCache.stats()))
+                frames, framesCount = entry
+                return [[[list(pair[0]), pair[1]] for pair in frames], framesCount, sum(pair[1] for pair in frames)]
+
+        entry = None
+        if stat is not None and time is None and maxColors is None and trimPalette != True and sampleFrames != True and resample is None: # precompiled frames are encoded without any options
+            entry = read_asset(asset_path(file, self.type), stat)
+
+        if entry is not None:
+            self.logger.debug("{0}: using precompiled frames for {1}".format(self.type, file))
+            frames, framesCount = entry
+            frames = [[list(pair[0]), pair[1]] for pair in frames]
+            framesSize = sum(pair[1] for pair in frames)
+        else:
+            frames, framesCount, framesSize = self.stream_image(file, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
+
+        if key is None:
+            return [frames, framesCount, framesSize]
+
+        def remember():
+            encoded = []
+            for pair in frames:
+                encoded.append((bytes(pair[0]), pair[1]))
+                yield pair
+            # only a completely encoded image ends up in the cache, not one given up halfway, when sending it failed or stopped
+            self.frameCache.put(key, [encoded, framesCount])
+            self.logger.debug("{0}: frame cache miss for {1} ({2})".format(self.type, file, self.frameCache.stats()))
+        return [remember(), framesCount, framesSize]
+
+    def process_text(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None):
+        frames, framesCount, _ = self.stream_text(text, font, size=size, time=time, color1=color1, color2=color2, scroll=scroll)
+        return [list(frames), framesCount]
+
+    def stream_text(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None):
+        """Render the text and measure its frames, but encode each frame only when it is taken from the returned generator.
+        Text that fits on the screen is shown centered in a single frame, unless scroll is True. With scroll False it always is.
+        Returns the generator, the frames count and the length of all frames together, as needed by make_framepart."""
+        strip, paletteKeys, _, text_speed, picture_time, framesCount, colorCounts, font_width = self.render_text(text, font, size, color1, color2)
+
+        offsets, centered = self.text_offsets(text_speed, framesCount, font_width, scroll)
+        if centered: colorCounts = None
+        if len(offsets) > FRAMES_LIMIT: self.logger.warning("{0}: text animation is too wide and is very likely cut off.".format(self.type))
+        return self.encode_strip(strip, paletteKeys, offsets, picture_time if time is None else time, colorCounts)
+
+    def stream_text_segments(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None):
+        """Split text that needs more than FRAMES_LIMIT frames into consecutive animations, which scroll at the slowest speed
+        instead of taking bigger jumps. Each segment is encoded only when it is taken from the returned generator.
+        Yields the frames, the frames count and the length of all frames together of a segment, and how long it plays in ms."""
+        strip, paletteKeys, img_width, _, _, _, _, font_width = self.render_text(text, font, size, color1, color2)
+
+        text_speed = int(math.ceil(self.screensize / 16))
+        offsets = [offset * text_speed for offset in range(int((img_width - self.screensize) / text_speed))]
+        if len(offsets) <= FRAMES_LIMIT or self.text_offsets(text_speed, len(offsets), font_width, scroll)[1]:
+            frames, framesCount, framesSize = self.stream_text(text, font, size=size, time=time, color1=color1, color2=color2, scroll=scroll)
+            yield [frames, framesCount, framesSize, 0]
+            return
+
+        picture_time = 50 if time is None else time
+        self.logger.debug("{0}: text needs {1} frames, sending it in {2} segments".format(self.type, len(offsets), int(math.ceil(len(offsets) / FRAMES_LIMIT))))
+        for start in range(0, len(offsets), FRAMES_LIMIT):
+            segment = offsets[start:start + FRAMES_LIMIT]
+            frames, framesCount, framesSize = self.encode_strip(strip, paletteKeys, segment, picture_time)
+            yield [frames, framesCount, framesSize, framesCount * picture_time]
+
+    def text_offsets(self, text_speed, framesCount, font_width, scroll=None):
+        """Where the frames of the text start in its strip, and whether that is a single frame showing the text centered.
+        Text that fits on the screen is, unless scroll is True. With scroll False it always is."""
+        if scroll != True and (scroll == False or font_width <= self.screensize):
+            # the text starts one screen into the strip, so this frame has it in the middle
+            return [[self.screensize - int((self.screensize - font_width) / 2)], True]
+        return [[offset * text_speed for offset in range(framesCount)], False]
+
+    def render_text(self, text, font, size=None, color1=None, color2=None):
+        """Render the text into a strip from index_strip, or take it from the text strip cache if it was rendered before.
+        Returns the strip, its palette and width, the scroll speed, frame time, frames count and colors of each frame
+        that keep the animation within FRAMES_LIMIT, and the width of the text itself."""
         if color1 is None or len(color1) < 3: color1 = [0xff, 0xff, 0xff]
         if color2 is None or len(color2) < 3: color2 = [0x01, 0x01, 0x01]
 
-        frames = []
-        picture_time = 50
-        text_margin = 0 if size is None else int((self.screensize - size) / 2)
         text_speed_fast = int(math.ceil(self.screensize / 4))
         text_speed_medium = int(math.ceil(self.screensize / 8))
         text_speed_slow = int(math.ceil(self.screensize / 16))
-        needsFlags = True if self.screensize == 32 else False
         frameSize = (self.screensize, self.screensize)
-        fontSize = self.screensize - (text_margin * 2) if size is None else size
-
-        if font is not None and 'divoom.ttf' in font: # font calculation is a bit off for divoom.ttf
-            fontSize = int(math.ceil(fontSize * 1.2))
-            text_margin = int((self.screensize - fontSize) / 2)
+        fontSize, text_margin = self.font_size(font, size)
 
         self.logger.info("{0}: FONT: {1}".format(self.type, font))
-        fnt = ImageFont.load_default(fontSize)
-        try:
-            if font is not None: fnt = ImageFont.truetype(font, fontSize)
-        except OSError:
-            pass
-        
-        font_width = 60
-        with Image.new('RGBA', (self.screensize * 100, self.screensize)) as img_draw:
-            drw = ImageDraw.Draw(img_draw)
-            drw.fontmode = "1"
-            txt = drw.textbbox((0, 0), text, font=fnt)
-            font_width = txt[2]
-        if font is not None and 'divoom.ttf' in font: # font calculation is a bit off for divoom.ttf
-            font_width = int(math.ceil(font_width * 1.2))
-
-        img_width = self.screensize + font_width + self.screensize + text_margin
-        with Image.new('RGBA', (img_width, self.screensize), tuple(color2 + [0x00])) as img:
-            drw = ImageDraw.Draw(img)
-            drw.fontmode = "1"
-            drw.text((self.screensize, text_margin), text, font=fnt, fill=tuple(color1 + [0xff]))
-
+        fnt = self.load_font(font, fontSize)
+        glyphs = self.load_atlas(font, fontSize)
+        if glyphs is not None and not covers_text(glyphs, text): glyphs = None
+
+        key = (text, fnt, glyphs is not None, fontSize, tuple(color1[0:3]), tuple(color2[0:3]), self.screensize, np is None)
+
+        def rasterize(): # the same for every device with this screen size, so it is rendered only once
+            if glyphs is not None: # the atlas knows the exact width, no need to guess
+                font_width = text_width(glyphs, text)
+                img_width = self.screensize + font_width + self.screensize + text_margin
+                mask = compose_text(glyphs, text, (img_width, self.screensize), (self.screensize, text_margin))
+                strip, paletteKeys = self.index_strip(self.mask_keys(mask, color1), (img_width, self.screensize))
+            else:
+                font_width = self.measure_text(fnt, fontSize, text)
+                strip_width = font_width
+                if font is not None and 'divoom.ttf' in font: # font calculation is a bit off for divoom.ttf
+                    strip_width = int(math.ceil(font_width * 1.2))
+
+                img_width = self.screensize + strip_width + self.screensize + text_margin
+                with Image.new('RGBA', (img_width, self.screensize), tuple(color2 + [0x00])) as img:
+                    drw = ImageDraw.Draw(img)
+                    drw.fontmode = "1"
+                    drw.text((self.screensize, text_margin), text, font=fnt, fill=tuple(color1 + [0xff]))
+                    strip, paletteKeys = self.index_strip(self.color_keys(self.load_pixels(img), img.size), img.size)
+
+            picture_time = 50
             text_speed = text_speed_slow
             framesCount = int(math.floor((img_width - self.screensize) / text_speed))
-            if framesCount > 60: # frames are limited, therefore we need to do bigger jumps
+            if framesCount > FRAMES_LIMIT: # frames are limited, therefore we need to do bigger jumps
                 text_speed = text_speed_medium
                 picture_time = int(picture_time * (text_speed_medium / text_speed_slow))
                 framesCount = int(math.floor((img_width - self.screensize) / text_speed))
-                if framesCount > 60: # frames are limited, therefore we need to do even bigger jumps
+                if framesCount > FRAMES_LIMIT: # frames are limited, therefore we need to do even bigger jumps
                     text_speed = text_speed_fast
                     picture_time = int(picture_time * (text_speed_fast / text_speed_medium))
                     framesCount = int(math.floor((img_width - self.screensize) / text_speed))
-            if framesCount > 60: self.logger.warning("{0}: text animation is too wide and is very likely cut off.".format(self.type))
-
-            pix = img.load()
-            for offset in range(framesCount):
-                colors = []
-                palette_index = {}
-                pixels = [None] * frameSize[0] * frameSize[1]
-
-                for pos in itertools.product(range(frameSize[1]), range(frameSize[0])):
-                    y, x = pos
-                    r, g, b, a = pix[x + (offset * text_speed), y]
-                    color = [r, g, b] if a > 32 else [0, 0, 0]
-                    color_t = (r, g, b) if a > 32 else (0, 0, 0)
-                    color_index = palette_index.get(color_t)
-                    if color_index is None:
-                        color_index = len(colors)
-                        palette_index[color_t] = color_index
-                        colors.append(color)
-                    pixels[x + frameSize[1] * y] = color_index
-                
-                colorCount = len(colors)
-                if colorCount >= (frameSize[0] * frameSize[1]): colorCount = 0
 
-                frame = self.process_frame(pixels, colors, colorCount, framesCount, picture_time if time is None else time, needsFlags)
-                frames.append(frame)
+            colorCounts = [self.count_colors(self.strip_keys(strip, paletteKeys, frameSize, offset * text_speed)) for offset in range(framesCount)]
+            entry = [strip, paletteKeys, img_width, text_speed, picture_time, framesCount, colorCounts, font_width]
+            return entry
+
+        return self.textStripCache.get_or_create(key, rasterize)
+
+    def encode_strip(self, strip, paletteKeys, offsets, frameTime, colorCounts=None):
+        """Measure the frames that start at the offsets of a strip from index_strip, but encode each of them only when it is taken
+        from the returned generator. Returns the generator, the frames count and the length of all frames together."""
+        needsFlags = True if self.screensize == 32 else False
+        frameSize = (self.screensize, self.screensize)
+        framesCount = len(offsets)
+        if colorCounts is None:
+            colorCounts = [self.count_colors(self.strip_keys(strip, paletteKeys, frameSize, offset)) for offset in offsets]
+        framesSize = self.measure_frames(colorCounts, frameSize, framesCount, needsFlags)
+
+
+        def encode():
+            if needsFlags:
+                yield from self.flag_frames()
+
+            for offset in offsets:
+                yield self.encode_offset(strip, paletteKeys, offset, framesCount, frameTime)
         
-        result = []
+        return [encode(), framesCount, framesSize]
 
-        if needsFlags: # Pixoo-Max expects two empty frames with flags 0x05 and 0x06 at the start
-            result.append(self.make_frame([0x00, 0x00, 0x05, 0x00, 0x00]))
-            result.append(self.make_frame([0x00, 0x00, 0x06, 0x00, 0x00, 0x00]))
+    def encode_offset(self, strip, paletteKeys, offset, framesCount, frameTime):
+        """Encode the frame that starts at the offset of a strip from index_strip, as one of framesCount frames"""
+        needsFlags = True if self.screensize == 32 else False
+        frameSize = (self.screensize, self.screensize)
+        if np is not None and len(paletteKeys) <= 2: # with fontmode 1 almost every text strip is
+            pixels, colors = self.process_monochrome(strip, paletteKeys, frameSize, offset)
+        else: pixels, colors = self.process_keys(self.strip_keys(strip, paletteKeys, frameSize, offset))
+
+        colorCount = len(colors)
+        if colorCount >= (frameSize[0] * frameSize[1]): colorCount = 0
 
-        for frame in frames:
-            result.append(self.make_frame(frame))
+        frame = self.process_frame(pixels, colors, colorCount, framesCount, frameTime, needsFlags)
+        return self.make_frame(frame)
+
+    def update_ticker(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None):
+        """Encode the frames of the text for show_ticker. If the font has a glyph atlas and the text only changed in between,
+        only the columns of the characters that changed are composed again, and only the frames they reach are encoded again.
+        Returns the new ticker state and whether its frames differ from the ones of the ticker state before."""
+        if color1 is None or len(color1) < 3: color1 = [0xff, 0xff, 0xff]
+        if color2 is None or len(color2) < 3: color2 = [0x01, 0x01, 0x01]
+        settings = [font, size, time, list(color1[0:3]), list(color2[0:3]), scroll]
+        state = self.tickerState if self.tickerState is not None and self.tickerState[0] == settings else None
+
+        fontSize, text_margin = self.font_size(font, size)
+        glyphs = self.load_atlas(font, fontSize)
+        if glyphs is not None and not covers_text(glyphs, text): glyphs = None
+        stripSize = None if glyphs is None else (self.screensize + text_width(glyphs, text) + self.screensize + text_margin, self.screensize)
+
+        columns = None
+        if state is not None and glyphs is not None and state[2] is not None and state[3] == stripSize:
+            columns = changed_columns(glyphs, state[1], text, (self.screensize, text_margin))
         
-        return [result, framesCount]
+        if columns is None: # all over again, as the strip of show_text
+            strip, paletteKeys, _, text_speed, picture_time, framesCount, _, font_width = self.render_text(text, font, size, color1, color2)
+            mask = None if glyphs is None else compose_text(glyphs, text, stripSize, (self.screensize, text_margin))
+        else:
+            mask = state[2].copy() if np is not None else [bytearray(row) for row in state[2]]
+            compose_text(glyphs, text, stripSize, (self.screensize, text_margin), mask=mask, columns=columns)
+            strip, paletteKeys = self.index_strip(self.mask_keys(mask, color1), stripSize)
+            text_speed, picture_time, framesCount = state[4:7]
+            font_width = text_width(glyphs, text)
+
+        offsets, _ = self.text_offsets(text_speed, framesCount, font_width, scroll)
+        frameTime = picture_time if time is None else time
+        frames = list(self.flag_frames()) if self.screensize == 32 else []
+        for offset in offsets:
+            if columns is not None and state[7] == offsets and (offset + self.screensize <= columns[0] or offset >= columns[1]):
+                frames.append(state[8][len(frames)]) # the changed columns are not on this frame
+            else: frames.append(self.encode_offset(strip, paletteKeys, offset, len(offsets), frameTime))
+
+        changed = state is None or state[8] != frames
+        return [[settings, text, mask, stripSize, text_speed, picture_time, framesCount, offsets, frames], changed]
+
+    def stream_widget(self, widget, value, minimum=None, maximum=None, vertical=None, color1=None, color2=None):
+        """Draw a widget from widgets.py for the value and encode it as a single frame, without PIL. The frame is kept in the
+        widget cache, so showing a value again only sends it. The track, the part of a bar or gauge the value does not reach,
+        is a dimmed color1. Returns the frames, the frames count and the length of all frames together, or None if the widget is
+        unknown or the value does not fit it."""
+        if color1 is None or len(color1) < 3: color1 = [0xff, 0xff, 0xff]
+        if color2 is None or len(color2) < 3: color2 = [0x00, 0x00, 0x00]
+        if widget not in WIDGET_KINDS:
+            self.logger.warning("{0}: there is no {1} widget, please chose from one of the following: {2}".format(self.type, widget, ', '.join(WIDGET_KINDS)))
+            return None
+        value = widget_value(widget, value)
+        if value is None:
+            self.logger.warning("{0}: the value does not fit the {1} widget".format(self.type, widget))
+            return None
+
+        key = (self.type, widget, value, minimum, maximum, vertical == True, tuple(color1[0:3]), tuple(color2[0:3]))
+
+        def encode():
+            needsFlags = True if self.screensize == 32 else False
+            canvas = render_widget(widget, value, self.screensize, minimum=minimum, maximum=maximum, vertical=vertical == True)
+
+            palette = [None] * 3
+            palette[BACKGROUND] = color2[0:3]
+            palette[FOREGROUND] = color1[0:3]
+            palette[TRACK] = [channel // 4 for channel in color1[0:3]]
+            pixels, colors = canvas_pixels(canvas, palette)
+
+            frames = self.flag_frames() if needsFlags else []
+            frames.append(self.make_frame(self.process_frame(pixels, colors, len(colors), 1, 0, needsFlags)))
+            return frames
+
+        frames = self.widgetCache.get_or_create(key, encode)
+        return [iter(frames), 1, sum(pair[1] for pair in frames)]
+
+    def font_size(self, font, size):
+        """The size the font is loaded in and the margin above the text, for the text size given to show_text"""
+        text_margin = 0 if size is None else int((self.screensize - size) / 2)
+        fontSize = self.screensize - (text_margin * 2) if size is None else size
+
+        if font is not None and 'divoom.ttf' in font: # font calculation is a bit off for divoom.ttf
+            fontSize = int(math.ceil(fontSize * 1.2))
+            text_margin = int((self.screensize - fontSize) / 2)
+        return [fontSize, text_margin]
+
+    def load_atlas(self, font, fontSize):
+        """The glyph atlas compiled for the font in that size (see compile.py), or None if there is none for this version of the font"""
+        try:
+            stat = os.stat(font)
+            key = (os.path.realpath(font), fontSize, ATLAS_DIRECTORY)
+        except (OSError, TypeError):
+            return None
+
+        entry = self.fontCache.get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns: return entry[1]
+
+        glyphs = read_atlas(atlas_path(font, fontSize), stat)
+        if glyphs is not None: self.fontCache.put(key, [stat.st_mtime_ns, glyphs])
+        return glyphs
+
+    def mask_keys(self, mask, color):
+        """The color_keys of a text mask from compose_text, drawn in the color on a transparent background, which counts as black"""
+        if np is not None:
+            key = (int(color[0]) << 16) | (int(color[1]) << 8) | int(color[2])
+            return np.where(mask, np.uint32(key), np.uint32(0)).ravel()
+
+        foreground = tuple(color[0:3])
+        return [foreground if pixel else (0, 0, 0) for row in mask for pixel in row]
+
+    def index_strip(self, keys, stripSize):
+        """Turn the color_keys of a rendered text strip into the palette index of every pixel, row by row, and the palette
+        as color_keys. Without NumPy, the strip keeps the color_keys themselves, one list per row, and there is no palette."""
+        if np is not None:
+            paletteKeys, inverse = np.unique(keys, return_inverse=True)
+            strip = inverse.reshape(stripSize[1], stripSize[0]).astype(np.uint8 if len(paletteKeys) <= 256 else np.uint32)
+            strip.flags.writeable = False # shared by every call that hits the text strip cache
+            return strip, paletteKeys
+
+        return [keys[y * stripSize[0]:(y + 1) * stripSize[0]] for y in range(stripSize[1])], None
+
+    def strip_keys(self, strip, paletteKeys, frameSize, offset):
+        """The color_keys of the frame that starts at column offset of a strip from index_strip"""
+        if np is not None:
+            return paletteKeys[strip[0:frameSize[1], offset:offset + frameSize[0]]].ravel()
+        return [key for row in strip[0:frameSize[1]] for key in row[offset:offset + frameSize[0]]]
+
+    def process_monochrome(self, strip, paletteKeys, frameSize, offset):
+        """Collect the colors and the palette index of every pixel of one frame, like process_keys does, for a strip from index_strip
+        with at most two colors. The first pixel always has the first color, so the index is just whether a pixel differs from it."""
+        window = strip[0:frameSize[1], offset:offset + frameSize[0]]
+        first = int(window[0, 0])
+        pixels = (window != first).ravel().view(np.uint8)
+
+        keys = [int(paletteKeys[first])]
+        if pixels.any(): keys.append(int(paletteKeys[1 - first]))
+        return pixels, [[key >> 16, (key >> 8) & 0xff, key & 0xff] for key in keys]
+
+    def load_font(self, font, fontSize):
+        """Load the font in that size, or take it from the font cache if it was loaded before and the file did not change since.
+        The default font is only loaded if there is no font given or it cannot be loaded."""
+        if font is not None:
+            try:
+                stat = os.stat(font)
+                key = (os.path.realpath(font), fontSize)
+            except (OSError, TypeError):
+                stat = None
+                key = None # not a file on disk, truetype may still find it among the system fonts
+
+            entry = self.fontCache.get(key) if key is not None else None
+            if entry is not None and entry[0] == stat.st_mtime_ns: return entry[1]
+
+            try:
+                fnt = ImageFont.truetype(font, fontSize)
+                if key is not None: self.fontCache.put(key, [stat.st_mtime_ns, fnt])
+                return fnt
+            except OSError:
+                pass
+
+        key = (None, fontSize)
+        entry = self.fontCache.get(key)
+        if entry is not None: return entry[1]
+
+        fnt = ImageFont.load_default(fontSize)
+        self.fontCache.put(key, [None, fnt])
+        return fnt
+
+    def measure_text(self, fnt, fontSize, text):
+        """The width the text takes up in that font, taken from the font metrics and kept in the text width cache.
+        Lines are measured one by one, like textbbox does for multiline text drawn left aligned."""
+        key = (fnt, fontSize, text)
+        width = self.textWidthCache.get(key)
+        if width is not None: return width
+
+        # textbbox on the RGBA strip measured in mode L, even though the text is drawn with fontmode 1
+        width = max(fnt.getbbox(line, mode='L')[2] for line in text.split('\n'))
+        self.textWidthCache.put(key, width)
+        return width
+
+    def flag_frames(self):
+        """Pixoo-Max expects two empty frames with flags 0x05 and 0x06 at the start"""
+        return [
+            self.make_frame([0x00, 0x00, 0x05, 0x00, 0x00]),
+            self.make_frame([0x00, 0x00, 0x06, 0x00, 0x00, 0x00]),
+        ]
+
+    def measure_frames(self, colorCounts, frameSize, framesCount, needsFlags):
+        """The length of all frames together, from the number of colors of each frame, without encoding them"""
+        framesSize = sum(pair[1] for pair in self.flag_frames()) if needsFlags else 0
+        for colorCount in colorCounts:
+            framesSize += self.measure_frame(colorCount, frameSize[0] * frameSize[1], framesCount, needsFlags)
+        return framesSize
+
+    def measure_frame(self, colorCount, pixelCount, framesCount, needsFlags):
+        """The length make_frame reports for a frame that process_frame encodes from that many colors and pixels"""
+        length = 2 + 1 + (2 if needsFlags else 1) # time code, palette flag and color count
+        length += colorCount * 3
+        length += int(math.ceil(pixelCount * self.bits_per_pixel(colorCount) / 8))
+        return length + 3
     
+    def load_pixels(self, image):
+        """Give access to the pixels of a RGBA image, as array if NumPy is available"""
+        if np is not None:
+            return np.asarray(image)
+        return image.load()
+
+    def color_keys(self, pix, frameSize, offset=0):
+        """The color of every pixel of one frame, row by row, with pixels of an alpha of 32 or less as black.
+        One integer per pixel with NumPy, a (r, g, b) tuple without. The frame starts at column offset of the loaded pixels."""
+        if np is not None:
+            window = pix[0:frameSize[1], offset:offset + frameSize[0]]
+            rgb = window[:, :, 0:3].astype(np.uint32)
+            keys = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+            return np.where(window[:, :, 3] > 32, keys, 0).ravel()
+
+        keys = []
+        for pos in itertools.product(range(frameSize[1]), range(frameSize[0])):
+            y, x = pos
+            r, g, b, a = pix[x + offset, y]
+            keys.append((r, g, b) if a > 32 else (0, 0, 0))
+        return keys
+
+    def same_keys(self, keys, other):
+        """Whether two frames from color_keys end up with the same palette and pixels"""
+        if np is not None:
+            return np.array_equal(keys, other)
+        return keys == other
+
+    def merge_frames(self, picture_frames):
+        """Merge identical consecutive frames into one longer frame, as long as the time code can hold it"""
+        merged = []
+        for keys, duration in picture_frames:
+            if len(merged) > 0 and self.same_keys(merged[-1][0], keys) and merged[-1][1] + duration <= self.maxframetime:
+                merged[-1][1] += duration # held pose, one longer frame instead of encoding and sending it again
+            else:
+                merged.append([keys, duration])
+
+        if len(merged) < len(picture_frames):
+            self.logger.debug("{0}: merged {1} identical frames into the ones before them, {2} frames left".format(self.type, len(picture_frames) - len(merged), len(merged)))
+        return merged
+
+    def quantize_keys(self, framesKeys, maxColors):
+        """Reduce the colors of all frames from color_keys to one shared palette of at most maxColors colors"""
+        if np is not None:
+            unique, counts = np.unique(np.concatenate(framesKeys), return_counts=True)
+            if len(unique) <= maxColors: return framesKeys
+
+            colors = np.stack([unique >> 16, (unique >> 8) & 0xff, unique & 0xff], axis=1)
+            assignment, palette = median_cut(colors, counts, maxColors)
+            paletteKeys = np.array([(color[0] << 16) | (color[1] << 8) | color[2] for color in palette], dtype=np.uint32)
+            mapped = paletteKeys[assignment]
+            self.logger.debug("{0}: reduced {1} colors to {2}".format(self.type, len(unique), len(palette)))
+            return [mapped[np.searchsorted(unique, keys)] for keys in framesKeys]
+
+        usage = collections.Counter(key for keys in framesKeys for key in keys)
+        if len(usage) <= maxColors: return framesKeys
+
+        unique = sorted(usage)
+        assignment, palette = median_cut([list(key) for key in unique], [usage[key] for key in unique], maxColors)
+        mapping = {key: tuple(palette[box]) for key, box in zip(unique, assignment)}
+        self.logger.debug("{0}: reduced {1} colors to {2}".format(self.type, len(unique), len(palette)))
+        return [[mapping[key] for key in keys] for keys in framesKeys]
+
+    def trim_keys(self, keys, frameSize, framesCount, needsFlags):
+        """Merge the perceptually closest colors of a frame from color_keys, if it has just a few colors more than a power of two"""
+        colorCount = self.count_colors(keys)
+        target = 1 << (self.bits_per_pixel(colorCount) - 1)
+        if target < TRIM_PALETTE_MIN or colorCount - target > int(target * TRIM_PALETTE_SLACK): return keys
+
+        pixelCount = frameSize[0] * frameSize[1]
+        saved = self.measure_frame(colorCount, pixelCount, framesCount, needsFlags) - self.measure_frame(target, pixelCount, framesCount, needsFlags)
+        if saved <= 0: return keys # the device does not pack pixels by palette size
+
+        if np is not None:
+            unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            colors = np.stack([unique >> 16, (unique >> 8) & 0xff, unique & 0xff], axis=1)
+            keys = unique[np.asarray(merge_closest(colors, counts, target))][inverse.ravel()]
+        else:
+            usage = collections.Counter(keys)
+            unique = sorted(usage)
+            survivor = merge_closest(unique, [usage[key] for key in unique], target)
+            mapping = {key: unique[index] for key, index in zip(unique, survivor)}
+            keys = [mapping[key] for key in keys]
+
+        self.logger.debug("{0}: trimmed a frame from {1} to {2} colors, {3} bytes saved".format(self.type, colorCount, target, saved))
+        return keys
+
+    def count_colors(self, keys):
+        """Count the colors process_keys would collect for the frame, without indexing the pixels"""
+        if np is not None:
+            return len(np.unique(keys))
+        return len(set(keys))
+
+    def process_palette(self, pix, frameSize, offset=0):
+        """Collect the colors of one frame in order of their first appearance and the palette index of every pixel.
+        Pixels with an alpha of 32 or less count as black. The frame starts at column offset of the loaded pixels."""
+        return self.process_keys(self.color_keys(pix, frameSize, offset))
+
+    def process_keys(self, keys):
+        """Collect the colors from color_keys in order of their first appearance and the palette index of every pixel"""
+        if np is not None:
+            unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            order = np.argsort(first)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+
+            pixels = rank[inverse.ravel()]
+            colors = [[int(key) >> 16, (int(key) >> 8) & 0xff, int(key) & 0xff] for key in unique[order]]
+            return pixels, colors
+
+        colors = []
+        palette_index = {}
+        pixels = [None] * len(keys)
+        for index, color_t in enumerate(keys):
+            color_index = palette_index.get(color_t)
+            if color_index is None:
+                color_index = len(colors)
+                palette_index[color_t] = color_index
+                colors.append(list(color_t))
+            pixels[index] = color_index
+        return pixels, colors
+
     def process_frame(self, pixels, colors, colorCount, framesCount, time, needsFlags):
         timeCode = [0x00, 0x00]
         if framesCount > 1:
@@ -514,11 +1205,19 @@ class Divoom:
 
     def process_pixels(self, pixels, colors):
         """Correctly transform each pixel information based on https://github.com/RomRider/node-divoom-timebox-evo/blob/master/PROTOCOL.md#pixel-string-pixel_data """
-        bitsPerPixel = math.ceil(math.log(len(colors)) / math.log(2))
-        if bitsPerPixel == 0:
-            bitsPerPixel = 1
-
+        bitsPerPixel = self.bits_per_pixel(len(colors))
         mask = (1 << bitsPerPixel) - 1
+        if np is not None:
+            indices = np.asarray(pixels, dtype=np.uint32) & mask
+            if bitsPerPixel == 8:
+                return indices.astype(np.uint8).tobytes()
+            if bitsPerPixel == 1: # two colors, the indexes are the bits already
+                return np.packbits(indices.astype(np.uint8), bitorder='little').tobytes()
+
+            # every pixel becomes its bits, lowest first, so one little-endian packbits writes the whole frame
+            bits = (indices[:, None] >> np.arange(bitsPerPixel, dtype=np.uint32)) & 1
+            return np.packbits(bits.astype(np.uint8).ravel(), bitorder='little').tobytes()
+
         acc = 0
         nbits = 0
         result = bytearray()
@@ -532,7 +1231,47 @@ class Divoom:
         if nbits > 0:
             result.append(acc & 0xff)
 
-        return list(result)
+        return bytes(result)
+
+    def bits_per_pixel(self, colorCount):
+        """The number of bits process_pixels uses for each palette index"""
+        bitsPerPixel = math.ceil(math.log(colorCount) / math.log(2))
+        if bitsPerPixel == 0:
+            bitsPerPixel = 1
+        return bitsPerPixel
+
+    def send_frames(self, frames, framesCount, framesSize):
+        """Send frames as image or animation, each chunk as soon as the frames it needs are encoded"""
+        result = None
+        if framesCount > 1:
+            """Sending as Animation"""
+            index = 0
+            for framePart in self.chunk_frames(frames, self.chunksize):
+                frame = self.make_framepart(framesSize, index, framePart)
+                result = self.send_command("set animation frame", frame, skipRead=True)
+                index += 1
+        
+        elif framesCount == 1:
+            """Sending as Image"""
+            pair = list(frames)[-1]
+            frame = self.make_framepart(pair[1], -1, pair[0])
+            result = self.send_command("set image", frame, skipRead=True)
+        return result
+
+    def send_segments(self, segments):
+        """Send the segments from stream_text_segments one after another, each just before the previous one played to its end.
+        Sending the previous segment took about as long as sending the next one will, so that is how early it starts.
+        The device keeps looping the last segment, like any other animation."""
+        result = None
+        previous = None
+        for frames, framesCount, framesSize, duration in segments:
+            if previous is not None:
+                self.pause(previous[1], since=previous[0])
+
+            started = time.monotonic()
+            result = self.send_frames(frames, framesCount, framesSize)
+            previous = [started, duration / 1000]
+        return result
 
     def send_ping(self):
         """Send a ping (actually it's requesting current view) to the Divoom device to check connectivity"""
@@ -709,36 +1448,14 @@ class Divoom:
         elif value > 0:
             args += value.to_bytes(1, byteorder='big')
             result = self.send_command("set game keydown", args, skipRead=True)
-            time.sleep(0.1)
+            self.pause(0.1)
             result = self.send_command("set game keyup", args, skipRead=True)
         return result
 
-    def show_image(self, file, time=None):
+    def show_image(self, file, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
         """Show image or animation on the Divoom device"""
-        frames, framesCount = self.process_image(file, time=time)
-        
-        result = None
-        if framesCount > 1:
-            """Sending as Animation"""
-            frameParts = []
-            framePartsSize = 0
-            
-            for pair in frames:
-                frameParts += pair[0]
-                framePartsSize += pair[1]
-            
-            index = 0
-            for framePart in self.chunks(frameParts, self.chunksize):
-                frame = self.make_framepart(framePartsSize, index, framePart)
-                result = self.send_command("set animation frame", frame, skipRead=True)
-                index += 1
-        
-        elif framesCount == 1:
-            """Sending as Image"""
-            pair = frames[-1]
-            frame = self.make_framepart(pair[1], -1, pair[0])
-            result = self.send_command("set image", frame, skipRead=True)
-        return result
+        frames, framesCount, framesSize = self.load_image(file, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
+        return self.send_frames(frames, framesCount, framesSize)
 
     def send_keyboard(self, value=None):
         self.unimplemented()
@@ -852,31 +1569,25 @@ class Divoom:
     def show_temperature(self, value=None, color=None):
         self.unsupported("the temperature mode")
 
-    def show_text(self, text, font, size=None, time=None, color1=None, color2=None):
-        """Show image or animation on the Divoom device"""
-        frames, framesCount = self.process_text(text, font, size=size, time=time, color1=color1, color2=color2)
-        
-        result = None
-        if framesCount > 1:
-            """Sending as Animation"""
-            frameParts = []
-            framePartsSize = 0
-            
-            for pair in frames:
-                frameParts += pair[0]
-                framePartsSize += pair[1]
-            
-            index = 0
-            for framePart in self.chunks(frameParts, self.chunksize):
-                frame = self.make_framepart(framePartsSize, index, framePart)
-                result = self.send_command("set animation frame", frame, skipRead=True)
-                index += 1
-        
-        elif framesCount == 1:
-            """Sending as Image"""
-            pair = frames[-1]
-            frame = self.make_framepart(pair[1], -1, pair[0])
-            result = self.send_command("set image", frame, skipRead=True)
+    def show_text(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None, longText=None):
+        """Show image or animation on the Divoom device. With longText, text beyond the frames limit is sent in segments."""
+        if longText == True:
+            return self.send_segments(self.stream_text_segments(text, font, size=size, time=time, color1=color1, color2=color2, scroll=scroll))
+
+        frames, framesCount, framesSize = self.stream_text(text, font, size=size, time=time, color1=color1, color2=color2, scroll=scroll)
+        return self.send_frames(frames, framesCount, framesSize)
+
+    def show_ticker(self, text, font, size=None, time=None, color1=None, color2=None, scroll=None):
+        """Show text like show_text, as an update of the text shown by the ticker before. Nothing is sent if it looks the same."""
+        state, changed = self.update_ticker(text, font, size=size, time=time, color1=color1, color2=color2, scroll=scroll)
+        if not changed:
+            self.logger.debug("{0}: ticker shows the same frames already, nothing to send".format(self.type))
+            self.tickerState = state
+            return None
+
+        frames = state[-1]
+        result = self.send_frames(iter(frames), len(state[7]), sum(frame[1] for frame in frames))
+        self.tickerState = state
         return result
 
     def show_timer(self, value=None):
@@ -931,6 +1642,12 @@ class Divoom:
             self.send_command("set temp type", [0x01 if unit == 1 else 0x00])
         return result
 
+    def show_widget(self, widget, value, minimum=None, maximum=None, vertical=None, color1=None, color2=None):
+        """Show a number, bar, gauge or sparkline on the Divoom device"""
+        streamed = self.stream_widget(widget, value, minimum=minimum, maximum=maximum, vertical=vertical, color1=color1, color2=color2)
+        if streamed is None: return None
+        return self.send_frames(*streamed)
+
     def clear_input_buffer(self):
         """Read all input from Divoom device and remove from buffer. """
         while self.receive() > 0:
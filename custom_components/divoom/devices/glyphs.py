@@ -0,0 +1,159 @@
+"""Provides glyph atlases, the characters of a pixel font rasterized once per size, and composing text from them without FreeType."""
+
+import os, struct
+
+try:
+    import numpy as np
+except ImportError: # the rows of bytes compose exactly the same text, only slower
+    np = None
+
+ATLAS_DIRECTORY = ".divoom"
+ATLAS_FONTS = ("divoom.ttf", "pixelpowerline.ttf") # pixel fonts, which blitting their glyphs draws as designed
+ATLAS_CHARACTERS = "".join(chr(code) for code in list(range(0x20, 0x7f)) + list(range(0xa0, 0x100))) + "€"
+ATLAS_MAGIC = b"DIVG"
+ATLAS_VERSION = 1
+
+# magic, version, font mtime in ns, font size in bytes, font size in pixels, number of glyphs
+HEADER = struct.Struct("<4sBQQHH")
+# code point, advance, left and top of the bitmap from the pen position, width and height of the bitmap
+GLYPH = struct.Struct("<IhhhBB")
+
+def atlas_path(font, fontSize):
+    """Where the glyph atlas of the font is stored for the font size"""
+    return os.path.join(os.path.dirname(font), ATLAS_DIRECTORY, "glyphs", "{0}.{1}.bin".format(os.path.basename(font), fontSize))
+
+def build_atlas(fnt, characters=ATLAS_CHARACTERS):
+    """Rasterize the characters with FreeType, the way drawing text with fontmode 1 does.
+    Returns the glyphs by character, as advance, left, top, width, height and one byte per pixel."""
+    glyphs = {}
+    for character in characters:
+        mask, offset = fnt.getmask2(character, mode='1')
+        width, height = mask.size
+        pixels = bytes(1 if mask.getpixel((x, y)) else 0 for y in range(height) for x in range(width))
+        glyphs[character] = [int(round(fnt.getlength(character, mode='1'))), offset[0], offset[1], width, height, pixels]
+    return glyphs
+
+def write_atlas(path, stat, fontSize, glyphs):
+    """Store the glyphs from build_atlas for the font file described by stat, with 8 pixels per byte"""
+    data = bytearray(HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, stat.st_mtime_ns, stat.st_size, fontSize, len(glyphs)))
+    for character, (advance, left, top, width, height, pixels) in glyphs.items():
+        data += GLYPH.pack(ord(character), advance, left, top, width, height)
+        packed = bytearray((len(pixels) + 7) // 8)
+        for index, pixel in enumerate(pixels):
+            if pixel: packed[index >> 3] |= 1 << (index & 7)
+        data += packed
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, path) # a running show_text never sees a half written file
+
+def read_atlas(path, stat):
+    """Load the glyphs stored for the font file described by stat, with the pixels of each glyph as array if NumPy is available.
+    Returns None if there is none or it was compiled from another version of the font."""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    if len(data) < HEADER.size: return None
+    magic, version, mtime, size, _, count = HEADER.unpack_from(data, 0)
+    if magic != ATLAS_MAGIC or version != ATLAS_VERSION: return None
+    if mtime != stat.st_mtime_ns or size != stat.st_size: return None
+
+    glyphs = {}
+    position = HEADER.size
+    for _ in range(count):
+        if position + GLYPH.size > len(data): return None
+        code, advance, left, top, width, height = GLYPH.unpack_from(data, position)
+        position += GLYPH.size
+        length = (width * height + 7) // 8
+        packed = data[position:position + length]
+        position += length
+
+        if np is not None:
+            pixels = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=width * height, bitorder='little').reshape(height, width).astype(bool)
+        else:
+            pixels = bytes((packed[index >> 3] >> (index & 7)) & 1 for index in range(width * height))
+        glyphs[chr(code)] = [advance, left, top, width, height, pixels]
+    if position != len(data): return None
+
+    return glyphs
+
+def covers_text(glyphs, text):
+    """Whether the atlas has every character of the text, which has to be a single line"""
+    return "\n" not in text and all(character in glyphs for character in text)
+
+def text_width(glyphs, text):
+    """The width the text takes up, up to the last pixel or the end of the last advance, whichever is further"""
+    pen = 0
+    right = 0
+    for character in text:
+        advance, left, _, width, height, _ = glyphs[character]
+        if width > 0 and height > 0: right = max(right, pen + left + width)
+        pen += advance
+    return max(pen, right)
+
+def changed_columns(glyphs, oldText, text, origin):
+    """The columns composing the text differs in from composing oldText, both starting at origin, as start and end.
+    Characters both texts start and end with stay where they are, as long as the characters in between advance the same.
+    Returns None if the end of the text moves, which changes the columns up to the end of the mask."""
+    prefix = 0
+    while prefix < min(len(oldText), len(text)) and oldText[prefix] == text[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(oldText), len(text)) - prefix and oldText[-1 - suffix] == text[-1 - suffix]:
+        suffix += 1
+
+    pen = origin[0] + sum(glyphs[character][0] for character in text[:prefix])
+    start, end, ends = None, None, []
+    for middle in (oldText[prefix:len(oldText) - suffix], text[prefix:len(text) - suffix]):
+        x = pen
+        for character in middle:
+            advance, left, _, width, height, _ = glyphs[character]
+            columns = [x, x + advance]
+            if width > 0 and height > 0: columns += [x + left, x + left + width]
+            start = min(columns) if start is None else min(start, min(columns))
+            end = max(columns) if end is None else max(end, max(columns))
+            x += advance
+        ends.append(x)
+    if ends[0] != ends[1]: return None
+    if start is None: return [pen, pen]
+    return [start, end]
+
+def compose_text(glyphs, text, size, origin, mask=None, columns=None):
+    """Blit the glyphs of the text into a mask of the size, with the pen starting at origin. Pixels outside the mask are dropped.
+    Given a mask and columns from changed_columns, only these columns of the mask are cleared and composed again.
+    Returns a boolean array of rows with NumPy, a list of bytearray rows with 0 and 1 without."""
+    width, height = size
+    if mask is None:
+        mask = np.zeros((height, width), dtype=bool) if np is not None else [bytearray(width) for _ in range(height)]
+    left, right = (0, width) if columns is None else (max(0, columns[0]), min(width, columns[1]))
+    if columns is not None:
+        if np is not None: mask[:, left:right] = False
+        else:
+            for row in mask: row[left:right] = bytes(max(0, right - left))
+
+    pen = origin[0]
+    for character in text:
+        advance, glyphLeft, top, glyphWidth, glyphHeight, pixels = glyphs[character]
+        x = pen + glyphLeft
+        y = origin[1] + top
+        pen += advance
+
+        # the part of the glyph that lands inside the mask and the columns
+        x0, y0 = max(0, left - x), max(0, -y)
+        x1, y1 = min(glyphWidth, right - x), min(glyphHeight, height - y)
+        if x0 >= x1 or y0 >= y1: continue
+
+        if np is not None:
+            mask[y + y0:y + y1, x + x0:x + x1] |= pixels[y0:y1, x0:x1]
+            continue
+
+        for row in range(y0, y1):
+            target = mask[y + row]
+            for column in range(x0, x1):
+                if pixels[row * glyphWidth + column]: target[x + column] = 1
+    return mask
@@ -0,0 +1,140 @@
+"""Provides a median cut color quantizer, that reduces the colors of all frames of an animation to one shared palette."""
+
+try:
+    import numpy as np
+except ImportError: # the plain loops find exactly the same palette, only slower
+    np = None
+
+def median_cut(colors, counts, maxColors):
+    """Split the colors into at most maxColors boxes. colors are distinct [r, g, b] and counts how often each one is used.
+    Returns the box of every color and the palette, the weighted mean color of every box.
+    The box with the widest channel is split at the weighted median of that channel, until there are enough boxes."""
+    if np is not None:
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 3)
+        counts = np.asarray(counts, dtype=np.int64)
+        boxes = [np.arange(len(colors))]
+        ranges = [box_range(colors, boxes[0])]
+        while len(boxes) < maxColors:
+            widest = max(range(len(boxes)), key=lambda index: ranges[index][0])
+            width, channel = ranges[widest]
+            if width == 0: break # every box holds a single color already
+
+            box = boxes[widest]
+            box = box[np.argsort(colors[box, channel], kind='stable')]
+            cumulative = np.cumsum(counts[box])
+            cut = int(np.searchsorted(cumulative, cumulative[-1] / 2)) + 1
+            cut = min(max(cut, 1), len(box) - 1)
+
+            boxes[widest] = box[:cut]
+            ranges[widest] = box_range(colors, boxes[widest])
+            boxes.append(box[cut:])
+            ranges.append(box_range(colors, boxes[-1]))
+
+        assignment = np.empty(len(colors), dtype=np.int64)
+        palette = []
+        for index, box in enumerate(boxes):
+            assignment[box] = index
+            weights = counts[box]
+            total = int(weights.sum())
+            palette.append([(int((colors[box, channel] * weights).sum()) + total // 2) // total for channel in range(3)])
+        return assignment, palette
+
+    boxes = [list(range(len(colors)))]
+    ranges = [box_range(colors, boxes[0])]
+    while len(boxes) < maxColors:
+        widest = max(range(len(boxes)), key=lambda index: ranges[index][0])
+        width, channel = ranges[widest]
+        if width == 0: break # every box holds a single color already
+
+        box = sorted(boxes[widest], key=lambda index: colors[index][channel])
+        total = sum(counts[index] for index in box)
+        cumulative = 0
+        cut = len(box)
+        for position, index in enumerate(box):
+            cumulative += counts[index]
+            if cumulative >= total / 2:
+                cut = position + 1
+                break
+        cut = min(max(cut, 1), len(box) - 1)
+
+        boxes[widest] = box[:cut]
+        ranges[widest] = box_range(colors, boxes[widest])
+        boxes.append(box[cut:])
+        ranges.append(box_range(colors, boxes[-1]))
+
+    assignment = [0] * len(colors)
+    palette = []
+    for index, box in enumerate(boxes):
+        total = 0
+        sums = [0, 0, 0]
+        for color in box:
+            assignment[color] = index
+            total += counts[color]
+            for channel in range(3):
+                sums[channel] += colors[color][channel] * counts[color]
+        palette.append([(value + total // 2) // total for value in sums])
+    return assignment, palette
+
+def box_range(colors, box):
+    """The widest spread of the colors in the box and the channel it is in"""
+    if np is not None and isinstance(colors, np.ndarray):
+        spread = colors[box].max(axis=0) - colors[box].min(axis=0)
+        channel = int(np.argmax(spread))
+        return int(spread[channel]), channel
+
+    spread = [max(colors[index][channel] for index in box) - min(colors[index][channel] for index in box) for channel in range(3)]
+    channel = spread.index(max(spread))
+    return spread[channel], channel
+
+def merge_closest(colors, counts, target):
+    """Merge the two perceptually closest colors, until only target colors are left. The less used color of a pair
+    takes the more used one, so no new colors appear. Returns the index of the color every color ends up as."""
+    survivor = list(range(len(colors)))
+    counts = [int(count) for count in counts]
+    lab = to_lab(colors)
+
+    if np is not None:
+        lab = np.asarray(lab)
+        distances = ((lab[:, None, :] - lab[None, :, :]) ** 2).sum(axis=2)
+        distances[np.tril_indices(len(colors))] = np.inf # every pair once, never a color with itself
+        for _ in range(len(colors) - target):
+            first, second = np.unravel_index(int(np.argmin(distances)), distances.shape)
+            kept, dropped = (first, second) if counts[first] >= counts[second] else (second, first)
+            survivor[dropped] = int(kept)
+            counts[kept] += counts[dropped]
+            distances[dropped, :] = np.inf
+            distances[:, dropped] = np.inf
+    else:
+        alive = list(range(len(colors)))
+        for _ in range(len(colors) - target):
+            best = None
+            for position, first in enumerate(alive):
+                for second in alive[position + 1:]:
+                    distance = sum((lab[first][channel] - lab[second][channel]) ** 2 for channel in range(3))
+                    if best is None or distance < best[0]:
+                        best = (distance, first, second)
+            _, first, second = best
+            kept, dropped = (first, second) if counts[first] >= counts[second] else (second, first)
+            survivor[dropped] = kept
+            counts[kept] += counts[dropped]
+            alive.remove(dropped)
+
+    for index in range(len(survivor)): # a color can take one that was merged itself later on
+        while survivor[survivor[index]] != survivor[index]:
+            survivor[index] = survivor[survivor[index]]
+    return survivor
+
+def to_lab(colors):
+    """Convert sRGB colors to CIELAB (D65), in which distances match how different colors look"""
+    result = []
+    for color in colors:
+        linear = []
+        for value in color:
+            value = int(value) / 255
+            linear.append(value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4)
+        x = (0.4124 * linear[0] + 0.3576 * linear[1] + 0.1805 * linear[2]) / 0.95047
+        y = (0.2126 * linear[0] + 0.7152 * linear[1] + 0.0722 * linear[2])
+        z = (0.0193 * linear[0] + 0.1192 * linear[1] + 0.9505 * linear[2]) / 1.08883
+        x, y, z = [value ** (1 / 3) if value > 0.008856 else 7.787 * value + 16 / 116 for value in (x, y, z)]
+        result.append([116 * y - 16, 500 * (x - y), 200 * (y - z)])
+    return result
@@ -8,6 +8,7 @@ class TimeboxMini(Divoom):
         self.type = "TimeboxMini"
         self.screensize = 11
         self.chunksize = 182
+        self.maxframetime = 255 * 100 # the delay of a frame is a single byte in steps of 100ms
         self.colorpalette = None
         if escapePayload == None: escapePayload = True
         Divoom.__init__(self, host, mac, port, escapePayload, logger)
@@ -23,6 +24,10 @@ class TimeboxMini(Divoom):
             header += index.to_bytes(1, byteorder='little') # Pixoo-Max expects more
         return header + framePart
 
+    def measure_frame(self, colorCount, pixelCount, framesCount, needsFlags):
+        """The length make_frame reports for a frame that process_frame encodes from that many pixels"""
+        return (1 if framesCount > 1 else 0) + int(pixelCount / 2) * 3 + (2 if pixelCount % 2 else 0)
+
     def process_frame(self, pixels, colors, colorCount, framesCount, time, needsFlags):
         result = []
         if framesCount > 1:
@@ -69,9 +74,9 @@ class TimeboxMini(Divoom):
     def show_equalizer(self, number, audioMode=False, backgroundMode=False, streamMode=False):
         self.unsupported("the music equalizer mode")
 
-    def show_image(self, file, time=None):
+    def show_image(self, file, time=None, maxColors=None, trimPalette=None, sampleFrames=None, resample=None):
         """Show image or animation on the Divoom device"""
-        frames, framesCount = self.process_image(file, time=time)
+        frames, framesCount, _ = self.load_image(file, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
         
         result = None
         if framesCount > 1:
@@ -84,7 +89,7 @@ class TimeboxMini(Divoom):
         
         elif framesCount == 1:
             """Sending as Image"""
-            pair = frames[-1]
+            pair = list(frames)[-1]
             frame = self.make_framepart(pair[1], -1, pair[0])
             result = self.send_command("set image", frame, skipRead=True)
         return result
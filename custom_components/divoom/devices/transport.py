@@ -0,0 +1,151 @@
+"""Provides class DivoomTransport, the connection to a Divoom device for the asyncio event loop."""
+
+import asyncio, errno, socket
+
+BRIDGE_PORT = 7777 # the TCP port of a host that bridges to the Bluetooth device
+CONNECT_TIMEOUT = 10 # seconds opening the connection may take
+SEND_TIMEOUT = 3 # seconds writing a message may take, like the timeout of the blocking socket of Divoom
+OUTBOX_DEPTH = 8 # payloads and pauses a recording thread may get ahead of the ones being sent, see DivoomOutbox
+
+class DivoomTransport:
+    """Connection to a Divoom device on a non-blocking socket, driven by the loop.sock_* calls of the event loop,
+    so waiting for the device holds no thread. It goes straight over Bluetooth RFCOMM, or through the TCP bridge of a host,
+    with the same handshake as the blocking socket of Divoom."""
+
+    def __init__(self, host=None, mac=None, port=1, logger=None, name="Divoom"):
+        self.host = host
+        self.mac = mac
+        self.port = port
+        self.logger = logger
+        self.name = name
+
+        self.socket = None
+        self.socket_errno = 0
+
+    @property
+    def connected(self):
+        return self.socket is not None
+
+    def open_socket(self):
+        """A new non-blocking socket and the address to connect it to"""
+        if self.host == None:
+            sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+            address = (self.mac, self.port)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+            address = (self.host, BRIDGE_PORT)
+        sock.setblocking(False)
+        return sock, address
+
+    async def async_connect(self):
+        """Open a connection to the Divoom device, unless there is one already."""
+        if self.socket != None: return
+
+        loop = asyncio.get_running_loop()
+        sock = None
+        try:
+            sock, address = self.open_socket()
+            await asyncio.wait_for(loop.sock_connect(sock, address), CONNECT_TIMEOUT)
+            self.socket = sock
+            self.socket_errno = 0
+        except OSError as error: # a timeout as well, which has no errno of its own
+            self.socket_errno = error.errno or errno.ETIMEDOUT
+            if sock != None: sock.close()
+            return
+
+        if self.host != None:
+            await asyncio.sleep(0.5)
+            conn = [0x69]
+            conn += bytearray.fromhex(self.mac.replace(':', ''))
+            conn += [self.port]
+            try:
+                await self.async_send(bytes(conn))
+            except OSError:
+                self.close()
+
+    async def async_disconnect(self):
+        """Close the connection to the Divoom device."""
+        if self.socket == None: return
+
+        try:
+            if self.host != None:
+                conn = [0x96]
+                conn += bytearray.fromhex(self.mac.replace(':', ''))
+                await self.async_send(bytes(conn))
+
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        """Drop the connection without saying goodbye, which is safe from anywhere."""
+        if self.socket == None: return
+        self.socket.close()
+        self.socket = None
+
+    async def async_send(self, data):
+        """Write all of the data to the Divoom device. Returns the number of bytes written."""
+        if self.socket == None: return 0
+
+        try:
+            await asyncio.wait_for(asyncio.get_running_loop().sock_sendall(self.socket, data), SEND_TIMEOUT)
+        except OSError as error:
+            self.socket_errno = error.errno or errno.ETIMEDOUT
+            raise
+        return len(data)
+
+    async def async_receive(self, num_bytes=1024, timeout=0.2):
+        """Read up to num_bytes from the Divoom device, waiting for them no longer than timeout. Returns what was read."""
+        if self.socket == None: return b""
+
+        try:
+            return await asyncio.wait_for(asyncio.get_running_loop().sock_recv(self.socket, num_bytes), timeout)
+        except TimeoutError:
+            return b""
+        except OSError as error:
+            self.socket_errno = error.errno
+            return b""
+
+class DivoomOutboxClosedError(Exception):
+    """Raised in the recording thread once nothing it records is sent anymore."""
+
+class DivoomOutbox:
+    """The payloads and pauses a thread records for the event loop to send, while the thread still records the next ones.
+    The thread waits as long as depth of them are not taken yet, so it encodes no further ahead of the device than that,
+    and the first frames go out while the later ones are still encoded. None marks the end of the recording."""
+
+    def __init__(self, loop, depth=OUTBOX_DEPTH):
+        self.loop = loop
+        self.queue = asyncio.Queue(depth)
+        self.closed = False
+
+    def append(self, item):
+        """Hand the item over to the event loop, called from the recording thread"""
+        if self.closed: raise DivoomOutboxClosedError()
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+        if self.closed: raise DivoomOutboxClosedError() # it was taken only to let the thread go on
+
+    def finish(self):
+        """Mark the end of the recording, called from the recording thread"""
+        if self.closed: return
+        asyncio.run_coroutine_threadsafe(self.queue.put(None), self.loop).result()
+
+    async def async_get(self, preempt=None):
+        """The next payload or pause, or None at the end of the recording. The coroutine function preempt is awaited
+        with the future of the item while the recording thread is still busy with it, see async_send_recorded of Divoom."""
+        if preempt is None or not self.queue.empty(): return await self.queue.get()
+
+        getter = asyncio.ensure_future(self.queue.get())
+        try:
+            await preempt(getter)
+            return await getter
+        finally:
+            getter.cancel()
+
+    def close(self):
+        """Stop taking items, the recording thread stops at the next one it records"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
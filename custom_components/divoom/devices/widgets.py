@@ -0,0 +1,243 @@
+"""Provides widgets, numbers, bars, ring gauges and sparklines, drawn straight into the palette index of every pixel without PIL."""
+
+import math
+
+try:
+    import numpy as np
+except ImportError: # the rows of bytes draw exactly the same widgets, only slower
+    np = None
+
+WIDGET_KINDS = ("number", "bar", "gauge", "sparkline")
+BACKGROUND, FOREGROUND, TRACK = 0, 1, 2 # the palette indexes a widget is drawn with
+
+# sprites of the characters a number widget can show, one string per row, 5 rows high
+DIGITS = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "001", "001", "001"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+    "-": ("000", "000", "111", "000", "000"),
+    "%": ("101", "001", "010", "100", "101"),
+    "C": ("111", "100", "100", "100", "111"),
+    "F": ("111", "100", "110", "100", "100"),
+    "°": ("11", "11", "00", "00", "00"),
+    ".": ("0", "0", "0", "0", "1"),
+    ":": ("0", "1", "0", "1", "0"),
+    " ": ("0", "0", "0", "0", "0"),
+}
+DIGIT_HEIGHT = 5
+
+RINGS = {} # the angle of every pixel of the ring gauge, by screen size, as it is the same for every value
+
+def new_canvas(size):
+    """An empty canvas of the size, with every pixel on the background.
+    Returns an array of rows with NumPy, a list of bytearray rows without."""
+    width, height = size
+    if np is not None: return np.zeros((height, width), dtype=np.uint8)
+    return [bytearray(width) for _ in range(height)]
+
+def fill(canvas, box, index):
+    """Set the pixels of the box, given as left, top, right and bottom, to the palette index"""
+    left, top, right, bottom = box
+    if left >= right or top >= bottom: return
+    if np is not None:
+        canvas[top:bottom, left:right] = index
+        return
+    for row in canvas[top:bottom]: row[left:right] = bytes([index]) * (right - left)
+
+def widget_value(widget, value):
+    """The value as the widget needs it: a number, a list of numbers for the sparkline, which also takes them
+    separated by commas, or any text with sprites for the number widget. Returns None if the value does not fit the widget,
+    like nan or inf, which sensors may report and float takes, but no widget can draw."""
+    try:
+        if widget == "sparkline":
+            if isinstance(value, str): value = [part for part in value.replace(",", " ").split() if len(part) > 0]
+            values = tuple(float(item) for item in value)
+            return values if all(math.isfinite(item) for item in values) else None
+        value = float(value)
+        return value if math.isfinite(value) else None
+    except (TypeError, ValueError):
+        if widget == "number" and isinstance(value, str): return value
+        return None
+
+def widget_fraction(value, minimum=None, maximum=None):
+    """How far the value is from minimum to maximum, 0 to 100 by default, between 0 and 1"""
+    if minimum is None: minimum = 0
+    if maximum is None: maximum = 100
+    if maximum <= minimum: return 1.0 if value >= maximum else 0.0
+    return min(1.0, max(0.0, (value - minimum) / (maximum - minimum)))
+
+def number_text(value):
+    """The text a number widget shows for the value, numbers without a fraction that is just zero"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if float(value).is_integer(): return str(int(value))
+        return "{0:.1f}".format(value)
+    return str(value).strip().upper()
+
+def number_width(text, scale):
+    """The width of the text drawn by draw_number, with a blank column between the characters"""
+    widths = [len(DIGITS[character][0]) for character in text if character in DIGITS]
+    if len(widths) == 0: return 0
+    return (sum(widths) + len(widths) - 1) * scale
+
+def number_scale(text, width, height):
+    """The largest scale the text fits into width and height with, or 0 if it does not even fit unscaled"""
+    scale = 0
+    while number_width(text, scale + 1) <= width and DIGIT_HEIGHT * (scale + 1) <= height:
+        scale += 1
+        if number_width(text, scale) == 0: break
+    return scale
+
+def draw_number(canvas, text, origin, scale, index):
+    """Draw the characters of the text that have a sprite, each pixel as a square of scale, starting at origin.
+    Pixels outside the canvas are dropped."""
+    height = len(canvas)
+    width = len(canvas[0])
+    x = origin[0]
+    for character in text:
+        sprite = DIGITS.get(character)
+        if sprite is None: continue
+        for row, line in enumerate(sprite):
+            y = origin[1] + row * scale
+            for column, pixel in enumerate(line):
+                if pixel == "1":
+                    left = x + column * scale
+                    fill(canvas, (max(0, left), max(0, y), min(width, left + scale), min(height, y + scale)), index)
+        x += (len(sprite[0]) + 1) * scale
+
+def draw_centered(canvas, text, box, index):
+    """Draw the text as large as it fits into the box, given as left, top, right and bottom, and centered in it.
+    Text too wide to fit even unscaled loses its first and last columns."""
+    left, top, right, bottom = box
+    scale = max(1, number_scale(text, right - left, bottom - top))
+    width = number_width(text, scale)
+    draw_number(canvas, text, (left + (right - left - width) // 2, top + (bottom - top - DIGIT_HEIGHT * scale) // 2), scale, index)
+
+def draw_bar(canvas, fraction, box, vertical, index, track):
+    """Fill the part of the box given by the fraction with index and the rest with track.
+    Horizontal bars fill from the left, vertical bars from the bottom."""
+    left, top, right, bottom = box
+    fill(canvas, box, track)
+    if vertical:
+        filled = int(round(fraction * (bottom - top)))
+        fill(canvas, (left, bottom - filled, right, bottom), index)
+    else:
+        filled = int(round(fraction * (right - left)))
+        fill(canvas, (left, top, left + filled, bottom), index)
+
+def ring_angles(size, thickness):
+    """The pixels of a ring of the thickness along the edge of a square canvas, with the angle of each of them,
+    clockwise from the top as fraction of a full turn. Pixels outside the ring have an angle of -1."""
+    key = (size, thickness, np is None)
+    angles = RINGS.get(key)
+    if angles is not None: return angles
+
+    center = (size - 1) / 2
+    outer = size / 2
+    inner = outer - thickness
+    rows = []
+    for y in range(size):
+        row = []
+        for x in range(size):
+            dx, dy = x - center, y - center
+            if inner <= math.hypot(dx, dy) < outer:
+                row.append((math.atan2(dx, -dy) / (2 * math.pi)) % 1.0)
+            else: row.append(-1.0)
+        rows.append(row)
+
+    angles = np.array(rows) if np is not None else rows
+    RINGS[key] = angles
+    return angles
+
+def draw_ring(canvas, fraction, thickness, index, track):
+    """Fill a ring along the edge of the canvas with index clockwise from the top, as far as the fraction goes, and the rest with track"""
+    angles = ring_angles(len(canvas), thickness)
+    if np is not None:
+        canvas[angles >= 0] = track
+        canvas[(angles >= 0) & (angles < fraction)] = index
+        return
+
+    for row, angleRow in zip(canvas, angles):
+        for x, angle in enumerate(angleRow):
+            if angle >= 0: row[x] = index if angle < fraction else track
+
+def draw_sparkline(canvas, values, box, index, track, minimum=None, maximum=None):
+    """Draw the last values that fit into the box, one per column with the latest on the right, as connected line with index,
+    and the area below the line with track. The values are scaled from minimum to maximum, their own range by default."""
+    left, top, right, bottom = box
+    values = values[max(0, len(values) - (right - left)):]
+    if len(values) == 0: return
+
+    low = min(values) if minimum is None else minimum
+    high = max(values) if maximum is None else maximum
+    height = bottom - top
+    levels = []
+    for value in values:
+        if high <= low: levels.append((height - 1) // 2)
+        else: levels.append(int(round(min(1.0, max(0.0, (value - low) / (high - low))) * (height - 1))))
+
+    x = right - len(values)
+    previous = levels[0]
+    for level in levels:
+        fill(canvas, (x, bottom - min(level, previous), x + 1, bottom), track)
+        fill(canvas, (x, bottom - 1 - max(level, previous), x + 1, bottom - min(level, previous)), index)
+        previous = level
+        x += 1
+
+def render_widget(widget, value, size, minimum=None, maximum=None, vertical=None):
+    """Draw the widget for the value onto a new canvas of a square screen of the size, with the palette indexes
+    BACKGROUND, FOREGROUND and TRACK. The value is a number, or a list of numbers for the sparkline.
+    Returns the canvas, or None if the widget is unknown."""
+    canvas = new_canvas((size, size))
+    if widget == "number":
+        draw_centered(canvas, number_text(value), (0, 0, size, size), FOREGROUND)
+
+    elif widget == "bar":
+        thickness = max(2, size // 2)
+        start = (size - thickness) // 2
+        box = (start, 1, start + thickness, size - 1) if vertical else (1, start, size - 1, start + thickness)
+        draw_bar(canvas, widget_fraction(value, minimum, maximum), box, vertical, FOREGROUND, TRACK)
+
+    elif widget == "gauge":
+        thickness = max(2, size // 8)
+        draw_ring(canvas, widget_fraction(value, minimum, maximum), thickness, FOREGROUND, TRACK)
+
+        # the number goes into the ring, as large as its corners stay clear of it
+        text = number_text(int(round(value)))
+        inner = size / 2 - thickness
+        scale = number_scale(text, size, size)
+        while scale > 0 and math.hypot((number_width(text, scale) - 1) / 2, (DIGIT_HEIGHT * scale - 1) / 2) >= inner:
+            scale -= 1
+        if scale > 0:
+            width = number_width(text, scale)
+            draw_number(canvas, text, ((size - width) // 2, (size - DIGIT_HEIGHT * scale) // 2), scale, FOREGROUND)
+
+    elif widget == "sparkline":
+        draw_sparkline(canvas, list(value), (1, 1, size - 1, size - 1), FOREGROUND, TRACK, minimum, maximum)
+
+    else: return None
+    return canvas
+
+def canvas_pixels(canvas, palette):
+    """The palette index of every pixel, row by row, and the colors for process_frame.
+    Only the colors of the palette the canvas uses are kept, and each color only once."""
+    if np is not None: used = set(int(index) for index in np.unique(canvas))
+    else: used = set(index for row in canvas for index in row)
+
+    colors = []
+    mapping = list(range(len(palette)))
+    for index, color in enumerate(palette):
+        if index not in used: continue
+        color = list(color[0:3])
+        if color not in colors: colors.append(color)
+        mapping[index] = colors.index(color)
+
+    if np is not None:
+        return np.asarray(mapping, dtype=np.uint8)[canvas].ravel(), colors
+    return [mapping[index] for row in canvas for index in row], colors
@@ -1,5 +1,5 @@
 """Legacy notify service for divoom devices."""
-import logging, os, socket, threading
+import functools, logging, os, socket, threading
 import voluptuous as vol
 
 from homeassistant.core import HomeAssistant
@@ -16,6 +16,8 @@ from homeassistant.components.notify import (
 from homeassistant.const import CONF_HOST, CONF_MAC, CONF_PORT
 from .const import CONF_DEVICE_TYPE, CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT, CONF_ESCAPE_PAYLOAD, DOMAIN  # pylint:disable=unused-import
 from .devices.divoom import DivoomUnsupportedError
+from .devices.commandqueue import BULK, INTERACTIVE, STATE, DivoomCommandQueue
+from .devices.transport import DivoomTransport
 
 _LOGGER = logging.getLogger(__package__)
 
@@ -55,6 +57,20 @@ PARAM_PLAYER2 = 'player2'
 
 PARAM_FILE = 'file'
 PARAM_FONT = 'font'
+PARAM_SCROLL = 'scroll'
+PARAM_LONG_TEXT = 'long_text'
+PARAM_TEMPLATE = 'template'
+PARAM_ENTITY = 'entity'
+PARAM_INTERVAL = 'interval'
+PARAM_WIDGET = 'widget'
+PARAM_MINIMUM = 'minimum'
+PARAM_MAXIMUM = 'maximum'
+PARAM_VERTICAL = 'vertical'
+PARAM_MAX_COLORS = 'max_colors'
+PARAM_TRIM_PALETTE = 'trim_palette'
+PARAM_SAMPLE_FRAMES = 'sample_frames'
+PARAM_RESAMPLE = 'resample'
+PARAM_POLICY = 'policy'
 
 PARAM_RAW = 'raw'
 
@@ -87,10 +103,38 @@ VALID_MODES = [
     'sleep',
     'temperature',
     'text',
+    'ticker',
     'timer',
     'visualization',
     'volume',
     'weather',
+    'widget',
+]
+
+# modes that only set a state, so a newer call replaces one still waiting in the queue. Never modes that trigger something, like gamecontrol or alarm.
+COALESCED_MODES = [
+    'brightness',
+    'clock',
+    'light',
+    'volume',
+    'weather',
+]
+
+# the lanes of the queue besides STATE: interactive modes go first, even in between the messages of a bulk upload
+INTERACTIVE_MODES = [
+    'gamecontrol',
+    'keyboard',
+]
+BULK_MODES = [
+    'image',
+    'text',
+    'ticker',
+]
+
+# uploads that stop the one being sent when called again, unless called with the policy queue
+UPLOAD_MODES = [
+    'image',
+    'text',
 ]
 
 WEATHER_MODES = {
@@ -161,7 +205,7 @@ async def async_get_service(
     loadedServices[mac] = notificationService
     
     try:
-        await hass.async_add_executor_job(notificationService.connect)
+        await notificationService.async_connect(hass)
     except BrokenPipeError as error:
         _LOGGER.error("Error while initially connecting to the Divoom device. %s", error, exc_info=True, stack_info=True)
         pass
@@ -174,6 +218,9 @@ async def async_get_service(
 class DivoomNotificationService(BaseNotificationService):
     """Implement the notification service for Divoom."""
 
+    _transport = None
+    _queue = None
+
     def __init__(self, host, mac, port, device_type, media_directory, font_directory, escape_payload):
         assert mac is not None
         assert port is not None
@@ -231,13 +278,22 @@ class DivoomNotificationService(BaseNotificationService):
         elif not os.path.isdir(media_directory):
             _LOGGER.error("media_directory {0} does not exist, divoom may not work properly".format(media_directory))
 
+        if self._device is not None:
+            self._transport = DivoomTransport(host=self._device.host, mac=mac, port=port, logger=_LOGGER, name=self._device.type)
+            self._device.transport = self._transport
+            self._queue = DivoomCommandQueue(self._async_execute, logger=_LOGGER, name=self._device.type)
+
     def __del__(self):
         if self._device is not None:
             self._device.disconnect()
+        if self._transport is not None:
+            self._transport.close()
 
     def __exit__(self, type, value, traceback):
         if self._device is not None:
             self._device.disconnect()
+        if self._transport is not None:
+            self._transport.close()
 
     def connect(self):
         with self._lock:
@@ -247,6 +303,24 @@ class DivoomNotificationService(BaseNotificationService):
         with self._lock:
             self._device.disconnect()
 
+    async def async_connect(self, hass):
+        """Open the connection to the device from the event loop"""
+        if self._transport is None:
+            return await hass.async_add_executor_job(self.connect)
+        await self._queue.async_call("connect", {})
+
+    async def async_disconnect(self, hass):
+        """Close the connection to the device from the event loop, dropping the commands still waiting for it"""
+        if self._transport is None:
+            return await hass.async_add_executor_job(self.disconnect)
+        await self._queue.async_stop()
+        await self._device.async_disconnect()
+
+    def queue_stats(self):
+        """The depth of the command queue and how long commands waited in it, or None without a queue"""
+        if self._queue is None: return None
+        return self._queue.stats()
+
     def _resolve_colors(self, data):
         """Foreground and background color, either packed into a single color
         list or given as two separate params, which then take precedence."""
@@ -277,6 +351,16 @@ class DivoomNotificationService(BaseNotificationService):
         data = kwargs.get(ATTR_DATA) or {}
         return self.call_mode(data.get(PARAM_MODE) or message, data, continue_on_error=True)
 
+    async def async_send_message(self, message="", **kwargs):
+        if self._transport is None:
+            return await self.hass.async_add_executor_job(functools.partial(self.send_message, message, **kwargs))
+        if message == "" and kwargs.get(ATTR_DATA) is None:
+            _LOGGER.error("Service call needs more information")
+            return False
+
+        data = kwargs.get(ATTR_DATA) or {}
+        return await self.async_call_mode(self.hass, data.get(PARAM_MODE) or message, data, continue_on_error=True)
+
     def call_mode(self, mode, data, continue_on_error=False):
         """Execute a single mode. Shared by send_message() and the divoom.* services."""
         try:
@@ -285,206 +369,269 @@ class DivoomNotificationService(BaseNotificationService):
             if not continue_on_error: raise
             return True # the device already logged the warning, the legacy path stays quiet
 
-    def _call_mode(self, mode, data):
+    async def async_call_mode(self, hass, mode, data, continue_on_error=False, wait=True):
+        """Execute a single mode like call_mode, queued behind the modes called before for this device.
+        A mode in COALESCED_MODES replaces the same mode still waiting. A mode in UPLOAD_MODES replaces the upload still waiting and stops
+        the one being sent at its next chunk, unless its policy is queue. Without wait, it returns right after queueing the mode, with None."""
+        if self._transport is None:
+            return await hass.async_add_executor_job(self.call_mode, mode, data, continue_on_error)
+
+        try:
+            supersede = mode in UPLOAD_MODES and data.get(PARAM_POLICY, "replace") == "replace"
+            key = "upload" if supersede else mode if mode in COALESCED_MODES else None
+            priority = INTERACTIVE if mode in INTERACTIVE_MODES else BULK if mode in BULK_MODES else STATE
+            return await self._queue.async_call(mode, data, wait=wait, key=key, priority=priority, supersede=supersede)
+        except DivoomUnsupportedError:
+            if not continue_on_error: raise
+            return True
+
+    async def _async_execute(self, command):
+        """Execute a mode from the queue, with the device reached through the transport from the event loop.
+        The mode is recorded in the executor and its payloads are sent while it still encodes the rest, and waiting for the device holds no thread.
+        Interactive modes are recorded right away, they are just a message or two. A mode run in between the messages of another one
+        skips the reconnect, as the connection was just used, and the device may still answer the other one.
+        The queue is the only writer, so the lock of call_mode is not taken, which would hold up the event loop while call_mode runs."""
+        mode, data = command.mode, command.data
+        if mode == "connect":
+            await self._device.async_connect()
+            return True
+        if mode == "disconnect":
+            await self._device.async_disconnect()
+            return True
+
+        if not command.injected:
+            skipPing = True if mode == "gamecontrol" or mode == "raw" else False
+            await self._device.async_reconnect(skipPing=skipPing)
+
+        if command.priority == INTERACTIVE:
+            result, outbox = self._device.record(self._dispatch_mode, mode, data)
+            await self._device.async_send_recorded(outbox)
+            return result
+
+        result, _ = await self._device.async_stream(self._dispatch_mode, mode, data, preempt=command.preempt)
+        return result
+
+    def _call_mode(self, mode, data, reconnect=True):
         with self._lock:
-            if mode != "connect" and mode != "disconnect":
+            if reconnect and mode != "connect" and mode != "disconnect":
                 skipPing = True if mode == "gamecontrol" or mode == "raw" else False
                 self._device.reconnect(skipPing=skipPing)
 
-            if mode == "connect":
-                self._device.connect()
+            return self._dispatch_mode(mode, data)
 
-            elif mode == "disconnect":
-                self._device.disconnect()
+    def _dispatch_mode(self, mode, data):
+        if mode == "connect":
+            self._device.connect()
 
-            elif mode == 'on':
-                self._device.send_on()
+        elif mode == "disconnect":
+            self._device.disconnect()
 
-            elif mode == 'off':
-                self._device.send_off()
-        
-            elif mode == "alarm":
-                number = data.get(PARAM_NUMBER)
-                time = data.get(PARAM_VALUE)
-                weekdays = data.get(PARAM_WEEKDAY)
-                alarm_mode = data.get(PARAM_ALARMMODE)
-                trigger_mode = data.get(PARAM_TRIGGERMODE)
-                frequency = data.get(PARAM_FREQUENCY)
-                volume = data.get(PARAM_VOLUME)
-                self._device.show_alarm(number=number, time=time, weekdays=weekdays, alarmMode=alarm_mode, triggerMode=trigger_mode, frequency=frequency, volume=volume)
-
-            elif mode == "brightness":
-                value = data.get(PARAM_BRIGHTNESS)
-                if value is None: value = data.get(PARAM_NUMBER)
-                if value is None: value = data.get(PARAM_VALUE)
-                self._device.send_brightness(value=value)
-
-            elif mode == "clock":
-                clock = data.get(PARAM_CLOCK)
-                twentyfour = data.get(PARAM_TWENTYFOUR)
-                weather = data.get(PARAM_WEATHER)
-                temp = data.get(PARAM_TEMP)
-                calendar = data.get(PARAM_CALENDAR)
-                color = data.get(PARAM_COLOR)
-                hot = data.get(PARAM_HOT)
-                self._device.show_clock(clock=clock, twentyfour=twentyfour, weather=weather, temp=temp, calendar=calendar, color=color, hot=hot)
-
-            elif mode == "countdown":
-                value = data.get(PARAM_VALUE)
-                countdown = data.get(PARAM_COUNTDOWN)
-                self._device.show_countdown(value=value, countdown=countdown)
-
-            elif mode == "datetime":
-                value = data.get(PARAM_VALUE)
-                self._device.send_datetime(value=value)
-
-            elif mode == "design":
-                number = data.get(PARAM_NUMBER)
-                self._device.show_design(number=number)
-
-            elif mode == "effects":
-                number = data.get(PARAM_NUMBER)
-                self._device.show_effects(number=number)
-
-            elif mode == "equalizer":
-                number = data.get(PARAM_NUMBER)
-                audioMode = data.get(PARAM_AUDIOMODE)
-                backgroundMode = data.get(PARAM_BACKGROUNDMODE)
-                streamMode = data.get(PARAM_STREAMMODE)
-                self._device.show_equalizer(number=number, audioMode=audioMode, backgroundMode=backgroundMode, streamMode=streamMode)
-
-            elif mode == "game":
-                value = data.get(PARAM_VALUE)
-                self._device.show_game(value=value)
-
-            elif mode == "gamecontrol":
-                value = data.get(PARAM_VALUE)
-                self._device.send_gamecontrol(value=value)
-
-            elif mode == "image":
-                image_file = data.get(PARAM_FILE)
-                if image_file is None:
-                    _LOGGER.error("Service call needs a file")
-                    return False
-                image_path = self._resolve_path(self._media_directory, image_file)
-                if image_path is None:
-                    _LOGGER.error("file '{0}' is outside of the configured media directory".format(image_file))
-                    return False
-                time = data.get(PARAM_TIME)
-                self._device.show_image(image_path, time=time)
-
-            elif mode == "keyboard":
-                value = data.get(PARAM_VALUE)
-                self._device.send_keyboard(value=value)
-
-            elif mode == "light":
-                brightness = data.get(PARAM_BRIGHTNESS)
-                color = data.get(PARAM_COLOR)
-                self._device.show_light(color=color, brightness=brightness, power=True)
-
-            elif mode == "lyrics":
-                self._device.show_lyrics()
-
-            elif mode == "memorial":
-                number = data.get(PARAM_NUMBER)
-                value = data.get(PARAM_VALUE)
-                text = data.get(PARAM_TEXT)
-                self._device.show_memorial(number=number, value=value, text=text, animate=True)
-
-            elif mode == "noise":
-                value = data.get(PARAM_VALUE)
-                self._device.show_noise(value=value)
-
-            elif mode == "playstate":
-                value = data.get(PARAM_VALUE)
-                self._device.send_playstate(value=value)
-
-            elif mode == "radio":
-                value = data.get(PARAM_VALUE)
-                frequency = data.get(PARAM_FREQUENCY)
-                self._device.show_radio(value=value, frequency=frequency)
-
-            elif mode == "raw":
-                raw = data.get(PARAM_RAW)
-                if not raw:
-                    _LOGGER.error("Service call needs a raw command")
+        elif mode == 'on':
+            self._device.send_on()
+
+        elif mode == 'off':
+            self._device.send_off()
+
+        elif mode == "alarm":
+            number = data.get(PARAM_NUMBER)
+            time = data.get(PARAM_VALUE)
+            weekdays = data.get(PARAM_WEEKDAY)
+            alarm_mode = data.get(PARAM_ALARMMODE)
+            trigger_mode = data.get(PARAM_TRIGGERMODE)
+            frequency = data.get(PARAM_FREQUENCY)
+            volume = data.get(PARAM_VOLUME)
+            self._device.show_alarm(number=number, time=time, weekdays=weekdays, alarmMode=alarm_mode, triggerMode=trigger_mode, frequency=frequency, volume=volume)
+
+        elif mode == "brightness":
+            value = data.get(PARAM_BRIGHTNESS)
+            if value is None: value = data.get(PARAM_NUMBER)
+            if value is None: value = data.get(PARAM_VALUE)
+            self._device.send_brightness(value=value)
+
+        elif mode == "clock":
+            clock = data.get(PARAM_CLOCK)
+            twentyfour = data.get(PARAM_TWENTYFOUR)
+            weather = data.get(PARAM_WEATHER)
+            temp = data.get(PARAM_TEMP)
+            calendar = data.get(PARAM_CALENDAR)
+            color = data.get(PARAM_COLOR)
+            hot = data.get(PARAM_HOT)
+            self._device.show_clock(clock=clock, twentyfour=twentyfour, weather=weather, temp=temp, calendar=calendar, color=color, hot=hot)
+
+        elif mode == "countdown":
+            value = data.get(PARAM_VALUE)
+            countdown = data.get(PARAM_COUNTDOWN)
+            self._device.show_countdown(value=value, countdown=countdown)
+
+        elif mode == "datetime":
+            value = data.get(PARAM_VALUE)
+            self._device.send_datetime(value=value)
+
+        elif mode == "design":
+            number = data.get(PARAM_NUMBER)
+            self._device.show_design(number=number)
+
+        elif mode == "effects":
+            number = data.get(PARAM_NUMBER)
+            self._device.show_effects(number=number)
+
+        elif mode == "equalizer":
+            number = data.get(PARAM_NUMBER)
+            audioMode = data.get(PARAM_AUDIOMODE)
+            backgroundMode = data.get(PARAM_BACKGROUNDMODE)
+            streamMode = data.get(PARAM_STREAMMODE)
+            self._device.show_equalizer(number=number, audioMode=audioMode, backgroundMode=backgroundMode, streamMode=streamMode)
+
+        elif mode == "game":
+            value = data.get(PARAM_VALUE)
+            self._device.show_game(value=value)
+
+        elif mode == "gamecontrol":
+            value = data.get(PARAM_VALUE)
+            self._device.send_gamecontrol(value=value)
+
+        elif mode == "image":
+            image_file = data.get(PARAM_FILE)
+            if image_file is None:
+                _LOGGER.error("Service call needs a file")
+                return False
+            image_path = self._resolve_path(self._media_directory, image_file)
+            if image_path is None:
+                _LOGGER.error("file '{0}' is outside of the configured media directory".format(image_file))
+                return False
+            time = data.get(PARAM_TIME)
+            maxColors = data.get(PARAM_MAX_COLORS)
+            trimPalette = data.get(PARAM_TRIM_PALETTE)
+            sampleFrames = data.get(PARAM_SAMPLE_FRAMES)
+            resample = data.get(PARAM_RESAMPLE)
+            self._device.show_image(image_path, time=time, maxColors=maxColors, trimPalette=trimPalette, sampleFrames=sampleFrames, resample=resample)
+
+        elif mode == "keyboard":
+            value = data.get(PARAM_VALUE)
+            self._device.send_keyboard(value=value)
+
+        elif mode == "light":
+            brightness = data.get(PARAM_BRIGHTNESS)
+            color = data.get(PARAM_COLOR)
+            self._device.show_light(color=color, brightness=brightness, power=True)
+
+        elif mode == "lyrics":
+            self._device.show_lyrics()
+
+        elif mode == "memorial":
+            number = data.get(PARAM_NUMBER)
+            value = data.get(PARAM_VALUE)
+            text = data.get(PARAM_TEXT)
+            self._device.show_memorial(number=number, value=value, text=text, animate=True)
+
+        elif mode == "noise":
+            value = data.get(PARAM_VALUE)
+            self._device.show_noise(value=value)
+
+        elif mode == "playstate":
+            value = data.get(PARAM_VALUE)
+            self._device.send_playstate(value=value)
+
+        elif mode == "radio":
+            value = data.get(PARAM_VALUE)
+            frequency = data.get(PARAM_FREQUENCY)
+            self._device.show_radio(value=value, frequency=frequency)
+
+        elif mode == "raw":
+            raw = data.get(PARAM_RAW)
+            if not raw:
+                _LOGGER.error("Service call needs a raw command")
+                return False
+            self._device.send_command(command=raw[0], args=raw[1:])
+
+        elif mode == "scoreboard":
+            player1 = data.get(PARAM_PLAYER1)
+            player2 = data.get(PARAM_PLAYER2)
+            self._device.show_scoreboard(blue=player1, red=player2)
+
+        elif mode == "signal":
+            number = data.get(PARAM_NUMBER)
+            color1, color2 = self._resolve_colors(data)
+            self._device.show_signal(number=number, color1=color1, color2=color2)
+
+        elif mode == "sleep":
+            sleepvalue = data.get(PARAM_VALUE)
+            sleeptime = data.get(PARAM_TIME)
+            sleepmode = data.get(PARAM_SLEEPMODE)
+            volume = data.get(PARAM_VOLUME)
+            color = data.get(PARAM_COLOR)
+            brightness = data.get(PARAM_BRIGHTNESS)
+            frequency = data.get(PARAM_FREQUENCY)
+            self._device.show_sleep(sleepvalue, sleeptime, sleepmode, volume, color, brightness, frequency)
+
+        elif mode == "temperature":
+            value = data.get(PARAM_TEMP) or data.get(PARAM_VALUE)
+            color = data.get(PARAM_COLOR)
+            self._device.show_temperature(value=value, color=color)
+
+        elif mode == "text" or mode == "ticker":
+            text = data.get(PARAM_TEXT) or data.get(PARAM_VALUE)
+            font_file = data.get(PARAM_FONT)
+            font_path = None
+            if font_file is not None:
+                font_path = self._resolve_path(self._font_directory, font_file)
+                if font_path is None:
+                    _LOGGER.error("font '{0}' is outside of the configured font directory".format(font_file))
                     return False
-                self._device.send_command(command=raw[0], args=raw[1:])
-
-            elif mode == "scoreboard":
-                player1 = data.get(PARAM_PLAYER1)
-                player2 = data.get(PARAM_PLAYER2)
-                self._device.show_scoreboard(blue=player1, red=player2)
-
-            elif mode == "signal":
-                number = data.get(PARAM_NUMBER)
-                color1, color2 = self._resolve_colors(data)
-                self._device.show_signal(number=number, color1=color1, color2=color2)
-
-            elif mode == "sleep":
-                sleepvalue = data.get(PARAM_VALUE)
-                sleeptime = data.get(PARAM_TIME)
-                sleepmode = data.get(PARAM_SLEEPMODE)
-                volume = data.get(PARAM_VOLUME)
-                color = data.get(PARAM_COLOR)
-                brightness = data.get(PARAM_BRIGHTNESS)
-                frequency = data.get(PARAM_FREQUENCY)
-                self._device.show_sleep(sleepvalue, sleeptime, sleepmode, volume, color, brightness, frequency)
-
-            elif mode == "temperature":
-                value = data.get(PARAM_TEMP) or data.get(PARAM_VALUE)
-                color = data.get(PARAM_COLOR)
-                self._device.show_temperature(value=value, color=color)
-
-            elif mode == "text":
-                text = data.get(PARAM_TEXT) or data.get(PARAM_VALUE)
-                font_file = data.get(PARAM_FONT)
-                font_path = None
-                if font_file is not None:
-                    font_path = self._resolve_path(self._font_directory, font_file)
-                    if font_path is None:
-                        _LOGGER.error("font '{0}' is outside of the configured font directory".format(font_file))
-                        return False
-                size = data.get(PARAM_SIZE)
-                time = data.get(PARAM_TIME)
-                color1, color2 = self._resolve_colors(data)
-                self._device.show_text(text, font_path, size=size, time=time, color1=color1, color2=color2)
-
-            elif mode == "timer":
-                value = data.get(PARAM_VALUE)
-                self._device.show_timer(value=value)
-
-            elif mode == "visualization":
-                number = data.get(PARAM_NUMBER)
-                color1, color2 = self._resolve_colors(data)
-                self._device.show_visualization(number=number, color1=color1, color2=color2)
-
-            elif mode == "volume":
-                value = data.get(PARAM_VOLUME) or data.get(PARAM_NUMBER) or data.get(PARAM_VALUE)
-                self._device.send_volume(value=value)
-
-            elif mode == "weather":
-                value = data.get(PARAM_VALUE)
-                unit = data.get(PARAM_UNIT)
-                weather = data.get(PARAM_WEATHER)
-
-                weathernum = None
-                if isinstance(weather, int):
-                    weathernum = weather
-                elif isinstance(weather, float):
-                    weathernum = round(weather)
-                elif isinstance(weather, str):
-                    weathernum = WEATHER_MODES.get(weather) or None
-
-                self._device.send_weather(value=value, weather=weathernum, unit=unit)
-
+            size = data.get(PARAM_SIZE)
+            time = data.get(PARAM_TIME)
+            color1, color2 = self._resolve_colors(data)
+            scroll = data.get(PARAM_SCROLL)
+            if mode == "ticker":
+                self._device.show_ticker(text, font_path, size=size, time=time, color1=color1, color2=color2, scroll=scroll)
             else:
-                validModes = ""
-                for validMode in VALID_MODES:
-                    if len(validModes) > 0: validModes += ", "
-                    validModes += "'{0}'".format(validMode)
+                longText = data.get(PARAM_LONG_TEXT)
+                self._device.show_text(text, font_path, size=size, time=time, color1=color1, color2=color2, scroll=scroll, longText=longText)
+
+        elif mode == "timer":
+            value = data.get(PARAM_VALUE)
+            self._device.show_timer(value=value)
+
+        elif mode == "visualization":
+            number = data.get(PARAM_NUMBER)
+            color1, color2 = self._resolve_colors(data)
+            self._device.show_visualization(number=number, color1=color1, color2=color2)
+
+        elif mode == "volume":
+            value = data.get(PARAM_VOLUME) or data.get(PARAM_NUMBER) or data.get(PARAM_VALUE)
+            self._device.send_volume(value=value)
+
+        elif mode == "weather":
+            value = data.get(PARAM_VALUE)
+            unit = data.get(PARAM_UNIT)
+            weather = data.get(PARAM_WEATHER)
+
+            weathernum = None
+            if isinstance(weather, int):
+                weathernum = weather
+            elif isinstance(weather, float):
+                weathernum = round(weather)
+            elif isinstance(weather, str):
+                weathernum = WEATHER_MODES.get(weather) or None
+
+            self._device.send_weather(value=value, weather=weathernum, unit=unit)
+
+        elif mode == "widget":
+            widget = data.get(PARAM_WIDGET)
+            value = data.get(PARAM_VALUE)
+            minimum = data.get(PARAM_MINIMUM)
+            maximum = data.get(PARAM_MAXIMUM)
+            vertical = data.get(PARAM_VERTICAL)
+            color1, color2 = self._resolve_colors(data)
+            self._device.show_widget(widget, value, minimum=minimum, maximum=maximum, vertical=vertical, color1=color1, color2=color2)
+
+        else:
+            validModes = ""
+            for validMode in VALID_MODES:
+                if len(validModes) > 0: validModes += ", "
+                validModes += "'{0}'".format(validMode)
+
+            _LOGGER.error("Invalid mode '{0}'. Must be one of: {1}".format(mode, validModes))
+            return False
 
-                _LOGGER.error("Invalid mode '{0}'. Must be one of: {1}".format(mode, validModes))
-                return False
-        
-            return True
+        return True
@@ -11,7 +11,10 @@ from homeassistant.util.yaml import load_yaml_dict
 
 from homeassistant.const import CONF_MAC, CONF_NAME
 from .const import CONF_DEVICE, DOMAIN
+from .devices.commandqueue import DivoomQueueFullError
 from .devices.divoom import DivoomUnsupportedError
+from .devices.widgets import WIDGET_KINDS
+from .ticker import DivoomTicker, entity_template
 from .notify import (
     PARAM_ALARMMODE,
     PARAM_AUDIOMODE,
@@ -22,28 +25,42 @@ from .notify import (
     PARAM_CLOCK,
     PARAM_COLOR,
     PARAM_COUNTDOWN,
+    PARAM_ENTITY,
     PARAM_FILE,
     PARAM_FONT,
     PARAM_FOREGROUND_COLOR,
     PARAM_FREQUENCY,
     PARAM_HOT,
+    PARAM_INTERVAL,
+    PARAM_MAX_COLORS,
+    PARAM_MAXIMUM,
+    PARAM_MINIMUM,
     PARAM_NUMBER,
     PARAM_PLAYER1,
     PARAM_PLAYER2,
     PARAM_RAW,
+    PARAM_RESAMPLE,
+    PARAM_POLICY,
+    PARAM_SAMPLE_FRAMES,
+    PARAM_SCROLL,
+    PARAM_LONG_TEXT,
     PARAM_SIZE,
     PARAM_SLEEPMODE,
     PARAM_STREAMMODE,
     PARAM_TEMP,
+    PARAM_TEMPLATE,
     PARAM_TEXT,
     PARAM_TIME,
+    PARAM_TRIM_PALETTE,
     PARAM_TRIGGERMODE,
     PARAM_TWENTYFOUR,
     PARAM_UNIT,
     PARAM_VALUE,
+    PARAM_VERTICAL,
     PARAM_VOLUME,
     PARAM_WEATHER,
     PARAM_WEEKDAY,
+    PARAM_WIDGET,
     WEATHER_MODES,
 )
 
@@ -75,6 +92,8 @@ FREQUENCY = vol.All(vol.Coerce(float), vol.Range(min=64, max=108))
 KEYBOARD_VALUES = ["previous", "toggle", "next"]
 GAMECONTROL_VALUES = ["go", "left", "right", "up", "down", "ok"]
 TEMPERATURE_UNITS = ["°C", "°F"]
+RESAMPLE_VALUES = ["nearest", "box", "bilinear", "hamming", "bicubic", "lanczos"]
+POLICY_VALUES = ["replace", "queue"]
 
 # a plain number from the UI, or the combined "25°C" the README documents
 TEMPERATURE = vol.Any(
@@ -112,6 +131,12 @@ SERVICE_SCHEMAS = {
         **TARGET_SCHEMA,
         vol.Required(PARAM_FILE): cv.string,
         vol.Optional(PARAM_TIME): WORD,
+        # a palette index never needs more than a byte
+        vol.Optional(PARAM_MAX_COLORS): vol.All(vol.Coerce(int), vol.Range(min=2, max=256)),
+        vol.Optional(PARAM_TRIM_PALETTE): cv.boolean,
+        vol.Optional(PARAM_SAMPLE_FRAMES): cv.boolean,
+        vol.Optional(PARAM_RESAMPLE): vol.In(RESAMPLE_VALUES),
+        vol.Optional(PARAM_POLICY): vol.In(POLICY_VALUES),
     }),
     "text": vol.Schema({
         **TARGET_SCHEMA,
@@ -122,6 +147,23 @@ SERVICE_SCHEMAS = {
         vol.Optional(PARAM_TIME): WORD,
         vol.Optional(PARAM_FOREGROUND_COLOR): RGB,
         vol.Optional(PARAM_BACKGROUND_COLOR): RGB,
+        vol.Optional(PARAM_SCROLL): cv.boolean,
+        vol.Optional(PARAM_LONG_TEXT): cv.boolean,
+        vol.Optional(PARAM_POLICY): vol.In(POLICY_VALUES),
+    }),
+    # a fixed text, or a template or an entity to follow - without any of them the ticker stops
+    "ticker": vol.Schema({
+        **TARGET_SCHEMA,
+        vol.Exclusive(PARAM_TEXT, "source"): cv.string,
+        vol.Exclusive(PARAM_TEMPLATE, "source"): cv.template,
+        vol.Exclusive(PARAM_ENTITY, "source"): cv.entity_id,
+        vol.Optional(PARAM_INTERVAL): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+        vol.Optional(PARAM_FONT): cv.string,
+        vol.Optional(PARAM_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(PARAM_TIME): WORD,
+        vol.Optional(PARAM_FOREGROUND_COLOR): RGB,
+        vol.Optional(PARAM_BACKGROUND_COLOR): RGB,
+        vol.Optional(PARAM_SCROLL): cv.boolean,
     }),
     "design": vol.Schema({
         **TARGET_SCHEMA,
@@ -235,6 +277,17 @@ SERVICE_SCHEMAS = {
         vol.Required(PARAM_VALUE): vol.In(TEMPERATURE_UNITS),
         vol.Optional(PARAM_COLOR): RGB,
     }),
+    # a number for most widgets, a list of numbers for the sparkline, or a text like "12:30" for the number widget
+    "widget": vol.Schema({
+        **TARGET_SCHEMA,
+        vol.Required(PARAM_WIDGET): vol.In(WIDGET_KINDS),
+        vol.Required(PARAM_VALUE): vol.Any([vol.Coerce(float)], vol.Coerce(float), cv.string),
+        vol.Optional(PARAM_MINIMUM): vol.Coerce(float),
+        vol.Optional(PARAM_MAXIMUM): vol.Coerce(float),
+        vol.Optional(PARAM_VERTICAL): cv.boolean,
+        vol.Optional(PARAM_FOREGROUND_COLOR): RGB,
+        vol.Optional(PARAM_BACKGROUND_COLOR): RGB,
+    }),
     "raw": vol.Schema({
         **TARGET_SCHEMA,
         vol.Required(PARAM_RAW): vol.All(cv.ensure_list, vol.Length(min=1)),
@@ -285,33 +338,69 @@ def _resolve_target(hass: HomeAssistant, data):
 
     return loadedServices[mac]
 
+async def _async_call_mode(hass: HomeAssistant, service, mode: str, params) -> None:
+    try:
+        result = await service.async_call_mode(hass, mode, params)
+    except DivoomUnsupportedError as err:
+        raise HomeAssistantError(
+            translation_domain=DOMAIN,
+            translation_key="mode_unsupported",
+            translation_placeholders={"device": err.device, "mode": mode},
+        ) from err
+    except DivoomQueueFullError as err:
+        raise HomeAssistantError(
+            translation_domain=DOMAIN,
+            translation_key="queue_full",
+            translation_placeholders={"device": err.device, "mode": mode, "depth": str(err.depth)},
+        ) from err
+
+    if not result:
+        raise HomeAssistantError(
+            translation_domain=DOMAIN,
+            translation_key="mode_failed",
+            translation_placeholders={"mode": mode},
+        )
+
 def _make_handler(mode: str):
     async def _handle(call: ServiceCall) -> None:
         service = _resolve_target(call.hass, call.data)
         params = {key: value for key, value in call.data.items() if key != CONF_DEVICE}
-
-        try:
-            result = await call.hass.async_add_executor_job(service.call_mode, mode, params)
-        except DivoomUnsupportedError as err:
-            raise HomeAssistantError(
-                translation_domain=DOMAIN,
-                translation_key="mode_unsupported",
-                translation_placeholders={"device": err.device, "mode": mode},
-            ) from err
-
-        if not result:
-            raise HomeAssistantError(
-                translation_domain=DOMAIN,
-                translation_key="mode_failed",
-                translation_placeholders={"mode": mode},
-            )
+        await _async_call_mode(call.hass, service, mode, params)
 
     return _handle
 
+@callback
+def async_stop_ticker(hass: HomeAssistant, service) -> None:
+    """Stop the ticker bound to the device, if there is one."""
+    ticker = hass.data.get(DOMAIN, {}).get('tickers', {}).pop(service, None)
+    if ticker is not None: ticker.async_stop()
+
+async def _handle_ticker(call: ServiceCall) -> None:
+    """Bind a template or an entity to the device, or show a fixed text instead. Without either the ticker just stops."""
+    service = _resolve_target(call.hass, call.data)
+    async_stop_ticker(call.hass, service)
+
+    template = call.data.get(PARAM_TEMPLATE)
+    entity = call.data.get(PARAM_ENTITY)
+    if template is None and entity is None:
+        if call.data.get(PARAM_TEXT) is not None:
+            params = {key: value for key, value in call.data.items() if key not in (CONF_DEVICE, PARAM_INTERVAL)}
+            await _async_call_mode(call.hass, service, "ticker", params)
+        return
+
+    if template is None: template = entity_template(call.hass, entity)
+    template.hass = call.hass
+    params = {key: value for key, value in call.data.items() if key not in (CONF_DEVICE, PARAM_TEMPLATE, PARAM_ENTITY, PARAM_INTERVAL)}
+
+    ticker = DivoomTicker(call.hass, service, template, params, call.data.get(PARAM_INTERVAL))
+    call.hass.data[DOMAIN].setdefault('tickers', {})[service] = ticker
+    ticker.async_start()
+
 @callback
 def async_setup_services(hass: HomeAssistant) -> None:
     for mode, schema in SERVICE_SCHEMAS.items():
-        hass.services.async_register(DOMAIN, mode, _make_handler(mode), schema=schema)
+        handler = _handle_ticker if mode == "ticker" else _make_handler(mode)
+        hass.services.async_register(DOMAIN, mode, handler, schema=schema)
 
     _LOGGER.debug("Divoom: successfully registered {} services".format(len(SERVICE_SCHEMAS)))
 
@@ -0,0 +1,104 @@
+"""Tickers for divoom devices, which keep a template or the state of an entity on the screen as text."""
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import TemplateError
+from homeassistant.helpers.event import TrackTemplate, async_call_later, async_track_template_result
+from homeassistant.helpers.template import Template
+
+from .const import DOMAIN
+from .notify import PARAM_TEXT
+
+_LOGGER = logging.getLogger(__package__)
+
+TICKER_INTERVAL = 5 # seconds between two updates of a ticker at least, if the call does not set an interval
+
+def entity_template(hass: HomeAssistant, entity_id: str) -> Template:
+    """The state of the entity with its unit, as a template."""
+    return Template("{{{{ states('{0}', with_unit=True) }}}}".format(entity_id), hass)
+
+class DivoomTicker:
+    """Shows the result of a template as ticker text whenever it changes, but no more often than once per interval.
+    Changes in between are not queued up, only the latest one is shown once the interval is over."""
+
+    def __init__(self, hass: HomeAssistant, service, template: Template, params, interval=None):
+        self._hass = hass
+        self._service = service
+        self._template = template
+        self._params = params
+        self._interval = TICKER_INTERVAL if interval is None else interval
+
+        self._info = None
+        self._later = None
+        self._busy = False
+        self._stopped = False
+        self._text = None
+        self._shown = None
+        self._updated = None
+
+    @callback
+    def async_start(self) -> None:
+        """Follow the template and show its current result right away."""
+        self._info = async_track_template_result(self._hass, [TrackTemplate(self._template, None)], self._async_template_changed)
+        self._info.async_refresh()
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop following the template. An update that is sent already still finishes."""
+        self._stopped = True
+        if self._info is not None:
+            self._info.async_remove()
+            self._info = None
+        if self._later is not None:
+            self._later()
+            self._later = None
+
+    @callback
+    def _async_template_changed(self, event, updates) -> None:
+        result = updates.pop().result
+        if not isinstance(result, TemplateError):
+            try: # the tracked result is parsed into a number or list, which would turn "05" into "5"
+                result = self._template.async_render(parse_result=False)
+            except TemplateError as error:
+                result = error
+        if isinstance(result, TemplateError):
+            _LOGGER.error("Divoom: ticker template failed to render: {0}".format(result))
+            return
+
+        self._text = result
+        self._async_schedule()
+
+    @callback
+    def _async_schedule(self) -> None:
+        """Send the latest text now, or when the interval since the last update is over."""
+        if self._stopped or self._busy or self._later is not None or self._text == self._shown:
+            return
+
+        wait = 0 if self._updated is None else self._updated + self._interval - self._hass.loop.time()
+        if wait > 0:
+            self._later = async_call_later(self._hass, wait, self._async_interval_over)
+            return
+
+        self._hass.async_create_background_task(self._async_update(), "{0} ticker update".format(DOMAIN))
+
+    @callback
+    def _async_interval_over(self, _now) -> None:
+        self._later = None
+        if self._stopped or self._busy or self._text == self._shown:
+            return
+
+        self._hass.async_create_background_task(self._async_update(), "{0} ticker update".format(DOMAIN))
+
+    async def _async_update(self) -> None:
+        text = self._text
+        self._busy = True
+        self._updated = self._hass.loop.time()
+        try:
+            await self._service.async_call_mode(self._hass, "ticker", {**self._params, PARAM_TEXT: text})
+            self._shown = text
+        except Exception as error: # pylint: disable=broad-except
+            _LOGGER.error("Divoom: ticker update failed: %s", error, exc_info=True)
+        finally:
+            self._busy = False
+
+        self._async_schedule() # the text may have changed while it was sent
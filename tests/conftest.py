@@ -0,0 +1,27 @@
+"""The caches of Divoom are class attributes shared by every device in the
+process, so a frame, font or widget one test put there would otherwise be
+found by the next one, and what a test sees would depend on the tests that
+ran before it. Every test starts and ends with all of them empty.
+
+The socket pairs of tests.support are drained by a thread each, which is
+waited for after the test, so no test leaves a thread behind.
+"""
+import pytest
+
+from custom_components.divoom.devices.divoom import Divoom
+from tests.support import join_drainers
+
+CACHES = [Divoom.frameCache, Divoom.rasterCache, Divoom.fontCache, Divoom.textWidthCache, Divoom.textStripCache, Divoom.widgetCache]
+
+
+@pytest.fixture(autouse=True)
+def _empty_caches():
+    for cache in CACHES: cache.clear()
+    yield
+    for cache in CACHES: cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def _join_drainers():
+    yield
+    join_drainers()
@@ -7,8 +7,10 @@ reaches the mock and with what arguments.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import socket
 import threading
 import time
 from unittest.mock import Mock, patch
@@ -19,11 +21,13 @@ from homeassistant.components.notify import ATTR_DATA
 
 from custom_components.divoom.const import CONF_DEVICE_TYPE, CONF_MEDIA_DIR, DOMAIN
 from custom_components.divoom.notify import (
+    PARAM_BRIGHTNESS,
     PARAM_COLOR,
     PARAM_FILE,
     PARAM_FONT,
     PARAM_MODE,
     PARAM_NUMBER,
+    PARAM_POLICY,
     PARAM_RAW,
     PARAM_TEXT,
     PARAM_TIME,
@@ -49,12 +53,12 @@ def make_mocked_service(media_directory="pixelart", font_directory="fonts"):
 
 async def test_async_get_service_registers_and_picks_device_class(hass):
     """Service setup wires up the right device class for device_type and
-    registers the service under its MAC in hass.data. connect() is patched
+    registers the service under its MAC in hass.data. async_connect() is patched
     out: it would open a real Bluetooth RFCOMM socket, which is out of
     scope here (and pytest-socket blocks connect() to any non-localhost
     host anyway, regardless of platform) - async_get_service's own wiring
     is what's under test, not the socket connection itself."""
-    with patch.object(DivoomNotificationService, "connect"):
+    with patch.object(DivoomNotificationService, "async_connect"):
         service = await async_get_service(
             hass,
             {
@@ -73,7 +77,7 @@ async def test_async_get_service_invalid_device_type_logs_device_type(hass, capl
     """The error message used to format media_directory into the
     "device_type {0} does not exist" string instead of device_type itself."""
     caplog.set_level(logging.ERROR)
-    with patch.object(DivoomNotificationService, "connect"):
+    with patch.object(DivoomNotificationService, "async_connect"):
         service = await async_get_service(
             hass,
             {
@@ -112,7 +116,7 @@ def test_send_message_text_mode_splits_color_and_calls_show_text():
 
     assert result is True
     service._device.show_text.assert_called_once_with(
-        "hello", None, size=None, time=None, color1=[255, 0, 0], color2=[0, 255, 0]
+        "hello", None, size=None, time=None, color1=[255, 0, 0], color2=[0, 255, 0], scroll=None, longText=None
     )
 
 
@@ -166,7 +170,7 @@ def test_send_message_image_mode_joins_media_directory_and_calls_show_image():
 
     assert result is True
     service._device.show_image.assert_called_once_with(
-        os.path.join("/media/pixelart", "smiley32.gif"), time=5
+        os.path.join("/media/pixelart", "smiley32.gif"), time=5, maxColors=None, trimPalette=None, sampleFrames=None, resample=None
     )
 
 
@@ -202,7 +206,7 @@ def test_send_message_text_mode_without_font_still_calls_show_text():
 
     assert result is True
     service._device.show_text.assert_called_once_with(
-        "hello", None, size=None, time=None, color1=None, color2=None
+        "hello", None, size=None, time=None, color1=None, color2=None, scroll=None, longText=None
     )
 
 
@@ -355,3 +359,106 @@ def test_send_message_different_devices_do_not_block_each_other():
 
     release_a.set()
     thread_a.join(timeout=2)
+
+
+async def test_async_call_mode_sends_through_the_transport(hass, tmp_path):
+    """With a transport, the mode is only recorded in the executor and the
+    payloads go out from the event loop, the same bytes the blocking socket
+    would have sent, after the ping of the reconnect."""
+    service = DivoomNotificationService(None, "11:22:33:44:55:66", 1, "pixoo", str(tmp_path), "fonts", None)
+    device = service._device
+    server_sock, client_sock = socket.socketpair()
+    client_sock.setblocking(False)
+    service._transport.socket = client_sock
+
+    assert await service.async_call_mode(hass, "brightness", {PARAM_BRIGHTNESS: 50}) is True
+
+    sent = server_sock.recv(1024)
+    ping = device.make_message(device.make_command("get view", []))
+    brightness = device.make_message(device.make_command("set brightness", [50]))
+    assert sent == bytes(ping + brightness)
+    assert device.socket is None # the blocking socket is never opened
+    service._transport.close()
+    server_sock.close()
+
+
+async def test_async_call_mode_coalesces_only_states(hass, tmp_path):
+    """A slider firing brightness again and again only sends the newest
+    value, while every gamecontrol keypress is sent."""
+    service = DivoomNotificationService(None, "11:22:33:44:55:66", 1, "pixoo", str(tmp_path), "fonts", None)
+    executed = []
+
+    async def execute(command):
+        executed.append((command.mode, command.data))
+        return True
+    service._queue.execute = execute
+
+    calls = [
+        ("image", {}), ("brightness", {PARAM_BRIGHTNESS: 10}), ("gamecontrol", {PARAM_VALUE: "left"}),
+        ("brightness", {PARAM_BRIGHTNESS: 20}), ("alarm", {PARAM_NUMBER: 1}), ("alarm", {PARAM_NUMBER: 1}),
+        ("gamecontrol", {PARAM_VALUE: "left"}), ("brightness", {PARAM_BRIGHTNESS: 30}),
+    ]
+    results = await asyncio.gather(*(service.async_call_mode(hass, mode, data) for mode, data in calls))
+
+    assert results == [True] * len(calls)
+    assert executed == [ # by lane, the keypresses first and the upload last
+        ("gamecontrol", {PARAM_VALUE: "left"}), ("gamecontrol", {PARAM_VALUE: "left"}),
+        ("alarm", {PARAM_NUMBER: 1}), ("alarm", {PARAM_NUMBER: 1}), ("brightness", {PARAM_BRIGHTNESS: 30}),
+        ("image", {}),
+    ]
+    assert service.queue_stats()["collapsed"] == 2
+
+
+async def test_keypress_goes_in_between_the_chunks_of_an_image(hass, tmp_path):
+    """A gamecontrol called during an upload is sent after the chunk being
+    sent, not after the whole animation."""
+    media = os.path.join(os.path.dirname(__file__), "..", "..", "pixelart")
+    service = DivoomNotificationService(None, "11:22:33:44:55:66", 1, "pixoo", media, "fonts", None)
+    device = service._device
+    service._transport.socket = Mock()
+    sent = []
+
+    async def send_payload(payload, skipRead=None):
+        sent.append(payload[2]) # the command, right after the length
+        await asyncio.sleep(0.01) # the airtime of a chunk
+        return len(payload)
+    device.async_send_payload = send_payload
+
+    upload = asyncio.ensure_future(service.async_call_mode(hass, "image", {PARAM_FILE: "ha16.gif"}))
+    while sent.count(device.COMMANDS["set animation frame"]) < 3:
+        await asyncio.sleep(0.005)
+    await service.async_call_mode(hass, "gamecontrol", {PARAM_VALUE: "left"})
+    assert await upload is True
+
+    chunks = [index for index, command in enumerate(sent) if command == device.COMMANDS["set animation frame"]]
+    keys = [index for index, command in enumerate(sent) if command in (device.COMMANDS["set game keydown"], device.COMMANDS["set game keyup"])]
+    assert len(chunks) == 13 and len(keys) == 2
+    assert chunks[0] < keys[0] < keys[1] < chunks[-1]
+    assert keys[0] <= chunks[3] + 1 # right after the chunk that was being sent
+
+
+@pytest.mark.parametrize("policy, sent_chunks", [(None, range(14, 26)), ("queue", [26])])
+async def test_a_newer_image_stops_the_one_being_sent(hass, policy, sent_chunks):
+    """By default a second image replaces the first one at its next chunk,
+    while with the policy queue both are sent completely."""
+    media = os.path.join(os.path.dirname(__file__), "..", "..", "pixelart")
+    service = DivoomNotificationService(None, "11:22:33:44:55:66", 1, "pixoo", media, "fonts", None)
+    device = service._device
+    service._transport.socket = Mock()
+    sent = []
+
+    async def send_payload(payload, skipRead=None):
+        sent.append(payload[2])
+        await asyncio.sleep(0.01)
+        return len(payload)
+    device.async_send_payload = send_payload
+
+    data = {PARAM_FILE: "ha16.gif"} if policy is None else {PARAM_FILE: "ha16.gif", PARAM_POLICY: policy}
+    older = asyncio.ensure_future(service.async_call_mode(hass, "image", data))
+    while sent.count(device.COMMANDS["set animation frame"]) < 3:
+        await asyncio.sleep(0.005)
+    assert await service.async_call_mode(hass, "image", data) is True
+    assert await older is True
+
+    assert sent.count(device.COMMANDS["set animation frame"]) in sent_chunks
+    assert service.queue_stats()["superseded"] == (1 if policy is None else 0)
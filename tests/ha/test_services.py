@@ -29,6 +29,7 @@ from custom_components.divoom import notify as notify_module
 from custom_components.divoom.const import CONF_DEVICE, DOMAIN
 from custom_components.divoom.devices.aurabox import Aurabox
 from custom_components.divoom.devices.backpack import Backpack
+from custom_components.divoom.devices.commandqueue import DivoomCommandQueue
 from custom_components.divoom.devices.ditoo import Ditoo
 from custom_components.divoom.devices.divoom import DivoomUnsupportedError
 from custom_components.divoom.devices.pixoo import Pixoo
@@ -251,6 +252,21 @@ async def test_clock_service_raises_when_call_mode_fails(hass):
     assert error.value.translation_key == "mode_failed"
 
 
+async def test_clock_service_raises_when_the_queue_is_full(hass):
+    assert await async_setup_component(hass, DOMAIN, {})
+    entry, service = register_device(hass)
+    service._transport = Mock()
+    service._queue = DivoomCommandQueue(Mock(), depth=0)
+
+    with pytest.raises(HomeAssistantError) as error:
+        await hass.services.async_call(
+            DOMAIN, "clock", {CONF_DEVICE: device_slug(entry), "clock": 1}, blocking=True
+        )
+
+    assert error.value.translation_key == "queue_full"
+    service._device.show_clock.assert_not_called()
+
+
 async def test_notify_and_service_clock_paths_produce_identical_show_clock_call(hass):
     """The whole point of extracting call_mode: both entry points share one
     lock, one reconnect and one dispatch, so the same parameters must reach
@@ -296,24 +312,33 @@ DISPATCH_CASES = [
     ),
     (
         "image",
-        {"file": "ha16.gif", "time": 80}, {"file": "ha16.gif", "time": 80},
-        "show_image", (os.path.join("pixelart", "ha16.gif"),), {"time": 80},
+        {"file": "ha16.gif", "time": 80, "max_colors": 16, "trim_palette": True, "sample_frames": True, "resample": "box"},
+        {"file": "ha16.gif", "time": 80, "max_colors": 16, "trim_palette": True, "sample_frames": True, "resample": "box"},
+        "show_image", (os.path.join("pixelart", "ha16.gif"),),
+        {"time": 80, "maxColors": 16, "trimPalette": True, "sampleFrames": True, "resample": "box"},
     ),
     (
         "text",
         {"text": "Hi Divoom", "font": "divoom.ttf", "size": 16, "time": 100,
-         "foreground_color": [250, 0, 0], "background_color": [0, 0, 0]},
+         "foreground_color": [250, 0, 0], "background_color": [0, 0, 0], "scroll": True, "long_text": True},
         {"text": "Hi Divoom", "font": "divoom.ttf", "size": 16, "time": 100,
-         "color": [[250, 0, 0], [0, 0, 0]]},
+         "color": [[250, 0, 0], [0, 0, 0]], "scroll": True, "long_text": True},
         "show_text", ("Hi Divoom", os.path.join("fonts", "divoom.ttf")),
-        {"size": 16, "time": 100, "color1": [250, 0, 0], "color2": [0, 0, 0]},
+        {"size": 16, "time": 100, "color1": [250, 0, 0], "color2": [0, 0, 0], "scroll": True, "longText": True},
     ),
     (
         "text",
         {"text": "Hi Divoom", "background_color": [0, 0, 0]},
         {"text": "Hi Divoom", "color": [None, [0, 0, 0]]},
         "show_text", ("Hi Divoom", None),
-        {"size": None, "time": None, "color1": None, "color2": [0, 0, 0]},
+        {"size": None, "time": None, "color1": None, "color2": [0, 0, 0], "scroll": None, "longText": None},
+    ),
+    (
+        "ticker",
+        {"text": "21.4 W", "font": "pixelpowerline.ttf", "scroll": False},
+        {"text": "21.4 W", "font": "pixelpowerline.ttf", "scroll": False},
+        "show_ticker", ("21.4 W", os.path.join("fonts", "pixelpowerline.ttf")),
+        {"size": None, "time": None, "color1": None, "color2": None, "scroll": False},
     ),
     ("design", {"number": 2}, {"number": 2}, "show_design", (), {"number": 2}),
     ("effects", {"number": 2}, {"number": 2}, "show_effects", (), {"number": 2}),
@@ -403,6 +428,19 @@ DISPATCH_CASES = [
         {"value": "°F", "color": [250, 0, 0]}, {"value": "°F", "color": [250, 0, 0]},
         "show_temperature", (), {"value": "°F", "color": [250, 0, 0]},
     ),
+    (
+        "widget",
+        {"widget": "gauge", "value": "87", "maximum": 120, "foreground_color": [0, 250, 0], "background_color": [0, 0, 0]},
+        {"widget": "gauge", "value": 87, "maximum": 120, "color": [[0, 250, 0], [0, 0, 0]]},
+        "show_widget", ("gauge", 87.0),
+        {"minimum": None, "maximum": 120.0, "vertical": None, "color1": [0, 250, 0], "color2": [0, 0, 0]},
+    ),
+    (
+        "widget",
+        {"widget": "sparkline", "value": [3, 5, 4], "minimum": 0}, {"widget": "sparkline", "value": [3, 5, 4], "minimum": 0},
+        "show_widget", ("sparkline", [3.0, 5.0, 4.0]),
+        {"minimum": 0.0, "maximum": None, "vertical": None, "color1": None, "color2": None},
+    ),
     (
         "raw",
         {"raw": [0x74, 0x64]}, {"raw": [0x74, 0x64]},
@@ -966,6 +1004,7 @@ def test_services_yaml_strings_and_translations_stay_in_sync():
         "device_not_loaded",
         "mode_failed",
         "mode_unsupported",
+        "queue_full",
     }
 
     reference = _flatten(strings)
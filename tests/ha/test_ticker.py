@@ -0,0 +1,93 @@
+"""HA integration tests for ticker.py and the divoom.ticker service: a template
+or entity bound to a device is shown again whenever it changes, but no more
+often than the interval allows. Like test_services.py this runs against a
+Mock() device, so what's asserted is which texts reach show_ticker."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+
+from homeassistant.setup import async_setup_component
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.divoom.const import CONF_DEVICE, DOMAIN
+from custom_components.divoom.services import device_slug
+
+from .test_services import register_device
+
+pytestmark = pytest.mark.usefixtures("enable_custom_integrations")
+
+
+async def setup_ticker(hass, **data):
+    assert await async_setup_component(hass, DOMAIN, {})
+    entry, service = register_device(hass)
+    hass.states.async_set("sensor.power", "21.4", {"unit_of_measurement": "W"})
+
+    await hass.services.async_call(
+        DOMAIN, "ticker", {CONF_DEVICE: device_slug(entry), **data}, blocking=True
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    return entry, service
+
+
+def shown(service):
+    return [call.args[0] for call in service._device.show_ticker.call_args_list]
+
+
+async def test_entity_ticker_shows_the_state_with_its_unit(hass):
+    _, service = await setup_ticker(hass, entity="sensor.power", font="pixelpowerline.ttf", interval=0)
+
+    hass.states.async_set("sensor.power", "21.5", {"unit_of_measurement": "W"})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert shown(service) == ["21.4 W", "21.5 W"]
+    assert service._device.show_ticker.call_args.kwargs["scroll"] is None
+
+
+async def test_changes_within_the_interval_only_send_the_latest(hass):
+    _, service = await setup_ticker(hass, template="{{ states('sensor.power') }} W", interval=5)
+
+    for value in ("21.5", "21.6", "21.7"):
+        hass.states.async_set("sensor.power", value, {"unit_of_measurement": "W"})
+        await hass.async_block_till_done(wait_background_tasks=True)
+    assert shown(service) == ["21.4 W"]
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=6))
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert shown(service) == ["21.4 W", "21.7 W"]
+
+
+async def test_unchanged_results_are_not_sent_again(hass):
+    _, service = await setup_ticker(hass, template="{{ states('sensor.power') | int }}", interval=0)
+
+    hass.states.async_set("sensor.power", "21.2", {"unit_of_measurement": "W"})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert shown(service) == ["21"]
+
+
+async def test_calling_without_a_source_stops_the_ticker(hass):
+    entry, service = await setup_ticker(hass, entity="sensor.power", interval=0)
+
+    await hass.services.async_call(DOMAIN, "ticker", {CONF_DEVICE: device_slug(entry)}, blocking=True)
+    hass.states.async_set("sensor.power", "30", {"unit_of_measurement": "W"})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert shown(service) == ["21.4 W"]
+    assert hass.data[DOMAIN]["tickers"] == {}
+
+
+async def test_a_new_binding_replaces_the_one_before(hass):
+    entry, service = await setup_ticker(hass, entity="sensor.power", interval=0)
+    hass.states.async_set("sensor.temperature", "20.5", {"unit_of_measurement": "°C"})
+
+    await hass.services.async_call(
+        DOMAIN, "ticker", {CONF_DEVICE: device_slug(entry), "entity": "sensor.temperature", "interval": 0}, blocking=True
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    hass.states.async_set("sensor.power", "30", {"unit_of_measurement": "W"})
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    assert shown(service) == ["21.4 W", "20.5 °C"]
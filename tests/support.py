@@ -34,6 +34,10 @@ class RecordingSocket:
         return getattr(self._real, name)
 
 
+# The drainer threads still running, see join_drainers.
+_drainers: list[threading.Thread] = []
+
+
 def _drain_forever(sock: socket.socket) -> None:
     try:
         while sock.recv(65536):
@@ -60,10 +64,19 @@ def make_connected_device(device_cls, mac="11:22:33:44:55:66", **kwargs):
     # can never block on a full socket buffer.
     drainer = threading.Thread(target=_drain_forever, args=(server_sock,), daemon=True)
     drainer.start()
+    _drainers.append(drainer)
 
     return device, recorder, server_sock
 
 
+def join_drainers(timeout: float = 1.0) -> None:
+    """Wait for the drainer threads of the devices a test disconnected.
+    They end once the device side of the socket pair is closed, but only
+    a moment later, after a test that checks for leftover threads looked."""
+    while _drainers:
+        _drainers.pop().join(timeout)
+
+
 def hexdump(data: bytes) -> str:
     return " ".join(f"{b:02x}" for b in data)
 
@@ -0,0 +1,113 @@
+"""Tests of the offline asset compiler in compile.py and the precompiled
+frames show_image picks up from devices/assets.py: they have to send exactly
+the bytes a fresh encode would, and must never be used once stale."""
+from __future__ import annotations
+
+import os
+import shutil
+
+import pytest
+
+from custom_components.divoom import compile as compiler
+from custom_components.divoom.devices.assets import asset_path, is_current, read_asset
+from custom_components.divoom.devices.divoom import Divoom
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.pixoomax import PixooMax
+from custom_components.divoom.devices.timeboxmini import TimeboxMini
+from tests.support import make_connected_device
+
+PIXELART_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "pixelart"))
+
+
+@pytest.fixture
+def media(tmp_path):
+    for name in ("ha16.gif", "ha32.gif", "smiley16.gif"):
+        shutil.copy(os.path.join(PIXELART_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+def show_image(device_cls, path, time=None):
+    device, recorder, server_sock = make_connected_device(device_cls)
+    try:
+        device.show_image(path, time=time)
+    finally:
+        device.disconnect()
+        server_sock.close()
+    return recorder.sent_messages
+
+
+def forbid_encoding(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("stream_image must not run when precompiled frames match")
+    monkeypatch.setattr(Divoom, "stream_image", fail)
+
+
+def test_device_classes_cover_every_device_type():
+    classes = compiler.device_classes()
+
+    assert classes["pixoo"] is Pixoo
+    assert classes["pixoomax"] is PixooMax
+    assert "divoom" not in classes
+    assert len(classes) == 10
+
+
+def test_media_files_skip_the_compiled_output(media):
+    compiler.compile_file(str(media / "ha16.gif"), Pixoo)
+
+    files = list(compiler.media_files(str(media)))
+
+    assert [os.path.basename(file) for file in files] == ["ha16.gif", "ha32.gif", "smiley16.gif"]
+
+
+@pytest.mark.parametrize("device_cls, name", [
+    (Pixoo, "ha16.gif"),
+    (PixooMax, "ha32.gif"),
+    (PixooMax, "ha16.gif"),
+    (TimeboxMini, "smiley16.gif"),
+])
+def test_show_image_sends_precompiled_frames_unchanged(monkeypatch, media, device_cls, name):
+    path = str(media / name)
+    expected = show_image(device_cls, path)
+    Divoom.frameCache.clear()
+
+    assert compiler.compile_file(path, device_cls) == asset_path(path, device_cls(mac="00:00:00:00:00:00").type)
+    forbid_encoding(monkeypatch)
+
+    assert show_image(device_cls, path) == expected
+
+
+def test_compile_directory_rebuilds_only_changed_files(media):
+    assert compiler.compile_directory(str(media), ["pixoo", "pixoomax"], jobs=2) == (6, 0, 0)
+    assert compiler.compile_directory(str(media), ["pixoo", "pixoomax"], jobs=2) == (0, 6, 0)
+
+    shutil.copy(os.path.join(PIXELART_DIR, "ha16.gif"), media / "smiley16.gif")
+    assert compiler.compile_directory(str(media), ["pixoo", "pixoomax"], jobs=2) == (2, 4, 0)
+    assert compiler.compile_directory(str(media), ["pixoo"], jobs=2, force=True) == (3, 0, 0)
+
+
+def test_stale_precompiled_frames_are_ignored(media):
+    path = str(media / "smiley16.gif")
+    compiler.compile_file(path, Pixoo)
+
+    shutil.copy(os.path.join(PIXELART_DIR, "ha16.gif"), path)
+    stat = os.stat(path)
+    assert read_asset(asset_path(path, "Pixoo"), stat) is None
+    assert not is_current(asset_path(path, "Pixoo"), stat)
+
+    Divoom.frameCache.clear()
+    assert show_image(Pixoo, path) == show_image(Pixoo, os.path.join(PIXELART_DIR, "ha16.gif"))
+
+
+def test_time_override_bypasses_precompiled_frames(media):
+    path = str(media / "ha16.gif")
+    expected = show_image(Pixoo, path, time=100)
+    Divoom.frameCache.clear()
+    compiler.compile_file(path, Pixoo)
+
+    assert show_image(Pixoo, path, time=100) == expected
+
+
+def test_main_reports_a_missing_media_directory(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        compiler.main([str(tmp_path / "missing")])
+    assert "does not exist" in capsys.readouterr().err
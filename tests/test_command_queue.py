@@ -0,0 +1,286 @@
+"""Tests of devices/commandqueue.py: the commands for a device are executed in
+the order they were queued, lane by lane, one at a time by a single writer,
+keypresses go in between the chunks of an upload, a newer upload stops the
+one being sent, the queue is bounded, and it keeps count of its depth and of how long commands waited."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from custom_components.divoom.devices.commandqueue import BULK, INTERACTIVE, STATE, DivoomCommand, DivoomCommandQueue, DivoomQueueFullError
+
+
+class Device:
+    """Executes commands slowly, noting when each of them starts and ends"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.log = []
+
+    async def execute(self, command):
+        self.log.append(("start", command.mode))
+        if command.data == "fail": raise ValueError("{0} failed".format(command.mode))
+        await asyncio.sleep(self.delay)
+        self.log.append(("end", command.mode))
+        return command.mode.upper()
+
+
+async def test_commands_run_one_after_another_in_order():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    results = await asyncio.gather(*(queue.async_call(mode, None) for mode in ["image", "text", "brightness"]))
+
+    assert results == ["IMAGE", "TEXT", "BRIGHTNESS"]
+    assert device.log == [
+        ("start", "image"), ("end", "image"),
+        ("start", "text"), ("end", "text"),
+        ("start", "brightness"), ("end", "brightness"),
+    ]
+
+
+async def test_a_full_queue_refuses_more_commands():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute, depth=2)
+
+    first = queue.put("image", None)
+    second = queue.put("text", None)
+    with pytest.raises(DivoomQueueFullError):
+        queue.put("brightness", None)
+
+    assert await first.future == "IMAGE" and await second.future == "TEXT"
+    assert queue.stats()["rejected"] == 1
+    assert await queue.put("brightness", None).future == "BRIGHTNESS" # there is room again
+
+
+async def test_stats_count_depth_and_waiting():
+    device = Device(delay=0.05)
+    queue = DivoomCommandQueue(device.execute)
+
+    commands = [queue.put(mode, None) for mode in ["image", "text", "brightness"]]
+    assert queue.stats()["depth"] == 3
+    await asyncio.gather(*(command.future for command in commands))
+
+    stats = queue.stats()
+    assert stats["depth"] == 0 and stats["peak"] == 3 and stats["executed"] == 3
+    assert stats["wait_last"] >= 0.09 # behind two commands of 50ms each
+    assert stats["wait_max"] == stats["wait_last"]
+    assert 0.03 <= stats["wait_mean"] <= stats["wait_max"]
+
+
+async def test_errors_reach_the_caller_and_the_queue_goes_on():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    failing = queue.async_call("image", "fail")
+    following = queue.async_call("text", None)
+
+    with pytest.raises(ValueError):
+        await failing
+    assert await following == "TEXT"
+
+
+async def test_errors_nobody_waits_for_are_logged(caplog):
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    assert await queue.async_call("image", "fail", wait=False) is None
+    await queue.async_call("text", None)
+
+    assert "image failed" in caplog.text
+
+
+async def test_commands_given_up_are_skipped():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    first = queue.put("image", None)
+    second = queue.put("text", None)
+    second.future.cancel()
+    await first.future
+    await queue.async_call("brightness", None)
+
+    assert ("start", "text") not in device.log
+
+
+async def test_stop_drops_the_waiting_commands():
+    device = Device(delay=1)
+    queue = DivoomCommandQueue(device.execute)
+
+    running = queue.put("image", None)
+    waiting = queue.put("text", None)
+    await asyncio.sleep(0)
+    await queue.async_stop()
+
+    assert running.future.cancelled() and waiting.future.cancelled()
+    assert device.log == [("start", "image")]
+    assert len(queue) == 0
+
+
+async def test_newer_commands_with_the_same_key_replace_waiting_ones():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    calls = [
+        ("image", None), ("brightness", "brightness"), ("gamecontrol", None),
+        ("brightness", "brightness"), ("gamecontrol", None), ("brightness", "brightness"),
+    ]
+    results = await asyncio.gather(*(queue.async_call(mode, None, key=key) for mode, key in calls))
+
+    assert [mode for event, mode in device.log if event == "start"] == ["image", "gamecontrol", "gamecontrol", "brightness"]
+    assert results == ["IMAGE", "BRIGHTNESS", "GAMECONTROL", "BRIGHTNESS", "GAMECONTROL", "BRIGHTNESS"]
+    assert queue.stats()["collapsed"] == 2
+
+
+async def test_the_running_command_is_not_replaced():
+    device = Device(delay=0.05)
+    queue = DivoomCommandQueue(device.execute)
+
+    first = queue.put("brightness", None, key="brightness")
+    await asyncio.sleep(0.01) # it is being sent now
+    second = queue.put("brightness", None, key="brightness")
+    await asyncio.gather(first.future, second.future)
+
+    assert [event for event, _ in device.log] == ["start", "end", "start", "end"]
+    assert queue.stats()["collapsed"] == 0
+
+
+async def test_a_replacing_command_fits_into_a_full_queue():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute, depth=2)
+
+    queue.put("image", None)
+    queue.put("brightness", None, key="brightness")
+    newest = queue.put("brightness", None, key="brightness")
+
+    assert await newest.future == "BRIGHTNESS"
+
+
+async def test_earlier_lanes_go_first():
+    device = Device()
+    queue = DivoomCommandQueue(device.execute)
+
+    calls = [("image", BULK), ("brightness", STATE), ("gamecontrol", INTERACTIVE), ("text", BULK), ("alarm", STATE)]
+    await asyncio.gather(*(queue.async_call(mode, None, priority=priority) for mode, priority in calls))
+
+    assert [mode for event, mode in device.log if event == "start"] == ["gamecontrol", "brightness", "alarm", "image", "text"]
+
+
+class Upload(Device):
+    """Sends a bulk command as chunks of 20ms each, letting the earlier lanes in between them"""
+
+    async def execute(self, command):
+        if command.priority != BULK: return await super().execute(command)
+
+        for chunk in range(10):
+            self.log.append(("chunk", asyncio.get_running_loop().time()))
+            await asyncio.sleep(0.02)
+            await command.preempt()
+        return command.mode.upper()
+
+
+async def test_keypresses_go_in_between_the_chunks_of_an_upload():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+
+    upload = queue.put("image", None, priority=BULK)
+    await asyncio.sleep(0.05)
+    pressed = asyncio.get_running_loop().time()
+    await queue.async_call("gamecontrol", None, priority=INTERACTIVE)
+    sent = asyncio.get_running_loop().time()
+
+    assert not upload.future.done()
+    assert sent - pressed < 0.02 + 0.01 # at most the rest of the chunk being sent
+    assert await upload.future == "IMAGE"
+    events = [event for event, _ in device.log]
+    assert events.index("start") not in (0, len(events) - 1) # in the middle of the chunks
+    assert events.count("chunk") == 10
+    assert queue.stats()["injected"] == 1
+
+
+async def test_state_commands_wait_for_the_end_of_an_upload():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+
+    upload = queue.put("text", None, priority=BULK)
+    await asyncio.sleep(0.05)
+    await queue.async_call("clock", None, priority=STATE)
+
+    assert upload.future.done()
+    events = [event for event, _ in device.log]
+    assert events.index("start") == events.count("chunk") == 10 # after the last chunk, so the clock is what the screen shows
+    assert queue.stats()["injected"] == 0
+
+
+async def test_nothing_goes_in_between_keypresses():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+    command = queue.put("gamecontrol", None, priority=INTERACTIVE)
+
+    assert command.preempt is None
+    await command.future
+    assert command.preempt is None # nothing goes before the interactive lane
+
+
+async def test_pauses_let_the_earlier_lanes_in_as_they_arrive():
+    device = Device(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+    loop = asyncio.get_running_loop()
+
+    upload = DivoomCommand("image", None, loop.create_future(), loop.time(), priority=BULK)
+    started = loop.time()
+    pausing = asyncio.ensure_future(queue.async_preempt(upload, 0.2))
+    await asyncio.sleep(0.05)
+    await queue.async_call("gamecontrol", None, priority=INTERACTIVE)
+    answered = loop.time()
+    await pausing
+
+    assert answered - started < 0.1 # not only after the pause
+    assert loop.time() - started >= 0.2 # and the pause still lasts as long as it should
+
+
+async def test_a_newer_upload_stops_the_one_being_sent():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+    loop = asyncio.get_running_loop()
+
+    older = queue.put("image", None, key="upload", priority=BULK, supersede=True)
+    await asyncio.sleep(0.05)
+    called = loop.time()
+    newer = queue.put("text", None, key="upload", priority=BULK, supersede=True)
+
+    assert await older.future == "TEXT" and await newer.future == "TEXT" # the callers of both get the one shown
+    chunks = [started for event, started in device.log if event == "chunk"]
+    assert len(chunks) < 20 # the older one was not sent completely
+    assert chunks[-10] - called < 0.02 + 0.01 # the newer one started right after the chunk being sent
+    assert queue.stats()["superseded"] == 1
+
+
+async def test_a_refused_upload_leaves_the_one_being_sent_alone():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute, depth=1)
+
+    running = queue.put("image", None, key="upload", priority=BULK, supersede=True)
+    await asyncio.sleep(0.05)
+    waiting = queue.put("brightness", None)
+    with pytest.raises(DivoomQueueFullError):
+        queue.put("text", None, key="upload", priority=BULK, supersede=True)
+
+    assert await running.future == "IMAGE"
+    assert await waiting.future == "BRIGHTNESS"
+    assert [event for event, _ in device.log].count("chunk") == 10
+    assert queue.stats()["superseded"] == 0
+
+
+async def test_uploads_without_supersede_are_sent_completely():
+    device = Upload(delay=0)
+    queue = DivoomCommandQueue(device.execute)
+
+    older = queue.put("image", None, priority=BULK)
+    await asyncio.sleep(0.05)
+    newer = queue.put("text", None, priority=BULK)
+
+    assert await older.future == "IMAGE" and await newer.future == "TEXT"
+    assert [event for event, _ in device.log].count("chunk") == 20
+    assert queue.stats()["superseded"] == 0
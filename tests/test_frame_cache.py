@@ -0,0 +1,161 @@
+"""Tests of the encoded frame cache behind show_image: the LRU itself in
+devices/cache.py, and that a cache hit sends exactly the bytes a fresh
+encode would, without touching PIL again."""
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+
+import pytest
+
+from custom_components.divoom.devices.aurabox import Aurabox
+from custom_components.divoom.devices.cache import LRUCache
+from custom_components.divoom.devices.ditoo import Ditoo
+from custom_components.divoom.devices.divoom import Divoom
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.pixoomax import PixooMax
+from custom_components.divoom.devices.timoo import Timoo
+from tests.support import make_connected_device
+
+PIXELART_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "pixelart"))
+
+
+def show_image(device_cls, path):
+    device, recorder, server_sock = make_connected_device(device_cls)
+    try:
+        device.show_image(path)
+    finally:
+        device.disconnect()
+        server_sock.close()
+    return device, recorder.sent_messages
+
+
+def test_lru_cache_evicts_least_recently_used_within_budget():
+    cache = LRUCache(10, sizeof=len)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # "b" is now the least recently used
+
+    cache.put("c", b"1234")
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.size == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_refuses_entries_larger_than_the_budget():
+    cache = LRUCache(4, sizeof=len)
+    cache.put("a", b"12")
+
+    assert cache.put("b", b"12345") is False
+    assert "a" in cache
+    assert cache.stats()["evictions"] == 0
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(10)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_show_image_cache_hit_sends_identical_bytes_without_decoding(monkeypatch):
+    path = os.path.join(PIXELART_DIR, "ha32.gif")
+    _, first = show_image(PixooMax, path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stream_image must not run on a cache hit")
+    monkeypatch.setattr(Divoom, "stream_image", fail)
+    _, second = show_image(PixooMax, path)
+
+    assert second == first
+    assert Divoom.frameCache.stats()["hits"] == 1
+
+
+def test_show_image_cache_is_keyed_by_device_type():
+    path = os.path.join(PIXELART_DIR, "ha16.gif")
+    show_image(Pixoo, path)
+    show_image(PixooMax, path)
+
+    stats = Divoom.frameCache.stats()
+    assert stats["hits"] == 0
+    assert stats["entries"] == 2
+
+
+def test_show_image_cache_misses_after_the_file_changed(tmp_path):
+    path = str(tmp_path / "image.gif")
+    shutil.copy(os.path.join(PIXELART_DIR, "smiley16.gif"), path)
+    show_image(Pixoo, path)
+
+    shutil.copy(os.path.join(PIXELART_DIR, "ha16.gif"), path)
+    _, messages = show_image(Pixoo, path)
+    _, expected = show_image(Pixoo, os.path.join(PIXELART_DIR, "ha16.gif"))
+
+    assert messages == expected
+    assert Divoom.frameCache.stats()["hits"] == 0
+
+
+def test_lru_cache_creates_an_entry_once_for_concurrent_callers():
+    cache = LRUCache(10)
+    started = threading.Event()
+    created = []
+
+    def create():
+        created.append(1)
+        started.wait(1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("a", create))) for _ in range(4)]
+    for thread in threads: thread.start()
+    started.set()
+    for thread in threads: thread.join()
+
+    assert results == ["value"] * 4
+    assert len(created) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 3
+
+
+@pytest.mark.parametrize("path", ["ha16.gif", "ha32.gif"])
+def test_devices_of_the_same_screen_size_decode_an_image_once(monkeypatch, path):
+    path = os.path.join(PIXELART_DIR, path)
+    expected = {}
+    for device_cls in (Pixoo, Ditoo, Timoo):
+        _, expected[device_cls] = show_image(device_cls, path)
+        Divoom.frameCache.clear()
+        Divoom.rasterCache.clear()
+
+    decoded = []
+    decode_frames = Divoom.decode_frames
+    def counting(self, *args, **kwargs):
+        decoded.append(self.type)
+        return decode_frames(self, *args, **kwargs)
+    monkeypatch.setattr(Divoom, "decode_frames", counting)
+
+    for device_cls in (Pixoo, Ditoo, Timoo):
+        _, messages = show_image(device_cls, path)
+        assert messages == expected[device_cls]
+    assert decoded == ["Pixoo"]
+
+
+def test_devices_of_another_screen_size_decode_on_their_own(monkeypatch):
+    path = os.path.join(PIXELART_DIR, "ha16.gif")
+    decoded = []
+    decode_frames = Divoom.decode_frames
+    def counting(self, *args, **kwargs):
+        decoded.append(self.type)
+        return decode_frames(self, *args, **kwargs)
+    monkeypatch.setattr(Divoom, "decode_frames", counting)
+
+    for device_cls in (Pixoo, PixooMax, Aurabox):
+        show_image(device_cls, path)
+
+    assert decoded == ["Pixoo", "PixooMax", "Aurabox"]
+    assert Divoom.rasterCache.stats()["entries"] == 3
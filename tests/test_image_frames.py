@@ -0,0 +1,360 @@
+"""Tests of how stream_image in devices/divoom.py turns the frames of a file
+into the frames it encodes: identical consecutive frames are merged into one
+longer frame, max_colors reduces all frames to one shared palette and
+trim_palette drops colors just over a power of two. Decoding downscales every
+frame right away and stops at the frames limit, large stills are decoded or
+reduced to about twice the frame size first."""
+from __future__ import annotations
+
+import logging
+import random
+
+import pytest
+from PIL import Image
+
+from custom_components.divoom.devices import divoom as divoom_module
+from custom_components.divoom.devices import quantize as quantize_module
+from custom_components.divoom.devices.aurabox import Aurabox
+from custom_components.divoom.devices.divoom import FRAMES_LIMIT, MAX_FRAME_TIME
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.timeboxmini import TimeboxMini
+
+
+def make_gif(path, colors, durations):
+    """32x32 frames for a 16x16 device. Pillow already drops frames that are identical in the file,
+    so every frame differs in a pixel the downscale skips."""
+    frames = []
+    for index, color in enumerate(colors):
+        frame = Image.new("RGB", (32, 32), color)
+        frame.putpixel((0, 0), (index * 10, index * 10, index * 10))
+        frames.append(frame)
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=durations, loop=0, disposal=1)
+    return str(path)
+
+
+def frame_times(frames):
+    return [int.from_bytes(bytes(pair[0][3:5]), "little") for pair in frames]
+
+
+def test_identical_consecutive_frames_are_merged_with_their_durations(tmp_path, caplog):
+    red, blue = (255, 0, 0), (0, 0, 255)
+    path = make_gif(tmp_path / "held.gif", [red, red, red, blue, red], [100, 200, 300, 400, 500])
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    with caplog.at_level(logging.DEBUG, logger="Pixoo"):
+        frames, framesCount, framesSize = device.stream_image(path)
+        frames = list(frames)
+
+    assert framesCount == 3
+    assert frame_times(frames) == [600, 400, 500]
+    assert framesSize == sum(pair[1] for pair in frames)
+    assert "merged 2 identical frames" in caplog.text
+
+
+def test_merged_durations_stay_within_the_time_code(tmp_path):
+    red = (255, 0, 0)
+    path = make_gif(tmp_path / "long.gif", [red, red, red, (0, 255, 0)], [30000, 30000, 30000, 100])
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    frames, framesCount = device.process_image(path)
+
+    assert framesCount == 3
+    assert frame_times(frames) == [60000, 30000, 100]
+    assert max(frame_times(frames)) <= MAX_FRAME_TIME
+
+
+@pytest.mark.parametrize("device_cls", [Aurabox, TimeboxMini])
+def test_merged_durations_stay_within_a_single_delay_byte(tmp_path, device_cls):
+    red = (255, 0, 0)
+    path = make_gif(tmp_path / "long.gif", [red, red, red, (0, 255, 0)], [10000, 10000, 10000, 100])
+    device = device_cls(mac="11:22:33:44:55:66")
+
+    frames, framesCount = device.process_image(path)
+
+    assert framesCount == 3 # 30s would not fit into the 25.5s of the delay byte
+    assert [pair[0][0] for pair in frames[:2]] == [200, 100]
+
+
+def test_time_override_is_summed_for_merged_frames(tmp_path):
+    red = (255, 0, 0)
+    path = make_gif(tmp_path / "held.gif", [red, red, (0, 255, 0)], [100, 100, 100])
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    frames, framesCount = device.process_image(path, time=250)
+
+    assert framesCount == 2
+    assert frame_times(frames) == [500, 250]
+
+
+def make_colorful_gif(path, frames_count):
+    generator = random.Random(7)
+    frames = []
+    for _ in range(frames_count):
+        frame = Image.new("RGB", (16, 16))
+        frame.putdata([(generator.randrange(256), generator.randrange(256), generator.randrange(256)) for _ in range(256)])
+        frames.append(frame)
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return str(path)
+
+
+def frame_palettes(frames):
+    """The palette of every frame, as written by the default process_frame."""
+    palettes = []
+    for frame, _ in frames:
+        count = frame[6] or 256
+        palettes.append({tuple(frame[7 + index * 3:10 + index * 3]) for index in range(count)})
+    return palettes
+
+
+def test_max_colors_shares_one_small_palette_across_all_frames(tmp_path):
+    path = make_colorful_gif(tmp_path / "photo.gif", 3)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    original, _ = device.process_image(path)
+    frames, framesCount = device.process_image(path, maxColors=16)
+
+    palettes = frame_palettes(frames)
+    assert framesCount == 3
+    assert len(set.union(*palettes)) <= 16
+    # 4 instead of 8 bits per pixel and a 48 instead of up to 768 byte palette
+    assert sum(pair[1] for pair in frames) * 2 < sum(pair[1] for pair in original)
+
+
+def test_max_colors_keeps_images_that_already_fit(tmp_path):
+    red, blue = (255, 0, 0), (0, 0, 255)
+    path = make_gif(tmp_path / "two.gif", [red, blue], [100, 100])
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    assert device.process_image(path, maxColors=4) == device.process_image(path)
+
+
+def test_median_cut_finds_the_same_palette_without_numpy(monkeypatch):
+    generator = random.Random(3)
+    colors = sorted({(generator.randrange(256), generator.randrange(256), generator.randrange(256)) for _ in range(500)})
+    counts = [generator.randrange(1, 50) for _ in colors]
+
+    assignment, palette = quantize_module.median_cut([list(color) for color in colors], counts, 16)
+    monkeypatch.setattr(quantize_module, "np", None)
+    expected = quantize_module.median_cut([list(color) for color in colors], counts, 16)
+
+    assert (list(assignment), palette) == (list(expected[0]), expected[1])
+    assert len(palette) == 16
+
+
+def test_max_colors_is_the_same_without_numpy(monkeypatch, tmp_path):
+    path = make_colorful_gif(tmp_path / "photo.gif", 2)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    vectorized = device.process_image(path, maxColors=8)
+    monkeypatch.setattr(divoom_module, "np", None)
+    monkeypatch.setattr(quantize_module, "np", None)
+
+    assert device.process_image(path, maxColors=8) == vectorized
+
+
+def make_palette_gif(path, colors_count):
+    """A 16x16 still with the given number of distinct colors, two of them very close."""
+    colors = [(index * 13 % 256, index * 37 % 256, index * 91 % 256) for index in range(colors_count - 1)]
+    colors.append((colors[0][0] + 1, colors[0][1], colors[0][2]))
+    frame = Image.new("RGB", (16, 16))
+    frame.putdata([colors[index % colors_count] for index in range(256)])
+    frame.save(path)
+    return str(path)
+
+
+def test_trim_palette_drops_colors_just_over_a_power_of_two(tmp_path, caplog):
+    path = make_palette_gif(tmp_path / "seventeen.png", 17)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    original, _ = device.process_image(path)
+    with caplog.at_level(logging.DEBUG, logger="Pixoo"):
+        trimmed, _ = device.process_image(path, trimPalette=True)
+
+    assert original[0][0][6] == 17
+    assert trimmed[0][0][6] == 16
+    # 4 instead of 5 bits for 256 pixels, minus the dropped palette entry
+    assert original[0][1] - trimmed[0][1] == 32 + 3
+    assert "from 17 to 16 colors, 35 bytes saved" in caplog.text
+
+
+def test_trim_palette_merges_the_closest_colors(tmp_path):
+    path = make_palette_gif(tmp_path / "eighteen.png", 18)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    frames, _ = device.process_image(path, trimPalette=True)
+
+    palette = frame_palettes(frames)[0]
+    assert len(palette) == 16
+    assert (0, 0, 0) in palette and (1, 0, 0) not in palette
+
+
+def test_trim_palette_keeps_palettes_far_from_a_power_of_two(tmp_path):
+    path = make_palette_gif(tmp_path / "twelve.png", 12)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    assert device.process_image(path, trimPalette=True) == device.process_image(path)
+
+
+@pytest.mark.parametrize("colors_count", [3, 5, 9])
+def test_trim_palette_keeps_small_palettes(tmp_path, colors_count):
+    path = make_palette_gif(tmp_path / "small.png", colors_count)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    assert device.process_image(path, trimPalette=True) == device.process_image(path)
+
+
+def test_trim_palette_is_the_same_without_numpy(monkeypatch, tmp_path):
+    path = make_palette_gif(tmp_path / "thirtythree.png", 34)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    vectorized = device.process_image(path, trimPalette=True)
+    monkeypatch.setattr(divoom_module, "np", None)
+    monkeypatch.setattr(quantize_module, "np", None)
+
+    assert device.process_image(path, trimPalette=True) == vectorized
+    assert vectorized[0][0][0][6] == 32
+
+
+def make_numbered_gif(path, frames_count, size=16, duration=50):
+    """Every frame has its own color, so none of them are merged."""
+    frames = [Image.new("RGB", (size, size), (index, 255 - index, 0)) for index in range(frames_count)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+    return str(path)
+
+
+def frame_reds(frames):
+    return [pair[0][7] for pair in frames]
+
+
+def test_long_animations_are_cut_off_at_the_frames_limit(tmp_path, caplog):
+    path = make_numbered_gif(tmp_path / "long.gif", 80)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    with caplog.at_level(logging.WARNING, logger="Pixoo"):
+        frames, framesCount = device.process_image(path)
+
+    assert framesCount == FRAMES_LIMIT
+    assert frame_reds(frames) == list(range(FRAMES_LIMIT))
+    assert "more than 60 frames" in caplog.text
+
+
+def test_sample_frames_spreads_the_frames_over_the_whole_animation(tmp_path):
+    path = make_numbered_gif(tmp_path / "long.gif", 150)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    frames, framesCount = device.process_image(path, sampleFrames=True)
+
+    assert framesCount == FRAMES_LIMIT
+    assert frame_reds(frames) == [int(index * 150 / 60) for index in range(60)]
+    assert sum(frame_times(frames)) == 150 * 50
+
+
+def test_decoding_downscales_without_full_size_copies(monkeypatch, tmp_path):
+    path = make_numbered_gif(tmp_path / "large.gif", 3, size=400)
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sizes = []
+    new = Image.new
+
+    def recording_new(mode, size, *args, **kwargs):
+        sizes.append(tuple(size))
+        return new(mode, size, *args, **kwargs)
+
+    monkeypatch.setattr(Image, "new", recording_new)
+    frames, framesCount = device.process_image(path)
+
+    assert framesCount == 3
+    assert (400, 400) not in sizes
+
+
+def test_decoding_matches_compositing_the_full_size_frames(tmp_path):
+    """The frames used to be composited in full size and downscaled afterwards."""
+    generator = random.Random(9)
+    frames = []
+    for _ in range(4):
+        frame = Image.new("RGBA", (48, 48))
+        frame.putdata([
+            (generator.randrange(256), generator.randrange(256), generator.randrange(256), generator.choice([0, 40, 255]))
+            for _ in range(48 * 48)
+        ])
+        frames.append(frame)
+    path = str(tmp_path / "transparent.gif")
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=70, loop=0, disposal=2)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    expected = []
+    with Image.open(path) as img:
+        for index in range(img.n_frames):
+            img.seek(index)
+            composited = Image.new("RGBA", img.size)
+            composited.paste(img, (0, 0), img.convert("RGBA"))
+            expected.append(composited.resize((16, 16), Image.Resampling.NEAREST).tobytes())
+
+    with Image.open(path) as img:
+        decoded = [frame.tobytes() for frame, _ in device.decode_frames(img, (16, 16))]
+
+    assert decoded == expected
+
+
+def make_photo(path, size):
+    generator = random.Random(5)
+    small = Image.new("RGB", (size[0] // 8, size[1] // 8))
+    small.putdata([(generator.randrange(256), generator.randrange(256), generator.randrange(256)) for _ in range(small.width * small.height)])
+    small.resize(size, Image.Resampling.BILINEAR).save(path)
+    return str(path)
+
+
+def test_large_jpegs_are_decoded_at_a_reduced_size(tmp_path):
+    path = make_photo(tmp_path / "photo.jpg", (1024, 768))
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    with Image.open(path) as img:
+        frames = list(device.decode_frames(img, (16, 16)))
+        assert img.size[0] < 1024 and img.size[0] >= 32
+
+    assert len(frames) == 1
+    assert frames[0][0].size == (16, 16)
+
+
+def test_large_stills_are_reduced_before_the_downscale(monkeypatch, tmp_path):
+    path = make_photo(tmp_path / "photo.png", (640, 640))
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sizes = []
+    resize = Image.Image.resize
+
+    def recording_resize(self, size, *args, **kwargs):
+        sizes.append(self.size)
+        return resize(self, size, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "resize", recording_resize)
+    frames, framesCount = device.process_image(path)
+
+    assert framesCount == 1
+    assert sizes == [(32, 32)]
+
+
+def test_small_stills_are_not_reduced(tmp_path):
+    path = make_photo(tmp_path / "small.png", (48, 48))
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    with Image.open(path) as img:
+        expected = img.convert("RGBA").resize((16, 16), Image.Resampling.NEAREST).tobytes()
+        decoded = [frame.tobytes() for frame, _ in device.decode_frames(img, (16, 16))]
+
+    assert decoded == [expected]
+
+
+def test_resample_picks_the_downscale_filter(tmp_path):
+    generator = random.Random(11)
+    noise = Image.new("RGB", (48, 48))
+    noise.putdata([(generator.randrange(256), generator.randrange(256), generator.randrange(256)) for _ in range(48 * 48)])
+    path = str(tmp_path / "noise.png")
+    noise.save(path)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    with Image.open(path) as img:
+        expected = img.convert("RGBA").resize((16, 16), Image.Resampling.BOX).tobytes()
+        decoded = [frame.tobytes() for frame, _ in device.decode_frames(img, (16, 16), resample="box")]
+
+    assert decoded == [expected]
+    assert device.process_image(path, resample="box") != device.process_image(path)
+    assert device.process_image(path, resample="nearest") == device.process_image(path)
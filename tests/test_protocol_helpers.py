@@ -6,7 +6,11 @@ not a bug to be fixed).
 from __future__ import annotations
 
 import os
+import random
 
+from PIL import Image
+
+from custom_components.divoom.devices import divoom as divoom_module
 from custom_components.divoom.devices.aurabox import Aurabox
 from custom_components.divoom.devices.pixoo import Pixoo
 from custom_components.divoom.devices.pixoomax import PixooMax
@@ -50,14 +54,51 @@ def test_process_pixels_one_bit_per_pixel():
     device = make_pixoo()
     colors = [[0, 0, 0], [255, 255, 255]]
     pixels = [0, 1, 0, 1, 1, 0, 1, 0]
-    assert device.process_pixels(pixels, colors) == [90]
+    assert device.process_pixels(pixels, colors) == bytes([90])
 
 
 def test_process_pixels_two_bits_per_pixel():
     device = make_pixoo()
     colors = [[0, 0, 0], [1, 1, 1], [2, 2, 2], [3, 3, 3]]
     pixels = [0, 1, 2, 3, 3, 2, 1, 0, 1, 1, 1, 1]
-    assert device.process_pixels(pixels, colors) == [228, 27, 85]
+    assert device.process_pixels(pixels, colors) == bytes([228, 27, 85])
+
+
+def test_process_palette_vectorized_matches_the_pixel_loop(monkeypatch):
+    """Colors have to come out in order of first appearance, exactly like the
+    pixel loop that is used without NumPy, or the frames would differ."""
+    device = make_pixoo()
+    generator = random.Random(4)
+    image = Image.new("RGBA", (40, 16))
+    image.putdata([
+        (generator.choice([0, 17, 255]), generator.choice([0, 128]), generator.choice([3, 99]), generator.randrange(256))
+        for _ in range(40 * 16)
+    ])
+
+    pixels, colors = device.process_palette(device.load_pixels(image), (16, 16), offset=7)
+    vectorized = (list(pixels), colors)
+    monkeypatch.setattr(divoom_module, "np", None)
+    looped = device.process_palette(device.load_pixels(image), (16, 16), offset=7)
+
+    assert vectorized == looped
+    assert [0, 0, 0] in looped[1]  # transparent pixels count as black
+
+
+def test_process_pixels_vectorized_matches_the_bit_loop(monkeypatch):
+    """Every bit width the palette size can lead to, including the ones that
+    leave a partially filled last byte."""
+    device = make_pixoo()
+    generator = random.Random(3)
+    for colorCount in (1, 2, 3, 5, 9, 17, 33, 65, 129, 256, 300):
+        colors = [[0, 0, 0]] * colorCount
+        pixels = [generator.randrange(colorCount) for _ in range(255)]
+
+        vectorized = device.process_pixels(pixels, colors)
+        monkeypatch.setattr(divoom_module, "np", None)
+        looped = device.process_pixels(pixels, colors)
+        monkeypatch.undo()
+
+        assert vectorized == looped, colorCount
 
 
 def test_parse_frequency_none_defaults_to_zero():
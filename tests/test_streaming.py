@@ -0,0 +1,66 @@
+"""Tests of the streaming encode in devices/divoom.py: the size pre-pass has to
+match the frames that are encoded later, and show_image/show_text have to
+start sending before the last frame is encoded."""
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from custom_components.divoom.devices.divoom import Divoom
+from tests.cases import DEVICE_CLASSES, FONT_PATH, PIXELART_DIR, pixelart_files
+from tests.support import make_connected_device
+
+
+@pytest.mark.parametrize("device_name", sorted(DEVICE_CLASSES))
+@pytest.mark.parametrize("image_name", pixelart_files())
+def test_measured_image_size_matches_the_encoded_frames(device_name, image_name):
+    device = DEVICE_CLASSES[device_name](mac="11:22:33:44:55:66")
+
+    frames, framesCount, framesSize = device.stream_image(os.path.join(PIXELART_DIR, image_name))
+
+    assert framesSize == sum(pair[1] for pair in frames)
+
+
+@pytest.mark.parametrize("device_name", sorted(DEVICE_CLASSES))
+@pytest.mark.parametrize("text", ["HA", "Home Assistant is great"])
+def test_measured_text_size_matches_the_encoded_frames(device_name, text):
+    device = DEVICE_CLASSES[device_name](mac="11:22:33:44:55:66")
+
+    frames, framesCount, framesSize = device.stream_text(text, FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255])
+
+    assert framesSize == sum(pair[1] for pair in frames)
+
+
+def test_chunk_frames_matches_chunking_the_concatenated_frames():
+    device = DEVICE_CLASSES["Pixoo"](mac="11:22:33:44:55:66")
+    frames = [[list(range(size)), size] for size in (3, 250, 0, 197, 200, 1)]
+    concatenated = [byte for pair in frames for byte in pair[0]]
+
+    assert list(device.chunk_frames(iter(frames), 200)) == list(device.chunks(concatenated, 200))
+
+
+def test_show_text_sends_before_the_last_frame_is_encoded(monkeypatch):
+    device, recorder, server_sock = make_connected_device(DEVICE_CLASSES["Pixoo"])
+    events = []
+    process_frame = Divoom.process_frame
+    send_command = Divoom.send_command
+
+    def recording_process_frame(self, *args):
+        events.append("encode")
+        return process_frame(self, *args)
+
+    def recording_send_command(self, command, args=None, skipRead=None):
+        events.append("send")
+        return send_command(self, command, args, skipRead=skipRead)
+
+    monkeypatch.setattr(Divoom, "process_frame", recording_process_frame)
+    monkeypatch.setattr(Divoom, "send_command", recording_send_command)
+    try:
+        device.show_text("Home Assistant", FONT_PATH)
+    finally:
+        device.disconnect()
+        server_sock.close()
+
+    last_encode = len(events) - 1 - events[::-1].index("encode")
+    assert events.index("send") < last_encode
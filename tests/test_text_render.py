@@ -0,0 +1,294 @@
+"""Tests of how stream_text in devices/divoom.py gets its fonts: loaded fonts
+are kept in a process-wide LRU per file and size, dropped when the file
+changes, and the default font is only loaded when it is needed. Texts are
+measured from the font metrics, without drawing them first, and rendered
+strips are kept as palette indexes that every frame is cut from, with a
+direct 1 bit per pixel path for strips of two colors. Text beyond the frames
+limit can be sent as consecutive segments instead of bigger jumps."""
+from __future__ import annotations
+
+import os
+import shutil
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from custom_components.divoom.devices import divoom as divoom_module
+from custom_components.divoom.devices.divoom import Divoom
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.pixoomax import PixooMax
+from tests.cases import FONT_PATH
+
+FONTS_DIR = os.path.dirname(FONT_PATH)
+
+
+@pytest.fixture
+def font_loads(monkeypatch):
+    """Count the fonts actually read and parsed."""
+    loads = []
+    truetype = ImageFont.truetype
+    load_default = ImageFont.load_default
+
+    def recording_truetype(font, size, *args, **kwargs):
+        loads.append(("truetype", size))
+        return truetype(font, size, *args, **kwargs)
+
+    def recording_load_default(size=None):
+        loads.append(("default", size))
+        return load_default(size)
+
+    monkeypatch.setattr(ImageFont, "truetype", recording_truetype)
+    monkeypatch.setattr(ImageFont, "load_default", recording_load_default)
+    return loads
+
+
+def test_fonts_are_loaded_once_per_file_and_size(font_loads):
+    pixoo = Pixoo(mac="11:22:33:44:55:66")
+    other = Pixoo(mac="66:55:44:33:22:11")
+    pixoomax = PixooMax(mac="11:22:33:44:55:77")
+
+    first = pixoo.process_text("HA", FONT_PATH)
+    assert other.process_text("HA", FONT_PATH) == first
+    pixoomax.process_text("HA", FONT_PATH)
+    pixoomax.process_text("HA", FONT_PATH)
+
+    assert font_loads == [("truetype", 16), ("truetype", 32)]
+    assert Divoom.fontCache.stats()["hits"] == 2
+
+
+def test_fonts_are_loaded_again_when_the_file_changes(font_loads, tmp_path):
+    path = str(tmp_path / "font.ttf")
+    shutil.copyfile(FONT_PATH, path)
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    expected = device.process_text("HA", path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    assert device.process_text("HA", path) == expected
+    assert font_loads == [("truetype", 16), ("truetype", 16)]
+
+
+def test_the_default_font_is_only_loaded_when_needed(font_loads, tmp_path):
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    device.process_text("HA", FONT_PATH)
+    assert font_loads == [("truetype", 16)]
+
+    # both fall back to the default font, which is then kept as well
+    device.process_text("HA", str(tmp_path / "missing.ttf"))
+    device.process_text("HA", None)
+    assert font_loads.count(("default", 16)) == 1
+
+
+@pytest.mark.parametrize("font_name", sorted(os.listdir(FONTS_DIR)) + [None])
+def test_measured_width_matches_textbbox(font_name):
+    """The width used to come from textbbox on a strip a hundred screens wide."""
+    device = Pixoo(mac="11:22:33:44:55:66")
+    for size in (8, 16, 19, 32):
+        fnt = device.load_font(None if font_name is None else os.path.join(FONTS_DIR, font_name), size)
+        for text in ("HA", "Home Assistant is great", "22.5°C", "two\nlines", "ÄÖÜ ß €"):
+            with Image.new("RGBA", (3200, 32)) as img:
+                drw = ImageDraw.Draw(img)
+                drw.fontmode = "1"
+                expected = drw.textbbox((0, 0), text, font=fnt)[2]
+            assert device.measure_text(fnt, size, text) == expected, (font_name, size, text)
+
+
+def test_text_is_measured_once_without_a_canvas(monkeypatch):
+    device = PixooMax(mac="11:22:33:44:55:66")
+    sizes = []
+    new = Image.new
+
+    def recording_new(mode, size, *args, **kwargs):
+        sizes.append(tuple(size))
+        return new(mode, size, *args, **kwargs)
+
+    monkeypatch.setattr(Image, "new", recording_new)
+    device.process_text("HA", FONT_PATH)
+    device.process_text("HA", FONT_PATH, color1=[0, 255, 0])
+
+    width = device.measure_text(device.load_font(FONT_PATH, 32), 32, "HA")
+    assert sizes == [(32 + width + 32, 32)] * 2
+    assert Divoom.textWidthCache.stats()["misses"] == 1
+
+
+def test_repeated_texts_are_cut_from_the_cached_strip(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    first = device.process_text("Door open", FONT_PATH, color1=[255, 0, 0])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the strip is rendered again")
+
+    monkeypatch.setattr(Image, "new", fail)
+    assert Pixoo(mac="66:55:44:33:22:11").process_text("Door open", FONT_PATH, color1=[255, 0, 0]) == first
+    assert Divoom.textStripCache.stats()["hits"] == 1
+
+    with pytest.raises(AssertionError):
+        device.process_text("Door open", FONT_PATH, color1=[0, 0, 255])
+
+
+def test_cached_strips_encode_the_same_without_numpy(monkeypatch):
+    device = PixooMax(mac="11:22:33:44:55:66")
+    vectorized = device.process_text("Home Assistant", FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255])
+    Divoom.textStripCache.clear()
+    monkeypatch.setattr(divoom_module, "np", None)
+
+    assert device.process_text("Home Assistant", FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255]) == vectorized
+    assert device.process_text("Home Assistant", FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255]) == vectorized
+
+
+def sent_commands(monkeypatch, device, text, **kwargs):
+    commands = []
+    monkeypatch.setattr(device, "send_command", lambda command, args=None, skipRead=None: commands.append((command, len(args))))
+    device.show_text(text, FONT_PATH, **kwargs)
+    return commands
+
+
+def test_text_that_fits_is_sent_as_one_centered_image(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    fnt = device.load_font(FONT_PATH, 16)
+    width = device.measure_text(fnt, 16, "21")
+
+    frames, framesCount = device.process_text("21", FONT_PATH, color1=[255, 0, 0])
+
+    with Image.new("RGBA", (16, 16), (0, 0, 0, 0)) as img:
+        drw = ImageDraw.Draw(img)
+        drw.fontmode = "1"
+        drw.text((int((16 - width) / 2), 0), "21", font=fnt, fill=(255, 0, 0, 255))
+        pixels, colors = device.process_palette(device.load_pixels(img), (16, 16))
+    assert framesCount == 1
+    assert frames == [device.make_frame(device.process_frame(pixels, colors, len(colors), 1, 50, False))]
+
+    commands = sent_commands(monkeypatch, device, "21")
+    assert [command for command, _ in commands] == ["set image"]
+    assert sum(length for _, length in commands) < 100
+
+
+def test_scroll_overrides_the_fit_detection(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    scrolling = sent_commands(monkeypatch, device, "21", scroll=True)
+    assert {command for command, _ in scrolling} == {"set animation frame"}
+
+    assert device.process_text("Home Assistant", FONT_PATH)[1] > 1
+    assert device.process_text("Home Assistant", FONT_PATH, scroll=False)[1] == 1
+
+
+@pytest.mark.parametrize("color2", [[0, 0, 255], [255, 0, 0]])
+def test_monochrome_frames_match_the_generic_palette(color2):
+    """Frames starting on the text, frames without any text and one color strips."""
+    device = Pixoo(mac="11:22:33:44:55:66")
+    with Image.new("RGBA", (64, 16), tuple(color2 + [255])) as img:
+        drw = ImageDraw.Draw(img)
+        drw.fontmode = "1"
+        drw.text((0, 0), "Hi", font=device.load_font(FONT_PATH, 16), fill=(255, 0, 0, 255))
+        strip, paletteKeys = device.index_strip(device.color_keys(device.load_pixels(img), img.size), img.size)
+
+    for offset in range(0, 48, 3):
+        pixels, colors = device.process_monochrome(strip, paletteKeys, (16, 16), offset)
+        expected = device.process_keys(device.strip_keys(strip, paletteKeys, (16, 16), offset))
+        assert (list(pixels), colors) == (list(expected[0]), expected[1]), offset
+        assert device.process_pixels(pixels, colors) == device.process_pixels(expected[0], expected[1])
+
+
+def test_two_color_text_skips_the_palette(monkeypatch):
+    device = PixooMax(mac="11:22:33:44:55:66")
+    monkeypatch.setattr(divoom_module, "np", None)
+    expected = device.process_text("Home Assistant", FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255])
+    monkeypatch.undo()
+    Divoom.textStripCache.clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the frame went through process_keys")
+
+    monkeypatch.setattr(Divoom, "process_keys", fail)
+    assert device.process_text("Home Assistant", FONT_PATH, color1=[255, 0, 0], color2=[0, 0, 255]) == expected
+
+
+def test_long_text_is_split_into_segments_at_the_slowest_speed():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    _, _, img_width, text_speed, _, framesCount, _, _ = device.render_text("Home Assistant", FONT_PATH)
+    assert framesCount <= 60 < img_width - 16 and text_speed > 1
+
+    segments = list(device.stream_text_segments("Home Assistant", FONT_PATH, time=40))
+
+    assert [count for _, count, _, _ in segments] == [60, img_width - 16 - 60]
+    assert [duration for _, count, _, duration in segments] == [count * 40 for _, count, _, _ in segments]
+    for frames, count, size, _ in segments:
+        frames = list(frames)
+        assert len(frames) == count and sum(length for _, length in frames) == size
+
+
+def test_segments_are_encoded_when_they_are_taken(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    encoded = []
+    process_frame = Divoom.process_frame
+    monkeypatch.setattr(Divoom, "process_frame", lambda self, *args: encoded.append(args[3]) or process_frame(self, *args))
+
+    segments = device.stream_text_segments("Home Assistant", FONT_PATH)
+    frames, framesCount, _, _ = next(segments)
+    assert encoded == []
+
+    list(frames)
+    assert len(encoded) == framesCount
+    next(segments)
+    assert len(encoded) == framesCount
+
+
+def test_short_text_is_a_single_segment():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    expected = device.stream_text("Home", FONT_PATH)
+    assert 1 < expected[1] <= 60
+
+    segments = list(device.stream_text_segments("Home", FONT_PATH))
+
+    assert len(segments) == 1
+    assert list(segments[0][0]) == list(expected[0]) and segments[0][1:3] == expected[1:3]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+def test_segments_are_sent_just_before_the_previous_one_ends(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    clock = FakeClock()
+    monkeypatch.setattr(divoom_module, "time", clock)
+    sends = []
+
+    def send_command(command, args=None, skipRead=None):
+        clock.now += 0.01 # every chunk takes 10ms to send
+        sends.append((command, clock.now))
+
+    monkeypatch.setattr(device, "send_command", send_command)
+    device.show_text("Home Assistant", FONT_PATH, time=40, longText=True)
+
+    chunks = [[]]
+    for command, sent in sends:
+        assert command == "set animation frame"
+        if chunks[-1] and sent - chunks[-1][-1] > 0.011: chunks.append([])
+        chunks[-1].append(sent)
+    assert len(chunks) == 2
+    # the next segment starts as long before the end as the first one took to send
+    first, second = chunks
+    assert round((second[0] - 0.01) - (first[0] - 0.01), 3) == round(60 * 0.04, 3)
+    assert clock.sleeps == [round(60 * 0.04 - len(first) * 0.01, 3)]
+
+
+def test_long_text_without_the_option_stays_one_animation(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+
+    commands = sent_commands(monkeypatch, device, "Home Assistant")
+    segmented = sent_commands(monkeypatch, device, "Home Assistant", longText=True)
+
+    assert sum(length for _, length in segmented) > sum(length for _, length in commands)
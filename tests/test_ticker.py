@@ -0,0 +1,149 @@
+"""Tests of show_ticker in devices/divoom.py: the text is an update of the
+text shown before, so with a glyph atlas only the columns of the characters
+that changed are composed again, only the frames they reach are encoded
+again, and nothing is sent at all when the frames stay the same, unless
+sending them failed before."""
+from __future__ import annotations
+
+import asyncio
+import errno
+import os
+import shutil
+
+import pytest
+
+from custom_components.divoom import compile as compiler
+from custom_components.divoom.devices import divoom as divoom_module
+from custom_components.divoom.devices import glyphs as glyphs_module
+from custom_components.divoom.devices.divoom import Divoom
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.pixoomax import PixooMax
+from custom_components.divoom.devices.transport import DivoomTransport
+from tests.cases import FONT_PATH
+
+FONTS_DIR = os.path.dirname(FONT_PATH)
+READINGS = ["21.4 W", "21.5 W", "21.5 W", "121.5 W", "1.0 W", "Power 2100 W now", "Power 2101 W now", "Power 2101 W now"]
+
+
+@pytest.fixture
+def font(tmp_path, capsys):
+    shutil.copy(os.path.join(FONTS_DIR, "pixelpowerline.ttf"), tmp_path / "pixelpowerline.ttf")
+    compiler.compile_fonts(str(tmp_path), ["pixoo", "pixoomax"])
+    capsys.readouterr()
+    return str(tmp_path / "pixelpowerline.ttf")
+
+
+def sent_frames(monkeypatch, device):
+    sent = []
+    monkeypatch.setattr(device, "send_frames", lambda frames, framesCount, framesSize: sent.append(list(frames)))
+    return sent
+
+
+@pytest.mark.parametrize("device_cls", [Pixoo, PixooMax])
+@pytest.mark.parametrize("scroll", [None, True])
+def test_ticker_frames_match_show_text(monkeypatch, font, device_cls, scroll):
+    device = device_cls(mac="11:22:33:44:55:66")
+    sent = sent_frames(monkeypatch, device)
+
+    expected = []
+    for text in READINGS:
+        device.show_ticker(text, font, scroll=scroll)
+        frames = list(device.stream_text(text, font, scroll=scroll)[0])
+        if not expected or expected[-1] != frames: expected.append(frames)
+
+    assert sent == expected
+
+
+def test_ticker_without_numpy_matches(monkeypatch, font):
+    device = PixooMax(mac="11:22:33:44:55:66")
+    vectorized = sent_frames(monkeypatch, device)
+    for text in READINGS: device.show_ticker(text, font, scroll=True)
+
+    monkeypatch.setattr(divoom_module, "np", None)
+    monkeypatch.setattr(glyphs_module, "np", None)
+    Divoom.fontCache.clear()
+    Divoom.textStripCache.clear()
+    device = PixooMax(mac="11:22:33:44:55:66")
+    plain = sent_frames(monkeypatch, device)
+    for text in READINGS: device.show_ticker(text, font, scroll=True)
+
+    assert plain == vectorized
+
+
+def test_only_the_frames_of_the_changed_digit_are_encoded(monkeypatch, font):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sent_frames(monkeypatch, device)
+    device.show_ticker("Power 2100 W now", font, scroll=True)
+    framesCount = len(device.tickerState[-1])
+
+    encoded = []
+    encode_offset = Divoom.encode_offset
+    monkeypatch.setattr(Divoom, "encode_offset", lambda self, *args: encoded.append(args[2]) or encode_offset(self, *args))
+    device.show_ticker("Power 2102 W now", font, scroll=True) # the digits advance the same, the 1 does not
+
+    assert 0 < len(encoded) < framesCount / 2
+
+
+def test_unchanged_frames_are_not_sent(monkeypatch, font):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    commands = []
+    monkeypatch.setattr(device, "send_command", lambda command, args=None, skipRead=None: commands.append(command))
+
+    device.show_ticker("21", font)
+    device.show_ticker("21", font)
+    assert commands == ["set image"]
+
+    device.show_ticker("21", font, color1=[255, 0, 0])
+    assert commands == ["set image"] * 2
+
+
+def test_anything_else_sent_shows_the_ticker_again(monkeypatch, font):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    device.socket = object()
+    commands = []
+    monkeypatch.setattr(device, "send_payload", lambda payload, skipRead=None: commands.append(payload[2]))
+
+    device.show_ticker("21", font)
+    device.send_ping()
+    device.show_ticker("21", font)
+    device.send_brightness(50)
+    device.show_ticker("21", font)
+
+    device.socket = None
+    assert commands.count(Divoom.COMMANDS["set image"]) == 2
+
+
+def test_fonts_without_an_atlas_still_skip_identical_frames(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sent = sent_frames(monkeypatch, device)
+
+    for text in ["21.4 W", "21.4 W", "21.5 W"]:
+        device.show_ticker(text, FONT_PATH)
+
+    assert len(sent) == 2
+    assert sent[1] == list(device.stream_text("21.5 W", FONT_PATH)[0])
+
+
+async def test_a_ticker_that_failed_to_send_is_sent_again(font):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    device.transport = DivoomTransport(mac=device.mac)
+    failing = [True]
+    sent = []
+
+    async def send_payload(payload, skipRead=None):
+        if failing[0]:
+            await asyncio.sleep(0.05) # the recording is done and the ticker state set
+            raise OSError(errno.EPIPE, "connection lost")
+        sent.append(payload[2])
+        return len(payload)
+    device.async_send_payload = send_payload
+
+    with pytest.raises(OSError):
+        await device.async_stream(device.show_ticker, "21", font)
+    assert device.tickerState is None
+
+    failing[0] = False
+    await device.async_stream(device.show_ticker, "21", font)
+    assert sent == [device.COMMANDS["set image"]]
+    await device.async_stream(device.show_ticker, "21", font)
+    assert sent == [device.COMMANDS["set image"]] # shown now, so the same text is not sent again
@@ -0,0 +1,236 @@
+"""Tests of devices/transport.py and the async_* calls of Divoom: the device is
+reached through a non-blocking socket driven by the event loop, the payloads
+are recorded by the same code that sends them over the blocking socket, so
+the bytes on the wire stay the same, they go out while the rest is still
+recorded, and waiting for the device, pauses included, holds no thread."""
+from __future__ import annotations
+
+import asyncio
+import errno
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from custom_components.divoom.devices import transport as transport_module
+from custom_components.divoom.devices.aurabox import Aurabox
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.transport import OUTBOX_DEPTH, DivoomTransport
+from tests.cases import FONT_PATH, PIXELART_DIR
+from tests.support import make_connected_device
+
+IMAGE_PATH = os.path.join(PIXELART_DIR, "ha16.gif")
+
+
+def connect_device(device_cls):
+    """The device with a transport already connected to one end of a socket pair. Returns the device and the other end."""
+    device = device_cls(mac="11:22:33:44:55:66")
+    device.transport = DivoomTransport(mac=device.mac, logger=device.logger)
+    server_sock, client_sock = socket.socketpair()
+    client_sock.setblocking(False)
+    server_sock.setblocking(False)
+    device.transport.socket = client_sock
+    return device, server_sock
+
+
+async def read_all(server_sock, sending):
+    """Everything sent to the other end until the sending is done"""
+    loop = asyncio.get_running_loop()
+    received = bytearray()
+    while True:
+        try:
+            received += await asyncio.wait_for(loop.sock_recv(server_sock, 65536), 0.2)
+        except TimeoutError:
+            if sending.done(): return bytes(received)
+
+
+def sent_in_sync(device_cls, show):
+    device, recorder, server_sock = make_connected_device(device_cls)
+    try:
+        show(device)
+        return b"".join(recorder.sent_messages)
+    finally:
+        device.disconnect()
+        server_sock.close()
+
+
+async def test_async_show_image_sends_the_same_bytes():
+    for device_cls in (Pixoo, Aurabox): # Aurabox sends images with its own loop
+        expected = sent_in_sync(device_cls, lambda device: device.show_image(IMAGE_PATH))
+        device, server_sock = connect_device(device_cls)
+
+        sending = asyncio.ensure_future(device.async_show_image(IMAGE_PATH))
+        received = await read_all(server_sock, sending)
+
+        assert sending.result() > 0
+        assert received == expected
+        device.transport.close()
+        server_sock.close()
+
+
+def test_record_sends_nothing():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    result, outbox = device.record(device.show_light, color=[255, 0, 0])
+
+    assert device.socket is None and device.outbox is None
+    assert [device.make_message(payload) for payload, _ in outbox] == [device.make_message(device.make_command("set view", [0x01, 0xFF, 0x00, 0x00, 0x64, 0x00, 0x01, 0x00, 0x00, 0x00]))]
+    assert result == 0
+
+
+def test_pauses_are_recorded_instead_of_slept(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    monkeypatch.setattr(time, "sleep", lambda seconds: pytest.fail("slept for {0} seconds".format(seconds)))
+
+    _, keys = device.record(device.send_gamecontrol, "left")
+    _, segments = device.record(device.show_text, "Home Assistant", FONT_PATH, time=40, longText=True)
+
+    assert [option for payload, option in keys if payload is None] == [[0.1, False]]
+    assert [option for payload, option in segments if payload is None] == [[60 * 0.04, True]]
+
+
+async def test_pauses_count_from_the_sends_before_them(monkeypatch):
+    device, server_sock = connect_device(Pixoo)
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(round(seconds, 1))
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    async def send_payload(payload, skipRead=None):
+        now[0] += 0.5
+    monkeypatch.setattr(device, "async_send_payload", send_payload)
+
+    await device.async_send_recorded([[[1], True], [[2], True], [None, [2.0, True]], [[3], True], [None, [0.1, False]], [[4], True]])
+
+    assert sleeps == [1.0, 0.1]
+    server_sock.close()
+
+
+async def test_pauses_hold_no_thread():
+    """Ten devices playing long animations at once must not need ten threads"""
+    loop = asyncio.get_running_loop()
+    executor = loop.run_in_executor
+    loop.run_in_executor = lambda *args: pytest.fail("a thread was taken")
+    try:
+        devices = [connect_device(Pixoo) for _ in range(10)]
+        outbox = [[[0x04, 0x00, 0x74, 0x50], True], [None, [0.2, False]], [[0x04, 0x00, 0x74, 0x50], True]]
+        started = time.monotonic()
+        await asyncio.gather(*(device.async_send_recorded(outbox) for device, _ in devices))
+    finally:
+        loop.run_in_executor = executor
+
+    assert time.monotonic() - started < 1
+    for device, server_sock in devices:
+        assert len(server_sock.recv(1024)) == 2 * len(device.make_message([0x04, 0x00, 0x74, 0x50]))
+        device.transport.close()
+        server_sock.close()
+
+
+async def test_payloads_go_out_while_the_rest_is_still_recorded():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sent = threading.Event()
+
+    async def send_payload(payload, skipRead=None):
+        sent.set()
+        return len(payload)
+    device.async_send_payload = send_payload
+
+    def show():
+        device.send_payload([1])
+        assert sent.wait(5) # the event loop sent it, while this thread is still recording
+        device.send_payload([2, 3])
+        return True
+
+    assert await device.async_stream(show) == [True, 2]
+
+
+async def test_recording_stays_close_to_the_payloads_sent():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    recorded = [0]
+    ahead = []
+
+    async def send_payload(payload, skipRead=None):
+        ahead.append(recorded[0] - payload[0])
+        await asyncio.sleep(0.001)
+    device.async_send_payload = send_payload
+
+    def show():
+        for index in range(50):
+            recorded[0] = index
+            device.send_payload([index])
+
+    await device.async_stream(show)
+
+    assert len(ahead) == 50
+    assert max(ahead) <= OUTBOX_DEPTH + 1 # the queued ones and the one waiting to be queued
+
+
+async def test_a_failed_send_stops_the_recording():
+    device = Pixoo(mac="11:22:33:44:55:66")
+    recorded = []
+
+    async def send_payload(payload, skipRead=None):
+        raise OSError(errno.EPIPE, "connection lost")
+    device.async_send_payload = send_payload
+
+    def show():
+        for index in range(50):
+            device.send_payload([index])
+            recorded.append(index)
+
+    with pytest.raises(OSError):
+        await device.async_stream(show)
+
+    assert len(recorded) <= OUTBOX_DEPTH + 1 # and it is not running anymore
+    assert device.tickerState is None
+
+
+async def test_bridge_handshake(monkeypatch, socket_enabled):
+    received = asyncio.Queue()
+
+    async def accept(reader, writer):
+        while data := await reader.read(1024):
+            await received.put(data)
+        writer.close()
+
+    server = await asyncio.start_server(accept, "127.0.0.1", 0)
+    monkeypatch.setattr(transport_module, "BRIDGE_PORT", server.sockets[0].getsockname()[1])
+    transport = DivoomTransport(host="127.0.0.1", mac="11:22:33:44:55:66", port=1)
+    try:
+        await transport.async_connect()
+        assert transport.connected and transport.socket_errno == 0
+        assert await received.get() == bytes([0x69, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x01])
+
+        await transport.async_disconnect()
+        assert not transport.connected
+        assert await received.get() == bytes([0x96, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66])
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_refused_connection_sets_the_errno(monkeypatch, socket_enabled):
+    unused = socket.socket()
+    unused.bind(("127.0.0.1", 0))
+    monkeypatch.setattr(transport_module, "BRIDGE_PORT", unused.getsockname()[1])
+    transport = DivoomTransport(host="127.0.0.1", mac="11:22:33:44:55:66")
+
+    await transport.async_connect() # nothing listens on the port
+    unused.close()
+
+    assert not transport.connected
+    assert transport.socket_errno == errno.ECONNREFUSED
+
+
+async def test_receive_gives_up_after_the_timeout():
+    device, server_sock = connect_device(Pixoo)
+
+    assert await device.transport.async_receive(timeout=0.05) == b""
+    server_sock.send(b"\x01\x02")
+    assert await device.transport.async_receive(timeout=0.05) == b"\x01\x02"
+    device.transport.close()
+    server_sock.close()
@@ -0,0 +1,135 @@
+"""Tests of the widgets in devices/widgets.py and show_widget: numbers, bars,
+ring gauges and sparklines are drawn straight into palette indexes and
+encoded as one frame without PIL, the same with and without NumPy, and a
+value shown before is taken from the widget cache instead of drawn again."""
+from __future__ import annotations
+
+import pytest
+from PIL import Image
+
+from custom_components.divoom.devices import divoom as divoom_module
+from custom_components.divoom.devices import widgets as widgets_module
+from custom_components.divoom.devices.aurabox import Aurabox
+from custom_components.divoom.devices.divoom import Divoom
+from custom_components.divoom.devices.pixoo import Pixoo
+from custom_components.divoom.devices.pixoomax import PixooMax
+from custom_components.divoom.devices.timeboxmini import TimeboxMini
+from custom_components.divoom.devices.widgets import BACKGROUND, FOREGROUND, TRACK, render_widget, widget_value
+
+WIDGETS = [
+    ("number", 87), ("number", "21°C"), ("number", "12:30"), ("bar", 42), ("bar", 42, True),
+    ("gauge", 87), ("gauge", 100), ("sparkline", "1,5,3,8,2,9,4"), ("sparkline", [3, 3, 3]),
+]
+
+
+def encode_all(device):
+    return [
+        list(device.stream_widget(case[0], case[1], vertical=case[2] if len(case) > 2 else None, color1=[0, 255, 0])[0])
+        for case in WIDGETS
+    ]
+
+
+def render(widget, value, size=16, **kwargs):
+    canvas = render_widget(widget, widget_value(widget, value), size, **kwargs)
+    return [[int(index) for index in row] for row in canvas]
+
+
+@pytest.mark.parametrize("device_cls", [Pixoo, PixooMax, Aurabox, TimeboxMini])
+def test_widgets_encode_the_same_without_numpy(monkeypatch, device_cls):
+    device = device_cls(mac="11:22:33:44:55:66")
+    vectorized = encode_all(device)
+    Divoom.widgetCache.clear()
+    monkeypatch.setattr(divoom_module, "np", None)
+    monkeypatch.setattr(widgets_module, "np", None)
+
+    assert encode_all(device) == vectorized
+
+
+def test_widgets_do_not_touch_pil(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("the widget went through PIL")
+    monkeypatch.setattr(Image, "new", fail)
+    monkeypatch.setattr(Image, "open", fail)
+
+    encode_all(Pixoo(mac="11:22:33:44:55:66"))
+
+
+def test_a_widget_is_a_single_image(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    sent = []
+    monkeypatch.setattr(device, "send_command", lambda command, args=None, skipRead=None: sent.append(command))
+
+    device.show_widget("gauge", 87)
+
+    assert sent == ["set image"]
+
+
+def test_widgets_shown_before_come_from_the_cache(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    first = list(device.stream_widget("gauge", 87, color1=[255, 0, 0])[0])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the widget was drawn again")
+    monkeypatch.setattr(divoom_module, "render_widget", fail)
+
+    assert list(Pixoo(mac="66:55:44:33:22:11").stream_widget("gauge", "87", color1=[255, 0, 0])[0]) == first
+    assert Divoom.widgetCache.stats()["hits"] == 1
+
+
+def test_unknown_widgets_and_values_send_nothing(monkeypatch):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    monkeypatch.setattr(device, "send_command", lambda *args, **kwargs: pytest.fail("nothing should be sent"))
+
+    assert device.show_widget("clock", 87) is None
+    assert device.show_widget("gauge", "full") is None
+    assert device.show_widget("sparkline", "1,two,3") is None
+
+
+@pytest.mark.parametrize("widget", ["number", "bar", "gauge", "sparkline"])
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "1e400"])
+def test_values_that_are_not_finite_send_nothing(monkeypatch, caplog, widget, value):
+    device = Pixoo(mac="11:22:33:44:55:66")
+    monkeypatch.setattr(device, "send_command", lambda *args, **kwargs: pytest.fail("nothing should be sent"))
+
+    assert device.show_widget(widget, value if widget != "sparkline" else "1,{0},3".format(value)) is None
+    assert "does not fit" in caplog.text
+
+
+def test_gauge_fills_clockwise_from_the_top():
+    canvas = render("gauge", 25)
+
+    assert canvas[0][8] == FOREGROUND # just right of the top
+    assert canvas[7][15] == FOREGROUND # almost a quarter turn further
+    assert canvas[8][15] == TRACK # just beyond it
+    assert canvas[15][7] == TRACK # the bottom is not reached
+    assert canvas[0][7] == TRACK # just left of the top is the very end
+    assert canvas[7][7] == BACKGROUND
+
+
+def test_bars_fill_from_the_left_or_the_bottom():
+    horizontal = render("bar", 50)
+    vertical = render("bar", 50, vertical=True)
+
+    assert [horizontal[8][x] for x in range(16)] == [BACKGROUND] + [FOREGROUND] * 7 + [TRACK] * 7 + [BACKGROUND]
+    assert [vertical[y][8] for y in range(16)] == [BACKGROUND] + [TRACK] * 7 + [FOREGROUND] * 7 + [BACKGROUND]
+    assert render("bar", 150)[8][14] == FOREGROUND
+    assert render("bar", 5, minimum=0, maximum=10)[8][7] == FOREGROUND
+
+
+def test_numbers_take_the_largest_scale_that_fits():
+    single = render("number", 7)
+    wide = render("number", 12.5)
+    clipped = render("number", "-12.5%")
+
+    assert sum(row.count(FOREGROUND) for row in single) == 7 * 9 # the 7 has 7 pixels, each of them 3x3
+    assert sum(row.count(FOREGROUND) for row in wide) == 8 + 11 + 1 + 11 # unscaled
+    assert sum(row.count(FOREGROUND) for row in clipped) == 8 + 11 + 1 + 11 + 3 # without the - and all but a column of the %
+
+
+def test_sparkline_keeps_the_latest_values_on_the_right():
+    canvas = render("sparkline", list(range(40)))
+
+    assert canvas[1][14] == FOREGROUND # the highest value in the last column
+    assert canvas[14][1] == FOREGROUND # the lowest one that fits in the first
+    assert canvas[14][14] == TRACK
+    assert all(canvas[y][x] != FOREGROUND for y in range(1, 14) for x in range(1, 14) if y + x < 14)